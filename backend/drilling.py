@@ -0,0 +1,236 @@
+import re
+import numpy as np
+from settings import pcb_config, drill_config
+
+# Direct Excellon -> G-code drilling: the drill file is parsed once into per-tool
+# hole arrays (mm, mirrored like pcb2gcode's mirror-absolute), holes are ordered
+# per tool and the leveled per-tool programs are formatted in bulk. No pcb2gcode
+# subprocess, no splitting of a combined program afterwards.
+
+_TOOL_DEF_RE = re.compile(r"^T0*(\d+)[^C]*C\s*([\d.]+)", re.IGNORECASE)
+_TOOL_SEL_RE = re.compile(r"^T0*(\d+)\s*$", re.IGNORECASE)
+_COORD_RE = re.compile(r"([XY])([+-]?[\d.]+)")
+_UNITS_RE = re.compile(r"^(METRIC|INCH)\s*(?:,\s*(LZ|TZ))?(?:,\s*(0+)\.(0+))?", re.IGNORECASE)
+
+class ExcellonFile:
+    """
+    Parsed drill file: tools {number: diameter_mm} and holes {number: (n, 2) array in mm}.
+    slots counts G85 slots, which are not drilled.
+    """
+    def __init__(self, tools, holes, slots=0):
+        self.tools = tools
+        self.holes = holes
+        self.slots = slots
+
+    @classmethod
+    def parse(cls, path):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            lines = f.read().splitlines()
+
+        scale = 1.0           # file units -> mm
+        zeros = "LZ"          # Zero suppression for coordinates without decimal point
+        digits = (3, 3)
+        tools = {}
+        coords = {}
+        current = None
+        x = y = 0.0
+        slots = 0
+        in_header = False
+
+        def number(text):
+            if "." in text:
+                return float(text) * scale
+            sign = -1.0 if text.startswith("-") else 1.0
+            text = text.lstrip("+-")
+            width = digits[0] + digits[1]
+            # LZ: leading zeros kept (trailing ones omitted), TZ: the other way round
+            text = text.ljust(width, "0") if zeros == "LZ" else text.rjust(width, "0")
+            return sign * float(text[:-digits[1]] + "." + text[-digits[1]:]) * scale
+
+        for raw in lines:
+            line = raw.split(";")[0].strip()
+            if not line:
+                continue
+            upper = line.upper()
+            if upper == "M48":
+                in_header = True
+                continue
+            if upper in ("%", "M95"):
+                in_header = False
+                continue
+            m = _UNITS_RE.match(upper)
+            if m:
+                scale = 25.4 if m.group(1) == "INCH" else 1.0
+                zeros = m.group(2) or zeros
+                if m.group(3):
+                    digits = (len(m.group(3)), len(m.group(4)))
+                elif m.group(1) == "INCH":
+                    digits = (2, 4)
+                continue
+            if upper in ("M71", "M72"):
+                scale = 25.4 if upper == "M72" else 1.0
+                continue
+            m = _TOOL_DEF_RE.match(upper)
+            if m and (in_header or "C" in upper):
+                tools[int(m.group(1))] = float(m.group(2)) * scale
+                if not in_header:
+                    current = int(m.group(1))
+                continue
+            m = _TOOL_SEL_RE.match(upper)
+            if m:
+                current = int(m.group(1))
+                continue
+            if in_header or current is None or current == 0:
+                continue
+            if "G85" in upper:
+                slots += 1
+                continue
+            if upper.startswith(("G00", "G01", "M15", "M16", "M17")):
+                # Routing mode is not drilled
+                continue
+            found = _COORD_RE.findall(upper)
+            if not found:
+                continue
+            for axis, value in found:
+                if axis == "X":
+                    x = number(value)
+                else:
+                    y = number(value)
+            coords.setdefault(current, []).append((x, y))
+
+        holes = {t: np.array(c, dtype=float) for t, c in coords.items() if c}
+        return cls(tools, holes, slots)
+
+def drill_params(pcb_cfg=None, drill_cfg=None):
+    """Depth, feeds and heights from pcb2gcode.conf, peck settings from drilling.conf."""
+    pcb_cfg = pcb_cfg or pcb_config()
+    drill_cfg = drill_cfg or drill_config()
+    return {
+        "z_drill": pcb_cfg.get_length("zdrill", -1.8),
+        "z_safe": pcb_cfg.get_length("zsafe", 2.0),
+        "z_change": pcb_cfg.get_length("zchange", 20.0),
+        "feed": pcb_cfg.get_feed("drill-feed", 300.0),
+        "spindle": pcb_cfg.get_rpm("drill-speed", 24000),
+        "mirror": pcb_cfg.get_bool("mirror-absolute"),
+        "peck_depth": drill_cfg.get_length("peck-depth", 0.0),
+        "peck_clearance": drill_cfg.get_length("peck-clearance", 0.2),
+        "spinup": drill_cfg.get_float("spinup-time", 1.0),
+    }
+
+def order_holes(holes, start=(0.0, 0.0)):
+    """Nearest-neighbour drilling order, starting at start. Returns the index order."""
+    n = len(holes)
+    if n <= 2:
+        return np.arange(n)
+    remaining = np.ones(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    pos = np.asarray(start, dtype=float)
+    for k in range(n):
+        d = np.hypot(holes[:, 0] - pos[0], holes[:, 1] - pos[1])
+        d[~remaining] = np.inf
+        i = int(np.argmin(d))
+        order[k] = i
+        remaining[i] = False
+        pos = holes[i]
+    return order
+
+def _peck_levels(params):
+    """Depth of every peck (relative to the surface), the last one is z_drill."""
+    z = params["z_drill"]
+    peck = params["peck_depth"]
+    if peck <= 0 or -z <= peck:
+        return [z]
+    levels = list(-peck * np.arange(1, int(np.ceil(-z / peck))))
+    return levels + [z]
+
+def hole_block(holes, z_offsets, params):
+    """
+    G-code for drilling holes (n, 2) in the given order, one format operation for all.
+    z_offsets (n,) are the leveling offsets per hole (zeros = unleveled).
+    """
+    if not len(holes):
+        return ""
+    levels = _peck_levels(params)
+    fmt = ["G0 X%.4f Y%.4f", "G0 Z%.4f"]
+    columns = [holes[:, 0], holes[:, 1], params["z_safe"] + z_offsets]
+    for k, level in enumerate(levels):
+        if k > 0:
+            # Rapid back down to just above the previous peck
+            fmt.append("G0 Z%.4f")
+            columns.append(levels[k - 1] + params["peck_clearance"] + z_offsets)
+        fmt.append("G1 Z%.4f")
+        columns.append(level + z_offsets)
+        fmt.append("G0 Z%.4f")
+        columns.append(params["z_safe"] + z_offsets)
+    block = "\n".join(fmt)
+    values = np.column_stack(columns).ravel()
+    return "\n".join([block] * len(holes)) % tuple(values)
+
+def tool_program(tool, diameter, holes, z_offsets, params, header_lines=(), tool_change=True):
+    """Complete program for one tool: header, tool change prompt, spindle, holes, end."""
+    out = list(header_lines)
+    label = f"{diameter:g}mm" if diameter else "?"
+    out += [f"( pcb-bridge drilling: T{tool} | {label}, {len(holes)} holes )", "G94", "G21", "G90"]
+    if tool_change:
+        out += [f"G0 Z{params['z_change']:.4f}", f"(MSG, Change Tool to T{tool} ({label}))"]
+    out += [f"S{params['spindle']} M3", f"G04 P{params['spinup']:.3f}", f"G1 F{params['feed']:.4f}"]
+    block = hole_block(holes, z_offsets, params)
+    if block:
+        out.append(block)
+    out += [f"G0 Z{params['z_change']:.4f}", "M5", "M2"]
+    return "\n".join(out) + "\n"
+
+def drill_jobs(excellon, params, offset_x=0.0, offset_y=0.0, heightmap=None):
+    """
+    Per-tool leveled drilling programs. Returns {tool key ("T1"): {"gcode", "diameter",
+    "holes", "dims"}} in tool order; each tool starts where the previous one ended.
+    """
+    jobs = {}
+    pos = np.zeros(2)
+    header = ["; Processed by pcb-bridge (Direct drilling + Leveling)",
+              f"; zdrill={params['z_drill']:g}mm zsafe={params['z_safe']:g}mm drill-feed={params['feed']:g}mm/min"
+              + (f" peck-depth={params['peck_depth']:g}mm" if params["peck_depth"] > 0 else "")]
+    for tool in sorted(excellon.holes):
+        holes = excellon.holes[tool].copy()
+        if params["mirror"]:
+            holes[:, 0] = -holes[:, 0]
+        holes += (offset_x, offset_y)
+        holes = holes[order_holes(holes, pos)]
+        pos = holes[-1]
+        if heightmap is not None:
+            z_offsets = np.asarray(heightmap.z_offsets(holes[:, 0], holes[:, 1]), dtype=float)
+        else:
+            z_offsets = np.zeros(len(holes))
+        diameter = excellon.tools.get(tool)
+        z_all = np.concatenate([params["z_drill"] + z_offsets, params["z_safe"] + z_offsets])
+        (min_x, min_y), (max_x, max_y) = holes.min(axis=0), holes.max(axis=0)
+        jobs[f"T{tool}"] = {
+            "gcode": tool_program(tool, diameter, holes, z_offsets, params, header),
+            "diameter": diameter,
+            "holes": int(len(holes)),
+            "dims": {"min_x": float(min_x), "max_x": float(max_x), "min_y": float(min_y), "max_y": float(max_y),
+                     "width": float(max_x - min_x), "height": float(max_y - min_y),
+                     "min_z": float(z_all.min()), "max_z": float(z_all.max())},
+        }
+    return jobs
+
+def raw_drill_program(excellon, params):
+    """
+    Unleveled combined program with T-lines (pcb2gcode layout), for the panel
+    path where the raw toolpaths are replicated and leveled afterwards.
+    """
+    out = ["( pcb-bridge drilling )", "G94", "G21", "G90"]
+    pos = np.zeros(2)
+    for tool in sorted(excellon.holes):
+        holes = excellon.holes[tool].copy()
+        if params["mirror"]:
+            holes[:, 0] = -holes[:, 0]
+        holes = holes[order_holes(holes, pos)]
+        pos = holes[-1]
+        diameter = excellon.tools.get(tool)
+        out += [f"G0 Z{params['z_change']:.4f}", f"T{tool}",
+                f"(MSG, Change tool bit to drill size {diameter:g}mm)" if diameter else f"(MSG, Change Tool to T{tool})",
+                f"S{params['spindle']} M3", f"G04 P{params['spinup']:.3f}", f"G1 F{params['feed']:.4f}",
+                hole_block(holes, np.zeros(len(holes)), params)]
+    out += [f"G0 Z{params['z_change']:.4f}", "M5", "M2"]
+    return "\n".join(out) + "\n"
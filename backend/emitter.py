@@ -0,0 +1,176 @@
+import re
+import numpy as np
+from settings import machine_config
+
+# Bulk G-code emitter: moves are collected as columns (mode, X, Y, Z, F, extra words)
+# and formatted in one % operation. Repeated modal words (G0/G1, F) and axes that do
+# not change at the output precision are left out. Tool changes, program ends and
+# position-, distance- or unit-changing codes reset the modal memory, so split files
+# stay self-contained. In incremental mode (G91) every axis word is a move of its own
+# and nothing is left out.
+
+WRITE_BUFFER = 1024 * 1024
+# Words after which nothing may be assumed about the modal state
+_RESET_RE = re.compile(r"(?<![A-Z])(T\d+|M0?2|M30|M0?6|G28|G30|G53|G2[01]|G9[0-2](?:\.\d)?)(?![\d.])")
+# Other motion modes: the next G0/G1 has to be written again
+_MOTION_RE = re.compile(r"(?<![A-Z])G0?[2-3](?![\d.])|(?<![A-Z])G(?:38\.\d|8[0-9])(?![\d])")
+# Distance mode: G90 absolute, G91 incremental (G90.1/G91.1 only concern arc centers)
+_DISTANCE_RE = re.compile(r"(?<![A-Z])G9([01])(?![\d.])")
+_COMMENT_RE = re.compile(r"\([^)]*\)|;.*")
+
+def default_precision():
+    """Decimals for coordinates (config/machine.conf: gcode-decimals)."""
+    return int(machine_config().get_float("gcode-decimals", 4))
+
+class MoveBuffer:
+    """
+    Collects output lines: verbatim text lines (comments etc.) and moves.
+    For moves, absent words are NaN / empty.
+    """
+    def __init__(self):
+        self.text = []   # verbatim line or None for a move
+        self.mode = []   # 0 (G0), 1 (G1) or NaN
+        self.x = []
+        self.y = []
+        self.z = []
+        self.f = []
+        self.extra = []  # other words of the line (S, M, G21, ...), as written
+        self.comment = [] # trailing ";" comment, written after all words
+
+    def __len__(self):
+        return len(self.text)
+
+    def add_text(self, line):
+        self.text.append(line)
+        self.mode.append(np.nan)
+        self.x.append(np.nan)
+        self.y.append(np.nan)
+        self.z.append(np.nan)
+        self.f.append(np.nan)
+        self.extra.append("")
+        self.comment.append("")
+
+    def add_move(self, mode=np.nan, x=np.nan, y=np.nan, z=np.nan, f=np.nan, extra="", comment=""):
+        self.text.append(None)
+        self.mode.append(mode)
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.f.append(f)
+        self.extra.append(extra)
+        self.comment.append(comment)
+
+    def add_moves(self, mode, x, y, z, f=None, extra=None):
+        """Appends many moves at once (arrays of equal length; extra only on the first one)."""
+        n = len(x)
+        if not n:
+            return
+        self.text.extend([None] * n)
+        self.mode.extend(np.broadcast_to(mode, n).tolist())
+        self.x.extend(np.asarray(x, dtype=float).tolist())
+        self.y.extend(np.asarray(y, dtype=float).tolist())
+        self.z.extend(np.broadcast_to(np.asarray(z, dtype=float), n).tolist())
+        self.f.extend(np.broadcast_to(np.nan if f is None else f, n).tolist())
+        self.extra.extend([extra or ""] + [""] * (n - 1))
+        self.comment.extend([""] * n)
+
+def _prev_filled(a, reset):
+    """Value of the last non-NaN entry before each index (NaN after a reset line)."""
+    a = a.copy()
+    a[reset] = np.inf # sentinel: compares unequal to everything
+    valid = ~np.isnan(a)
+    idx = np.where(valid, np.arange(len(a)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    prev = np.full(len(a), np.nan)
+    prev[1:] = np.where(idx[:-1] >= 0, a[np.maximum(idx[:-1], 0)], np.nan)
+    return prev
+
+def _incremental(words):
+    """Per line: True while G91 is active (set on the line itself or an earlier one)."""
+    mode = np.full(len(words), np.nan)
+    for i, w in enumerate(words):
+        found = _DISTANCE_RE.findall(w) if w else None
+        if found:
+            mode[i] = float(found[-1])
+    idx = np.where(np.isnan(mode), -1, np.arange(len(mode)))
+    np.maximum.accumulate(idx, out=idx)
+    return (idx >= 0) & (mode[np.maximum(idx, 0)] == 1.0)
+
+def _formatted_length(v, precision):
+    """Length of the "%.<precision>f" representation of v (vectorized)."""
+    a = np.abs(v)
+    digits = np.maximum(1, np.floor(np.log10(np.maximum(a, 1.0))) + 1)
+    return digits + (v < -0.5 * 10.0 ** -precision) + (precision + 1 if precision > 0 else 0)
+
+def render(buffer, precision=None):
+    """
+    Formats the buffer into G-code text. Returns (text, stats) with stats:
+    lines, bytes, suppressed_words and bytes_saved (compared to writing every word).
+    """
+    precision = default_precision() if precision is None else precision
+    n = len(buffer)
+    if not n:
+        return "", {"lines": 0, "bytes": 0, "suppressed_words": 0, "bytes_saved": 0}
+    # Modal words of every line: the extra words of moves, verbatim lines without comments
+    extra = [_COMMENT_RE.sub("", t if t is not None else e or "").upper() for t, e in zip(buffer.text, buffer.extra)]
+    reset = np.array([bool(e) and _RESET_RE.search(e) is not None for e in extra], dtype=bool)
+    motion = np.array([bool(e) and _MOTION_RE.search(e) is not None for e in extra], dtype=bool)
+
+    scale = 10.0 ** precision
+    cols = np.column_stack([buffer.x, buffer.y, buffer.z, buffer.f]).astype(float)
+    present = ~np.isnan(cols)
+    # Compare at output precision, F exactly
+    q = cols.copy()
+    q[:, :3] = np.round(q[:, :3] * scale)
+    emit = present.copy()
+    for k in range(4):
+        emit[:, k] &= q[:, k] != _prev_filled(q[:, k], reset)
+    # Lines with a reset word (G28 X0 ...) keep all their words, and so do arcs and
+    # cycles: G2/G3 without an axis word is rejected by the controller (GRBL error 26)
+    emit |= present & (reset | motion)[:, None]
+    # After G91 an unchanged X1 is another move of 1: keep all axis words
+    emit[:, :3] |= present[:, :3] & _incremental(extra)[:, None]
+
+    mode = np.array(buffer.mode, dtype=float)
+    emit_mode = ~np.isnan(mode) & ((mode != _prev_filled(mode, reset | motion)) | reset)
+
+    # Per-line format strings from the column tokens, verbatim text lines escaped
+    g_words = np.where(emit_mode, np.where(mode == 0, "G0", "G1"), "").tolist()
+    axis_words = [np.where(emit[:, k], f" {word}%.{precision}f", "").tolist() for k, word in enumerate("XYZ")]
+    f_words = np.where(emit[:, 3], " F%g", "").tolist()
+    lines = []
+    for text, g, e, x, y, z, f, c in zip(buffer.text, g_words, buffer.extra, *axis_words, f_words, buffer.comment):
+        if text is not None:
+            lines.append(text.replace("%", "%%"))
+            continue
+        line = (g + (" " + e.replace("%", "%%") if e else "") + x + y + z + f).lstrip()
+        if c:
+            line = (line + " " + c.replace("%", "%%")).lstrip()
+        # Moves that change nothing (and carry no other words) disappear
+        if line:
+            lines.append(line)
+    text = "\n".join(lines) % tuple(cols[emit].tolist())
+
+    # Size of the suppressed words: letter + space + number (+ G word)
+    suppressed = present & ~emit
+    saved = float(sum((_formatted_length(cols[suppressed[:, k], k], precision) + 2).sum() for k in range(3)))
+    saved += float(sum(len("F%g" % v) + 1 for v in cols[suppressed[:, 3], 3]))
+    mode_suppressed = ~np.isnan(mode) & ~emit_mode
+    saved += 3.0 * int(mode_suppressed.sum())
+    stats = {
+        "lines": len(lines),
+        "bytes": len(text),
+        "suppressed_words": int(suppressed.sum() + mode_suppressed.sum()),
+        "bytes_saved": int(saved),
+    }
+    return text, stats
+
+def write_text(path, text):
+    """Writes G-code with a large buffer (one system call per MiB instead of per line)."""
+    with open(path, "w", buffering=WRITE_BUFFER) as f:
+        f.write(text)
+
+def reduction(stats):
+    """Size reduction in percent for a render() stats dict."""
+    total = stats["bytes"] + stats["bytes_saved"]
+    return round(100.0 * stats["bytes_saved"] / total, 1) if total else 0.0
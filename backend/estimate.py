@@ -0,0 +1,156 @@
+import re
+import numpy as np
+from settings import machine_config
+
+# Cycle-time estimate for (leveled) G-code: word values come from one regex pass,
+# word letters and line numbers from the raw bytes, everything else (modal state,
+# lengths, junctions, times) is done on arrays.
+
+_COMMENT_RE = re.compile(r"\([^)\n]*\)|;[^\n]*")
+_VALUE_RE = re.compile(r"[GXYZFP]\s*(-?\d*\.?\d+)")
+_WORD_RE = re.compile(r"([GXYZFP])\s*(-?\d*\.?\d+)")
+_LETTERS = np.frombuffer(b"GXYZFP", dtype=np.uint8)
+
+def machine_limits():
+    """Rapid rates [mm/min], acceleration [mm/s^2] and fallback feed from config/machine.conf."""
+    cfg = machine_config()
+    return {
+        "rapid_xy": cfg.get_feed("rapid-feed-xy", 3000.0),
+        "rapid_z": cfg.get_feed("rapid-feed-z", 1000.0),
+        "acceleration": cfg.get_float("acceleration", 200.0, "mm/s^2"),
+        "default_feed": cfg.get_feed("default-feed", 300.0),
+    }
+
+def _ffill(a, initial):
+    """Forward-fills NaNs (modal values); leading NaNs get initial."""
+    valid = ~np.isnan(a)
+    idx = np.where(valid, np.arange(len(a)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    out = a[idx]
+    out[:np.argmax(valid) if valid.any() else len(a)] = initial
+    return out
+
+def parse_moves(text, default_feed=300.0):
+    """
+    Parses G-code into per-move arrays (one entry per line with X/Y/Z):
+    line (0-based line number), mode (0 rapid, 1-3 feed), x, y, z (modal, absolute)
+    and f [mm/min]. Also returns the total dwell time (G4 P) in seconds.
+    """
+    clean = _COMMENT_RE.sub("", text)
+    n_lines = text.count("\n") + 1
+    raw = np.frombuffer(clean.encode("ascii", "replace"), dtype=np.uint8)
+    # Word positions -> line numbers via the newline positions
+    pos = np.flatnonzero(np.isin(raw, _LETTERS))
+    values = np.array(_VALUE_RE.findall(clean), dtype=float)
+    if len(pos) == len(values):
+        letters = raw[pos].view("S1")
+        line = np.searchsorted(np.flatnonzero(raw == 10), pos)
+    else:
+        # A letter without number somewhere: slower, exact tokenization
+        matches = list(_WORD_RE.finditer(clean))
+        letters = np.array([m.group(1).encode() for m in matches], dtype="S1")
+        values = np.array([m.group(2) for m in matches], dtype=float)
+        line = np.searchsorted(np.flatnonzero(raw == 10), [m.start() for m in matches])
+    if not len(values):
+        empty = np.empty(0)
+        return {"line": empty.astype(int), "mode": empty, "x": empty, "y": empty, "z": empty, "f": empty}, 0.0
+
+    def per_line(mask):
+        a = np.full(n_lines, np.nan)
+        a[line[mask]] = values[mask]
+        return a
+
+    is_g = letters == b"G"
+    mode = per_line(is_g & (values <= 3))
+    dwell_lines = np.zeros(n_lines, dtype=bool)
+    dwell_lines[line[is_g & (values == 4)]] = True
+    p = per_line(letters == b"P")
+    dwell = float(np.nansum(p[dwell_lines]))
+
+    x, y, z = per_line(letters == b"X"), per_line(letters == b"Y"), per_line(letters == b"Z")
+    motion = ~(np.isnan(x) & np.isnan(y) & np.isnan(z))
+
+    def start(a):
+        valid = a[~np.isnan(a)]
+        return valid[0] if len(valid) else 0.0
+
+    moves = {
+        "line": np.flatnonzero(motion),
+        "mode": _ffill(mode, 0.0)[motion],
+        "x": _ffill(x, start(x))[motion],
+        "y": _ffill(y, start(y))[motion],
+        "z": _ffill(z, start(z))[motion],
+        "f": _ffill(per_line(letters == b"F"), default_feed)[motion],
+    }
+    return moves, dwell
+
+def move_times(dx, dy, dz, speed, acceleration, stops_in, stops_out):
+    """
+    Time per move [s] with a trapezoidal profile. speed in mm/s; stops_in/out in 0..1
+    is how far the move has to slow down at its start/end (0 = straight on, 1 = full stop).
+    """
+    length = np.sqrt(dx * dx + dy * dy + dz * dz)
+    cf = 0.5 * (stops_in + stops_out)
+    # Short moves cannot reach the programmed speed before they have to brake again
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = np.where(cf > 0, np.minimum(speed, np.sqrt(acceleration * length / np.maximum(cf, 1e-12))), speed)
+        t = np.where(length > 0, length / v + cf * v / acceleration, 0.0)
+    return np.nan_to_num(t)
+
+def estimate_moves(moves, dwell=0.0, limits=None):
+    """Cut/rapid length, plunge count and estimated time for parsed moves."""
+    limits = limits or machine_limits()
+    n = len(moves["x"])
+    if n == 0:
+        return {"cut_length": 0.0, "rapid_length": 0.0, "plunges": 0, "moves": 0,
+                "cut_seconds": 0.0, "rapid_seconds": 0.0, "dwell_seconds": round(dwell, 1), "seconds": round(dwell, 1)}
+    x, y, z = moves["x"], moves["y"], moves["z"]
+    dx = np.diff(x, prepend=x[0])
+    dy = np.diff(y, prepend=y[0])
+    dz = np.diff(z, prepend=z[0])
+    xy = np.hypot(dx, dy)
+    length = np.sqrt(xy * xy + dz * dz)
+    rapid = moves["mode"] == 0
+    plunge = ~rapid & (dz < -1e-6) & (xy < 1e-6)
+
+    # Speed per move [mm/s]: feed for cuts, rapid rate for G0 (Z limited by its own rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_limit = np.where(np.abs(dz) > 1e-9, limits["rapid_z"] * length / np.abs(dz), np.inf)
+    speed = np.where(rapid, np.minimum(limits["rapid_xy"], z_limit), moves["f"]) / 60.0
+    speed = np.maximum(speed, 1e-3)
+
+    # Junction slowdown from the angle between consecutive moves (mode changes stop fully)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = np.column_stack([dx, dy, dz]) / length[:, None]
+    u = np.nan_to_num(u)
+    cos = np.einsum("ij,ij->i", u[1:], u[:-1])
+    stops = np.clip((1.0 - cos) / 2.0, 0.0, 1.0)
+    stops[(rapid[1:] != rapid[:-1]) | (length[1:] == 0) | (length[:-1] == 0)] = 1.0
+    stops_in = np.concatenate([[1.0], stops])
+    stops_out = np.concatenate([stops, [1.0]])
+
+    t = move_times(dx, dy, dz, speed, limits["acceleration"], stops_in, stops_out)
+    cut_seconds = float(t[~rapid].sum())
+    rapid_seconds = float(t[rapid].sum())
+    return {
+        "cut_length": round(float(length[~rapid].sum()), 1),
+        "rapid_length": round(float(length[rapid].sum()), 1),
+        "plunges": int(plunge.sum()),
+        "moves": int(n),
+        "cut_seconds": round(cut_seconds, 1),
+        "rapid_seconds": round(rapid_seconds, 1),
+        "dwell_seconds": round(dwell, 1),
+        "seconds": round(cut_seconds + rapid_seconds + dwell, 1),
+    }
+
+def estimate_gcode(text, limits=None):
+    """Estimate for a G-code string (see estimate_moves)."""
+    limits = limits or machine_limits()
+    moves, dwell = parse_moves(text, limits["default_feed"])
+    return estimate_moves(moves, dwell, limits)
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
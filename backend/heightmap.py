@@ -0,0 +1,268 @@
+import os
+import json
+import shutil
+import threading
+import numpy as np
+
+# Binary heightmap artifact (compiled from probe_result.json at save time):
+#   data/heightmap/meta.json            -> version, source file stamp, grid spec, current key
+#   data/heightmap/<key>/points.npy     -> probe points (n, 2)
+#   data/heightmap/<key>/values.npy     -> probe Z values (n,)
+#   data/heightmap/<key>/simplices.npy  -> Delaunay triangles (m, 3)
+#   data/heightmap/<key>/grid.npy       -> dense resampled Z grid (ny, nx), only for regular probe grids
+# All arrays are opened memory-mapped, so parallel workers share one copy via the OS page cache.
+# Bilinear interpolation on the resampled grid only matches the triangulation when the
+# probe points form a regular lattice (grid nodes then fall on the probe points and the
+# hull is the bounding box). Irregular point sets (e.g. from /probe/plan) are leveled
+# with the exact Delaunay interpolator instead, 0 outside the hull.
+FORMAT_VERSION = 2
+GRID_RESOLUTION = 0.25 # mm
+MAX_GRID_CELLS = 4_000_000
+
+class Heightmap:
+    """Probe points with a prebuilt linear interpolator (Delaunay triangulation is done once)."""
+    def __init__(self, points, values, mtime=None, tri=None):
+        from scipy.interpolate import LinearNDInterpolator
+        self.points = points
+        self.values = values
+        self.mtime = mtime
+        # An existing (e.g. incrementally built) Delaunay triangulation can be passed in
+        self.interpolator = LinearNDInterpolator(tri if tri is not None else points, values, fill_value=0.0)
+
+    @property
+    def simplices(self):
+        return self.interpolator.tri.simplices
+
+    def z_offsets(self, xs, ys):
+        return np.asarray(self.interpolator(xs, ys), dtype=float)
+
+    def z_offset(self, x, y):
+        return float(self.interpolator(x, y))
+
+def lattice_spacing(points, tol=1e-4):
+    """(dx, dy) if points form a complete, evenly spaced rectangular lattice, else None."""
+    points = np.asarray(points, dtype=float)
+    if len(points) < 4:
+        return None
+    keys = np.round(points / tol).astype(np.int64)
+    ux, uy = np.unique(keys[:, 0]), np.unique(keys[:, 1])
+    if len(ux) < 2 or len(uy) < 2 or len(np.unique(keys, axis=0)) != len(ux) * len(uy):
+        return None
+    steps = []
+    for u in (ux, uy):
+        d = np.diff(u) * tol
+        if d.max() - d.min() > 2 * tol:
+            return None
+        steps.append(float(d.mean()))
+    return tuple(steps)
+
+class GridHeightmap:
+    """
+    Heightmap backed by the memory-mapped artifact. Leveling uses bilinear interpolation
+    on the dense grid, so no triangulation is needed when loading.
+    """
+    def __init__(self, artifact_dir, meta, mtime=None):
+        key_dir = os.path.join(artifact_dir, meta["key"])
+        self.points = np.load(os.path.join(key_dir, "points.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(key_dir, "values.npy"), mmap_mode="r")
+        self.simplices = np.load(os.path.join(key_dir, "simplices.npy"), mmap_mode="r")
+        self.grid = np.load(os.path.join(key_dir, "grid.npy"), mmap_mode="r")
+        g = meta["grid"]
+        self.x0, self.y0, self.dx, self.dy = g["x0"], g["y0"], g["dx"], g["dy"]
+        self.ny, self.nx = self.grid.shape
+        self.mtime = mtime
+
+    def z_offsets(self, xs, ys):
+        """Vectorized Z offsets; 0 outside the probed area (like griddata's fill_value)."""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        fx = (xs - self.x0) / self.dx
+        fy = (ys - self.y0) / self.dy
+        inside = (fx >= 0) & (fy >= 0) & (fx <= self.nx - 1) & (fy <= self.ny - 1)
+        i = np.clip(np.floor(fx).astype(int), 0, self.nx - 2)
+        j = np.clip(np.floor(fy).astype(int), 0, self.ny - 2)
+        tx = np.clip(fx - i, 0.0, 1.0)
+        ty = np.clip(fy - j, 0.0, 1.0)
+
+        corners = np.stack([self.grid[j, i], self.grid[j, i + 1], self.grid[j + 1, i], self.grid[j + 1, i + 1]])
+        weights = np.stack([(1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty])
+        # Corners outside the probed area (NaN) are left out, the others re-weighted
+        valid = ~np.isnan(corners)
+        weights = np.where(valid, weights, 0.0)
+        wsum = weights.sum(axis=0)
+        z = np.where(valid, corners, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = (weights * z).sum(axis=0) / wsum
+        return np.where(inside & (wsum > 1e-9), result, 0.0)
+
+    def z_offset(self, x, y):
+        # Scalar path without array overhead (called per segment point by process_gcode)
+        fx = (x - self.x0) / self.dx
+        fy = (y - self.y0) / self.dy
+        if fx < 0 or fy < 0 or fx > self.nx - 1 or fy > self.ny - 1:
+            return 0.0
+        i = min(int(fx), self.nx - 2)
+        j = min(int(fy), self.ny - 2)
+        tx, ty = fx - i, fy - j
+        row0, row1 = self.grid[j], self.grid[j + 1]
+        total = wsum = 0.0
+        for z, w in ((row0[i], (1 - tx) * (1 - ty)), (row0[i + 1], tx * (1 - ty)),
+                     (row1[i], (1 - tx) * ty), (row1[i + 1], tx * ty)):
+            if z == z: # not NaN
+                total += w * z
+                wsum += w
+        return float(total / wsum) if wsum > 1e-9 else 0.0
+
+_heightmap_cache = {}
+_heightmap_lock = threading.Lock()
+
+def artifact_dir_for(probe_file):
+    return os.path.join(os.path.dirname(probe_file), "heightmap")
+
+def _source_stamp(stat):
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def _read_meta(artifact_dir):
+    try:
+        with open(os.path.join(artifact_dir, "meta.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def compile_heightmap(probe_file, heightmap=None):
+    """
+    Compiles probe_file into the binary artifact and returns the loaded heightmap
+    (None if there are no probe points): a GridHeightmap for regular probe grids, the
+    exact Heightmap otherwise. An already built exact Heightmap (e.g. from a streamed
+    run) can be passed in to skip the triangulation.
+    """
+    from scipy.interpolate import LinearNDInterpolator
+    stat = os.stat(probe_file)
+    if heightmap is None:
+        with open(probe_file, 'r') as f:
+            probe_data = json.load(f)
+        if not probe_data or not probe_data.get('points'):
+            return None
+        points = np.array([[p['x'], p['y']] for p in probe_data['points']])
+        values = np.array([p['z'] for p in probe_data['points']])
+        heightmap = Heightmap(points, values)
+
+    points = np.asarray(heightmap.points, dtype=float)
+    values = np.asarray(heightmap.values, dtype=float)
+    tri = heightmap.interpolator.tri
+
+    # Dense grid over the probe lattice; its nodes include every probe point
+    grid = grid_spec = None
+    spacing = lattice_spacing(points)
+    if spacing is not None:
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        kx, ky = (max(1, int(np.ceil(s / GRID_RESOLUTION))) for s in spacing)
+        while (kx > 1 or ky > 1) and ((x1 - x0) / spacing[0] * kx + 1) * ((y1 - y0) / spacing[1] * ky + 1) > MAX_GRID_CELLS:
+            kx, ky = max(1, kx // 2), max(1, ky // 2)
+        nx = int(round((x1 - x0) / spacing[0])) * kx + 1
+        ny = int(round((y1 - y0) / spacing[1])) * ky + 1
+        dx, dy = float(x1 - x0) / (nx - 1), float(y1 - y0) / (ny - 1)
+        gx, gy = np.meshgrid(np.linspace(x0, x1, nx), np.linspace(y0, y1, ny))
+        grid = LinearNDInterpolator(tri, values, fill_value=np.nan)(gx, gy)
+        grid_spec = {"x0": float(x0), "y0": float(y0), "dx": dx, "dy": dy, "nx": nx, "ny": ny}
+
+    artifact_dir = artifact_dir_for(probe_file)
+    key = f"{stat.st_mtime_ns}-{stat.st_size}"
+    key_dir = os.path.join(artifact_dir, key)
+    os.makedirs(key_dir, exist_ok=True)
+    np.save(os.path.join(key_dir, "points.npy"), points)
+    np.save(os.path.join(key_dir, "values.npy"), values)
+    np.save(os.path.join(key_dir, "simplices.npy"), np.asarray(tri.simplices, dtype=np.int32))
+    if grid is not None:
+        np.save(os.path.join(key_dir, "grid.npy"), grid)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "key": key,
+        "source": _source_stamp(stat),
+        "count": int(len(values)),
+        "grid": grid_spec,
+    }
+    # meta.json is replaced atomically, readers always see a complete artifact
+    tmp_meta = os.path.join(artifact_dir, f"meta.{os.getpid()}.tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, os.path.join(artifact_dir, "meta.json"))
+
+    # Remove outdated artifacts (may fail on Windows while another worker has them mapped)
+    for name in os.listdir(artifact_dir):
+        path = os.path.join(artifact_dir, name)
+        if name != key and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    if grid is None:
+        heightmap.mtime = stat.st_mtime_ns
+        return heightmap
+    return GridHeightmap(artifact_dir, meta, stat.st_mtime_ns)
+
+def _open_artifact(artifact_dir, meta, mtime):
+    if meta["grid"] is not None:
+        return GridHeightmap(artifact_dir, meta, mtime)
+    # Irregular point set: exact interpolation (triangulated once per process)
+    key_dir = os.path.join(artifact_dir, meta["key"])
+    points = np.load(os.path.join(key_dir, "points.npy"))
+    values = np.load(os.path.join(key_dir, "values.npy"))
+    return Heightmap(points, values, mtime)
+
+def load_heightmap(probe_file):
+    """
+    Returns the heightmap for probe_file or None if no probe data exists.
+    Uses the in-process cache, then the binary artifact (memory-mapped, no JSON parse,
+    no triangulation for regular probe grids) and only compiles the artifact if it is missing or outdated.
+    """
+    try:
+        stat = os.stat(probe_file)
+    except OSError:
+        return None
+    with _heightmap_lock:
+        cached = _heightmap_cache.get(probe_file)
+        if cached is not None and cached.mtime == stat.st_mtime_ns:
+            return cached
+
+    heightmap = None
+    artifact_dir = artifact_dir_for(probe_file)
+    meta = _read_meta(artifact_dir)
+    if meta and meta.get("version") == FORMAT_VERSION and meta.get("source") == _source_stamp(stat):
+        try:
+            heightmap = _open_artifact(artifact_dir, meta, stat.st_mtime_ns)
+        except (OSError, ValueError):
+            heightmap = None
+    if heightmap is None:
+        heightmap = compile_heightmap(probe_file)
+        if heightmap is None:
+            return None
+
+    with _heightmap_lock:
+        _heightmap_cache[probe_file] = heightmap
+    return heightmap
+
+def cache_heightmap(probe_file, heightmap):
+    """
+    Makes an already built exact Heightmap (e.g. a streamed run's incremental
+    triangulation) the current one for the just written probe_file, without compiling.
+    """
+    heightmap.mtime = os.stat(probe_file).st_mtime_ns
+    with _heightmap_lock:
+        _heightmap_cache[probe_file] = heightmap
+    return heightmap
+
+def install_heightmap(probe_file, heightmap):
+    """
+    Compiles an already built Heightmap for probe_file and caches the result, unless
+    the file was replaced in the meantime (then the compiled artifact is outdated anyway).
+    """
+    compiled = compile_heightmap(probe_file, heightmap)
+    with _heightmap_lock:
+        if heightmap.mtime is None or compiled.mtime == heightmap.mtime:
+            _heightmap_cache[probe_file] = compiled
+    return compiled
+
+def remove_heightmap_artifact(probe_file):
+    shutil.rmtree(artifact_dir_for(probe_file), ignore_errors=True)
+    with _heightmap_lock:
+        _heightmap_cache.pop(probe_file, None)
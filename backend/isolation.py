@@ -0,0 +1,291 @@
+import math
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import gerber
+from gerber.primitives import Region, Line, Arc, Circle, Rectangle, Obround, Polygon as GerberPolygon
+import shapely
+from shapely.geometry import Point, Polygon, LineString, MultiLineString, box
+from shapely.strtree import STRtree
+import shapely.affinity
+from settings import pcb_config
+
+# In-process isolation routing (alternative to pcb2gcode for the traces layer):
+# copper geometry from pcb-tools + Shapely, multi-pass offsets computed per spatial
+# tile on a thread pool (Shapely 2 releases the GIL), G-code returned as text so it
+# goes straight into leveling. pcb2gcode stays the reference (see compare_toolpaths).
+
+TILE_SIZE = 20.0     # mm
+ARC_RESOLUTION = 0.05 # Max. chord error when sampling arcs [mm]
+GRID_SIZE = 1e-6     # Snap grid for joining the tile pieces [mm]
+MAX_WORKERS = 4
+
+def _parse_overlap(raw, default=0.5):
+    """milling-overlap as fraction ("50%" or "0.5")."""
+    try:
+        text = str(raw).strip()
+        value = float(text.rstrip("%"))
+        return value / 100.0 if text.endswith("%") or value > 1.0 else value
+    except ValueError:
+        return default
+
+def isolation_params(cfg=None):
+    """Tool, pass and feed parameters for the traces layer from pcb2gcode.conf."""
+    cfg = cfg or pcb_config()
+    diameters = str(cfg.get("mill-diameters", "0.2mm")).split(",")
+    try:
+        tool_dia = float(diameters[0].strip().lower().replace("mm", ""))
+    except ValueError:
+        tool_dia = 0.2
+    overlap = min(max(_parse_overlap(cfg.get("milling-overlap", "50%")), 0.0), 0.9)
+    step = tool_dia * (1.0 - overlap)
+    isolation_width = cfg.get_length("isolation-width", tool_dia)
+    passes = 1 + int(math.ceil(max(0.0, isolation_width - tool_dia) / step - 1e-9))
+    return {
+        "tool_diameter": tool_dia,
+        "passes": passes,
+        "step": step,
+        # Extra distance between copper and the first pass (pcb2gcode "offset", 0 = tool radius)
+        "offset": max(cfg.get_length("offset", 0.0), tool_dia / 2.0),
+        "z_work": cfg.get_length("zwork", -0.1),
+        "z_safe": cfg.get_length("zsafe", 2.0),
+        "feed": cfg.get_feed("mill-feed", 500.0),
+        "plunge_feed": cfg.get_feed("mill-vertfeed", 200.0),
+        "spindle": cfg.get_rpm("mill-speed", 24000),
+        "mirror": cfg.get_bool("mirror-absolute"),
+    }
+
+def _arc_points(start, end, center, clockwise):
+    """Samples an arc (start -> end around center) within ARC_RESOLUTION."""
+    cx, cy = center
+    r = math.hypot(start[0] - cx, start[1] - cy)
+    a0 = math.atan2(start[1] - cy, start[0] - cx)
+    a1 = math.atan2(end[1] - cy, end[0] - cx)
+    sweep = a1 - a0
+    if clockwise and sweep >= 0:
+        sweep -= 2 * math.pi
+    elif not clockwise and sweep <= 0:
+        sweep += 2 * math.pi
+    if r <= 0:
+        return [start, end]
+    step = 2 * math.acos(max(-1.0, 1.0 - ARC_RESOLUTION / r)) if r > ARC_RESOLUTION else math.pi / 4
+    n = max(2, int(math.ceil(abs(sweep) / max(step, 1e-3))))
+    a = a0 + sweep * np.linspace(0.0, 1.0, n + 1)
+    return list(zip(cx + r * np.cos(a), cy + r * np.sin(a)))
+
+def _aperture_shape(aperture, x, y):
+    """Flash of a Line/Arc aperture at (x, y)."""
+    if isinstance(aperture, Rectangle):
+        return box(x - aperture.width / 2.0, y - aperture.height / 2.0, x + aperture.width / 2.0, y + aperture.height / 2.0)
+    diameter = getattr(aperture, "diameter", None) or getattr(aperture, "width", 0.0)
+    return Point(x, y).buffer(diameter / 2.0)
+
+def _primitive_geometry(prim):
+    """Shapely polygon for one pcb-tools primitive (None if it has no area)."""
+    if isinstance(prim, Region):
+        pts = []
+        for sub in prim.primitives:
+            if isinstance(sub, Arc):
+                arc = _arc_points(sub.start, sub.end, sub.center, sub.direction == "clockwise")
+                pts.extend(arc if not pts else arc[1:])
+            elif hasattr(sub, "start") and hasattr(sub, "end"):
+                if not pts:
+                    pts.append(sub.start)
+                pts.append(sub.end)
+        return Polygon(pts).buffer(0) if len(pts) >= 3 else None
+    if isinstance(prim, Line):
+        if isinstance(prim.aperture, Rectangle):
+            # Rectangular aperture: hull of the flashes at both ends
+            return _aperture_shape(prim.aperture, *prim.start).union(_aperture_shape(prim.aperture, *prim.end)).convex_hull
+        diameter = getattr(prim.aperture, "diameter", 0.0)
+        return LineString([prim.start, prim.end]).buffer(diameter / 2.0)
+    if isinstance(prim, Arc):
+        diameter = getattr(prim.aperture, "diameter", None) or getattr(prim.aperture, "width", 0.0)
+        pts = _arc_points(prim.start, prim.end, prim.center, prim.direction == "clockwise")
+        return LineString(pts).buffer(diameter / 2.0)
+    if isinstance(prim, Circle):
+        return Point(prim.position).buffer(prim.diameter / 2.0)
+    if isinstance(prim, Rectangle):
+        x, y = prim.position
+        rect = box(x - prim.width / 2.0, y - prim.height / 2.0, x + prim.width / 2.0, y + prim.height / 2.0)
+        return shapely.affinity.rotate(rect, getattr(prim, "rotation", 0.0) or 0.0, origin=(x, y))
+    if isinstance(prim, Obround):
+        x, y = prim.position
+        r = min(prim.width, prim.height) / 2.0
+        dx, dy = prim.width / 2.0 - r, prim.height / 2.0 - r
+        return LineString([(x - dx, y - dy), (x + dx, y + dy)]).buffer(r)
+    if isinstance(prim, GerberPolygon):
+        x, y = prim.position
+        a = math.radians(getattr(prim, "rotation", 0.0) or 0.0) + 2 * math.pi * np.arange(prim.sides) / prim.sides
+        return Polygon(list(zip(x + prim.radius * np.cos(a), y + prim.radius * np.sin(a))))
+    # Aperture macros etc.: fall back to the bounding box
+    bbox = getattr(prim, "bounding_box", None)
+    if bbox:
+        (x0, x1), (y0, y1) = bbox
+        return box(x0, y0, x1, y1)
+    return None
+
+def read_copper(gerber_path, mirror=False):
+    """
+    Reads the copper of a Gerber file as a list of polygons (mm).
+    Clear polarity (LPC) is applied in file order. With mirror, X is flipped
+    around 0 like pcb2gcode's mirror-absolute.
+    """
+    cam = gerber.read(gerber_path)
+    cam.to_metric()
+    shapes = []
+    has_clear = False
+    for prim in cam.primitives:
+        geom = _primitive_geometry(prim)
+        if geom is None or geom.is_empty:
+            continue
+        clear = getattr(prim, "level_polarity", "dark") == "clear"
+        has_clear = has_clear or clear
+        shapes.append((geom, clear))
+
+    if has_clear:
+        # Dark runs are united, clear runs cut out of everything drawn before
+        copper = Polygon()
+        run, run_clear = [], False
+        for geom, clear in shapes + [(None, None)]:
+            if run and clear != run_clear:
+                merged = shapely.union_all(run)
+                copper = copper.difference(merged) if run_clear else copper.union(merged)
+                run = []
+            run.append(geom)
+            run_clear = clear
+        polygons = list(getattr(copper, "geoms", [copper]))
+    else:
+        polygons = [geom for geom, _ in shapes]
+
+    if mirror:
+        polygons = [shapely.affinity.scale(p, xfact=-1.0, yfact=1.0, origin=(0, 0)) for p in polygons]
+    return [p for p in polygons if not p.is_empty]
+
+def _tile_paths(tile, tree, polygons, distances):
+    """
+    Offset contours of one tile: the copper within reach of the tile is united and
+    buffered once per pass, the contours are clipped to the tile.
+    """
+    reach = max(distances) + 1.0
+    idx = tree.query(tile.buffer(reach, join_style="mitre"))
+    if not len(idx):
+        return [[] for _ in distances]
+    local = shapely.union_all([polygons[i] for i in idx])
+    out = []
+    for d in distances:
+        contour = local.buffer(d).boundary.intersection(tile)
+        out.append([g for g in getattr(contour, "geoms", [contour]) if isinstance(g, LineString) and not g.is_empty])
+    return out
+
+def isolation_paths(polygons, params, tile_size=TILE_SIZE, max_workers=MAX_WORKERS):
+    """
+    Multi-pass isolation contours around the copper polygons.
+    Returns one list of LineStrings per pass (innermost first).
+    """
+    distances = [params["offset"] + k * params["step"] for k in range(params["passes"])]
+    if not polygons:
+        return [[] for _ in distances]
+    tree = STRtree(polygons)
+    x0, y0, x1, y1 = shapely.total_bounds(polygons)
+    reach = max(distances) + 1.0
+    x0, y0, x1, y1 = x0 - reach, y0 - reach, x1 + reach, y1 + reach
+    nx = max(1, int(math.ceil((x1 - x0) / tile_size)))
+    ny = max(1, int(math.ceil((y1 - y0) / tile_size)))
+    tiles = [box(x0 + i * tile_size, y0 + j * tile_size, x0 + (i + 1) * tile_size, y0 + (j + 1) * tile_size)
+             for j in range(ny) for i in range(nx)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tiles)))) as pool:
+        results = list(pool.map(lambda t: _tile_paths(t, tree, polygons, distances), tiles))
+
+    passes = []
+    for k in range(len(distances)):
+        pieces = [line for tile in results for line in tile[k]]
+        if not pieces:
+            passes.append([])
+            continue
+        # Snap, de-duplicate pieces on shared tile edges and join them across tiles
+        merged = shapely.line_merge(shapely.union_all(shapely.set_precision(MultiLineString(pieces), GRID_SIZE)))
+        passes.append([g for g in getattr(merged, "geoms", [merged]) if not g.is_empty])
+    return passes
+
+def order_paths(paths, start=(0.0, 0.0)):
+    """Nearest-neighbour order; open paths may be reversed. Returns coordinate arrays."""
+    coords = [np.asarray(p.coords) for p in paths]
+    remaining = list(range(len(coords)))
+    pos = np.asarray(start, dtype=float)
+    ordered = []
+    while remaining:
+        heads = np.array([coords[i][0] for i in remaining])
+        tails = np.array([coords[i][-1] for i in remaining])
+        dh = np.hypot(*(heads - pos).T)
+        dt = np.hypot(*(tails - pos).T)
+        k = int(np.argmin(np.minimum(dh, dt)))
+        c = coords[remaining.pop(k)]
+        if dt[k] < dh[k]:
+            c = c[::-1]
+        ordered.append(c)
+        pos = c[-1]
+    return ordered
+
+def isolation_gcode(passes, params, title=""):
+    """G-code for the isolation passes (same structure as the pcb2gcode output)."""
+    out = [
+        f"( pcb-bridge native isolation{': ' + title if title else ''} )",
+        f"( Tool diameter: {params['tool_diameter']:g}mm, passes: {params['passes']} )",
+        "G94", "G21", "G90",
+        f"G0 Z{params['z_safe']:.5f}",
+        f"S{params['spindle']} M3",
+    ]
+    pos = (0.0, 0.0)
+    for k, paths in enumerate(passes):
+        out.append(f"( Pass {k + 1} )")
+        for c in order_paths(paths, pos):
+            out.append(f"G0 X{c[0, 0]:.5f} Y{c[0, 1]:.5f}")
+            out.append(f"G1 Z{params['z_work']:.5f} F{params['plunge_feed']:.5f}")
+            if len(c) > 1:
+                # Whole contour in one format operation, the following moves are modal G1
+                fmt = f"G1 X%.5f Y%.5f F{params['feed']:.5f}" + "\nX%.5f Y%.5f" * (len(c) - 2)
+                out.append(fmt % tuple(c[1:].ravel()))
+            out.append(f"G0 Z{params['z_safe']:.5f}")
+            pos = c[-1]
+    out += ["M5", "M2"]
+    return "\n".join(out) + "\n"
+
+def generate_isolation(gerber_path, cfg=None, title="traces"):
+    """
+    Native isolation routing for one copper layer.
+    Returns (gcode text, info dict with pass count, contour count and cut length).
+    """
+    params = isolation_params(cfg)
+    polygons = read_copper(gerber_path, mirror=params["mirror"])
+    passes = isolation_paths(polygons, params)
+    info = {
+        "engine": "native",
+        "passes": params["passes"],
+        "copper_polygons": len(polygons),
+        "contours": sum(len(p) for p in passes),
+        "cut_length": round(sum(line.length for p in passes for line in p), 1),
+    }
+    return isolation_gcode(passes, params, title), info
+
+def _cut_lines(text):
+    """Feed moves of a G-code text as a MultiLineString (for comparisons)."""
+    from estimate import parse_moves
+    m, _ = parse_moves(text)
+    if len(m["x"]) < 2:
+        return MultiLineString()
+    cut = (m["mode"][1:] != 0) & (np.hypot(np.diff(m["x"]), np.diff(m["y"])) > 1e-9)
+    segs = np.column_stack([m["x"][:-1], m["y"][:-1], m["x"][1:], m["y"][1:]])[cut]
+    return MultiLineString([[(s[0], s[1]), (s[2], s[3])] for s in segs])
+
+def compare_toolpaths(gcode, reference_gcode):
+    """
+    Regression comparison against a reference (e.g. the pcb2gcode output of the
+    same board): cut lengths and the Hausdorff distance between the cut paths.
+    """
+    a, b = _cut_lines(gcode), _cut_lines(reference_gcode)
+    return {
+        "cut_length": round(a.length, 1),
+        "reference_cut_length": round(b.length, 1),
+        "hausdorff": round(a.hausdorff_distance(b), 4) if not a.is_empty and not b.is_empty else None,
+    }
@@ -0,0 +1,85 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Batch jobs run on a bounded thread pool. Job records are kept in memory
+# (the results themselves are stored in the project workspaces).
+MAX_JOB_HISTORY = 500
+
+class JobQueue:
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pcb-job")
+        self._lock = threading.Lock()
+        self.jobs = {}    # job id -> record
+        self.batches = {} # batch id -> [job ids]
+
+    def submit(self, project, func, batch_id=None):
+        """Queues func() for project. The return value of func is stored as the job result."""
+        job = {
+            "id": uuid.uuid4().hex[:12], "project": project, "batch": batch_id,
+            "status": "queued", "submitted": time.time(), "started": None, "finished": None,
+            "error": None, "result": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            if batch_id:
+                self.batches.setdefault(batch_id, []).append(job["id"])
+            self._trim()
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job, func):
+        job["status"] = "running"
+        job["started"] = time.time()
+        try:
+            job["result"] = func()
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"Job {job['id']} ({job['project']}) failed: {e}")
+        job["finished"] = time.time()
+
+    def _trim(self):
+        # Forget the oldest finished jobs
+        finished = [j for j in self.jobs.values() if j["status"] in ("done", "failed")]
+        for job in sorted(finished, key=lambda j: j["submitted"])[:max(0, len(self.jobs) - MAX_JOB_HISTORY)]:
+            del self.jobs[job["id"]]
+            ids = self.batches.get(job["batch"])
+            if ids and job["id"] in ids:
+                ids.remove(job["id"])
+                if not ids:
+                    del self.batches[job["batch"]]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def batch(self, batch_id):
+        with self._lock:
+            ids = list(self.batches.get(batch_id, []))
+        return [self.jobs[i] for i in ids if i in self.jobs]
+
+    def busy_projects(self):
+        with self._lock:
+            return {j["project"] for j in self.jobs.values() if j["status"] in ("queued", "running")}
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for j in self.jobs.values():
+                counts[j["status"]] = counts.get(j["status"], 0) + 1
+        return {"workers": self.max_workers, "jobs": counts}
+
+def batch_status(jobs):
+    """Aggregated status of a batch: queued, running, done or failed (if any job failed)."""
+    states = {j["status"] for j in jobs}
+    if not states:
+        return "unknown"
+    if states & {"queued", "running"}:
+        return "running" if "running" in states or "done" in states or "failed" in states else "queued"
+    return "failed" if "failed" in states else "done"
+
+def new_batch_id():
+    return uuid.uuid4().hex[:12]
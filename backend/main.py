@@ -1,28 +1,49 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import os
 import json
-import shutil
-import numpy as np
-import random
 import sys
+import asyncio
 import uvicorn
 from typing import Optional
-from transformer import PcbTransformer
-from visualization import generate_heightmap_image, generate_gcode_image
+# Heavy modules (transformer -> NumPy/SciPy, visualization -> matplotlib, pocketing -> pcb-tools/Shapely)
+# are imported lazily inside the endpoints that need them, so startup and /status stay fast.
+from metrics import RequestMetrics, REGISTRY, profile_to
+from workspaces import Workspace, WorkspaceStore, store_file
+from jobs import JobQueue, batch_status, new_batch_id
+from store import RESULTS, read_json
 
 # Determine paths relative to this file (main.py)
 if getattr(sys, 'frozen', False):
     BASE_DIR = os.path.dirname(sys.executable)
 else:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("PCB_BRIDGE_DATA_DIR", os.path.join(BASE_DIR, "data"))
+PROBE_FILE = os.path.join(DATA_DIR, "probe_result.json")
+
+# Project workspaces (batch processing) and the bounded worker pool for batch jobs
+DEFAULT_WORKSPACE = Workspace(DATA_DIR)
+WORKSPACES = WorkspaceStore(os.path.join(DATA_DIR, "workspaces"))
+JOBS = JobQueue(max_workers=int(os.environ.get("PCB_BRIDGE_WORKERS", "2")))
+# Finished workspaces are removed after this age or beyond this total size
+WORKSPACE_MAX_AGE_HOURS = float(os.environ.get("PCB_BRIDGE_WORKSPACE_MAX_AGE_HOURS", "72"))
+WORKSPACE_MAX_MB = float(os.environ.get("PCB_BRIDGE_WORKSPACE_MAX_MB", "2000"))
+# Isolation engine for the traces: "pcb2gcode" (external binary) or "native" (isolation.py)
+ISOLATION_ENGINES = ("pcb2gcode", "native")
+ISOLATION_ENGINE = os.environ.get("PCB_BRIDGE_ISOLATION", "pcb2gcode")
+# Optional watch folder: new Gerber exports there are processed in the background
+WATCH_DIR = os.environ.get("PCB_BRIDGE_WATCH_DIR")
+WATCH_PROJECT = os.environ.get("PCB_BRIDGE_WATCH_PROJECT") # default: the dialog's workspace (data/)
+WATCH_INTERVAL = float(os.environ.get("PCB_BRIDGE_WATCH_INTERVAL", "1.0"))
+WATCH_DEBOUNCE = float(os.environ.get("PCB_BRIDGE_WATCH_DEBOUNCE", "2.0"))
 
 app = FastAPI(title="pcb-bridge API")
 
-# Serve data directory (images) statically
+# Serve data directory (images) statically; it holds runtime output only and is not in the repo
+os.makedirs(DATA_DIR, exist_ok=True)
 app.mount("/data", StaticFiles(directory=DATA_DIR), name="data")
 
 app.add_middleware(
@@ -32,11 +53,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints whose work runs in a worker thread: profiling the event loop would miss it,
+# so they profile inside the worker (process_locked) and set X-Profile-Path themselves
+WORKER_PROFILED_PATHS = {"/process/pcb"}
+
+@app.middleware("http")
+async def profile_middleware(request: Request, call_next):
+    """
+    Opt-in profiling per request: add ?profile=1 (cProfile) or ?profile=pyinstrument.
+    The dump is written to data/profiles/, its path is returned in the X-Profile-Path header.
+    """
+    mode = request.query_params.get("profile")
+    if not mode or request.url.path in WORKER_PROFILED_PATHS:
+        return await call_next(request)
+    name = request.url.path.strip("/").replace("/", "_") or "root"
+    with profile_to(os.path.join(DATA_DIR, "profiles"), name, mode) as info:
+        response = await call_next(request)
+    if info["path"]:
+        response.headers["X-Profile-Path"] = info["path"]
+        print(f"Profile written to {info['path']}")
+    return response
+
 class ProbeConfig(BaseModel):
     width: float
     height: float
+    # Regular grid ("grid") or an irregular point set from /probe/plan ("plan")
+    points_x: Optional[int] = None
+    points_y: Optional[int] = None
+    mode: str = "grid"
+
+class SimulationConfig(ProbeConfig):
     points_x: int
     points_y: int
+    # Surface model(s) from probing.SURFACE_MODELS, combined with '+' (e.g. "tilt+bow+noise")
+    model: str = "default"
+    seed: Optional[int] = None
 
 class ProbePoint(BaseModel):
     x: float
@@ -47,20 +98,68 @@ class ProbeResult(BaseModel):
     config: ProbeConfig
     points: list[ProbePoint]
 
+class ProbeBatch(BaseModel):
+    points: list[ProbePoint]
+    final: bool = False # Last batch of the run -> result is saved and ready for leveling
+
+class ProbePlanRequest(BaseModel):
+    max_spacing: float = 20.0      # Cell size / largest distance between probe points [mm]
+    min_spacing: float = 5.0       # Smallest distance in dense areas [mm]
+    length_per_point: float = 40.0 # Approx. one probe point per this cut length [mm]
+    max_points: int = 400
+    margin: float = 1.0            # Added around the toolpaths [mm]
+    layers: list[str] = ["traces", "user_drawings"] # Layers that drive the density
+    seconds_per_point: float = 6.0 # For the time estimate (G38.2 touch + retract)
+    travel_feed: float = 1000.0    # For the time estimate [mm/min]
+
+class JobPlanRequest(BaseModel):
+    merge: bool = False            # Also write all jobs as one program in plan order
+    order: Optional[list[str]] = None # Own order instead of the recommended one
+    project: Optional[str] = None
+
+class ResumeRequest(BaseModel):
+    layer: str = "traces"          # Key of the processed file (traces, outline, drill_T1, ...)
+    line: Optional[int] = None     # Restart at the first cut on/after this line (1-based) ...
+    x: Optional[float] = None      # ... or at the cut closest to this location
+    y: Optional[float] = None
+    project: Optional[str] = None
+
 def generate_viz_gcode(points):
     """Generates G-code to visualize the probe points."""
-    lines = ["; Probe Grid Visualization", "; DO NOT RUN - VISUALIZATION ONLY", "G21", "G90", "G0 Z2.0"]
+    header = "; Probe Grid Visualization\n; DO NOT RUN - VISUALIZATION ONLY\nG21\nG90\nG0 Z2.0"
+    # Support dict (simulation) and object (pydantic)
+    coords = []
     for p in points:
-        # Support dict (simulation) and object (pydantic)
         if isinstance(p, dict):
-            x, y = p["x"], p["y"]
+            coords += (p["x"], p["y"])
         else:
-            x, y = p.x, p.y
-            
-        lines.append(f"G0 X{x:.3f} Y{y:.3f}")
-        lines.append("G1 Z-1.0 F100")
-        lines.append("G0 Z2.0")
-    return "\n".join(lines)
+            coords += (p.x, p.y)
+    if not coords:
+        return header
+    # Format all points in one go instead of one f-string per line
+    block = "\nG0 X%.3f Y%.3f\nG1 Z-1.0 F100\nG0 Z2.0" * (len(coords) // 2)
+    return header + block % tuple(coords)
+
+def probe_view(path):
+    """Response data of /probe/latest for a probe_result.json (kept in the result store)."""
+    data = read_json(path)
+    points = data.get("points", [])
+    return {"config": data.get("config"), "points": points, "viz_gcode": generate_viz_gcode(points)}
+
+def compile_probe_artifact(probe_file, heightmap=None):
+    """
+    Compiles the saved probe data into the binary heightmap artifact used for leveling.
+    An already built Heightmap (streamed run) is reused instead of triangulating again.
+    """
+    from heightmap import compile_heightmap, install_heightmap
+    try:
+        if heightmap is not None:
+            install_heightmap(probe_file, heightmap)
+        else:
+            compile_heightmap(probe_file)
+    except Exception as e:
+        # Leveling retries (and reports) when the heightmap is loaded
+        print(f"Heightmap compile failed: {e}")
 
 @app.post("/probe/save")
 async def save_probe_result(result: ProbeResult):
@@ -70,83 +169,323 @@ async def save_probe_result(result: ProbeResult):
     file_path = os.path.join(DATA_DIR, "probe_result.json")
     with open(file_path, "w") as f:
         f.write(result.model_dump_json(indent=2))
+    compile_probe_artifact(file_path)
     
     # Generate Heightmap Image immediately
+    from visualization import generate_heightmap_image
     out_path_hm = os.path.join(DATA_DIR, "viz_heightmap.png")
     generate_heightmap_image(file_path, out_path_hm)
     
     viz = generate_viz_gcode(result.points)
+    data = result.model_dump()
+    RESULTS.remember(file_path, {"config": data["config"], "points": data["points"], "viz_gcode": viz})
     return {"status": "saved", "file": file_path, "viz_gcode": viz, "images": {"heightmap": out_path_hm}}
 
+# Current streamed probe run (see /probe/stream/*)
+probe_stream = {"current": None}
+
+def get_probe_stream():
+    """Returns the current stream, restoring an aborted run from its partial file if needed."""
+    from probing import ProbeStream
+    partial_file = os.path.join(DATA_DIR, "probe_partial.jsonl")
+    if probe_stream["current"] is None and os.path.exists(partial_file):
+        probe_stream["current"] = ProbeStream.resume(partial_file)
+    return probe_stream["current"]
+
+async def finish_probe_stream(stream):
+    """
+    Saves the streamed points as probe_result.json and hands the incremental
+    triangulation to the leveling cache, so leveling works right away. The heatmap
+    is rendered in a worker thread; the artifact is compiled in the background
+    from the same triangulation.
+    """
+    from heightmap import cache_heightmap
+    from visualization import generate_heightmap_image
+    file_path = os.path.join(DATA_DIR, "probe_result.json")
+    result = stream.result()
+    with open(file_path, "w") as f:
+        json.dump(result, f)
+
+    heightmap = stream.heightmap()
+    if heightmap is not None:
+        cache_heightmap(file_path, heightmap)
+    stream.status = "finished"
+    if os.path.exists(stream.partial_file):
+        os.remove(stream.partial_file)
+
+    loop = asyncio.get_running_loop()
+    out_path_hm = os.path.join(DATA_DIR, "viz_heightmap.png")
+    await loop.run_in_executor(None, generate_heightmap_image, file_path, out_path_hm)
+    if heightmap is not None:
+        loop.run_in_executor(None, compile_probe_artifact, file_path, heightmap)
+    viz = generate_viz_gcode(result["points"])
+    RESULTS.remember(file_path, {"config": result.get("config"), "points": result["points"], "viz_gcode": viz})
+    return {"status": "saved", "file": file_path, "viz_gcode": viz, "images": {"heightmap": out_path_hm}, "stream": stream.stats()}
+
+@app.post("/probe/stream/start")
+async def start_probe_stream(config: ProbeConfig):
+    """Starts a streamed probe run. Points are then sent via /probe/stream/points."""
+    from probing import ProbeStream
+    stream = ProbeStream(config.model_dump(), os.path.join(DATA_DIR, "probe_partial.jsonl"))
+    probe_stream["current"] = stream
+    return {"status": "success", "stream": stream.stats()}
+
+@app.post("/probe/stream/points")
+async def add_probe_stream_points(batch: ProbeBatch):
+    """
+    Adds one or more probe points to the running stream. Returns live stats
+    (count, fitted plane, deviation). With final=true the run is saved immediately.
+    """
+    stream = get_probe_stream()
+    if stream is None or stream.status == "finished":
+        return {"status": "error", "message": "No probe run active. Call /probe/stream/start first."}
+    stream.status = "running"
+    stream.add([(p.x, p.y, p.z) for p in batch.points])
+    if batch.final:
+        return await finish_probe_stream(stream)
+    return {"status": "success", "stream": stream.stats()}
+
+@app.post("/probe/stream/finish")
+async def finish_probe_stream_endpoint():
+    """Saves the points received so far (also for an aborted run)."""
+    stream = get_probe_stream()
+    if stream is None or not stream.z:
+        return {"status": "error", "message": "No streamed probe points available."}
+    return await finish_probe_stream(stream)
+
+@app.post("/probe/stream/abort")
+async def abort_probe_stream():
+    """Marks the run as aborted. The partial data is kept and can be finished or continued."""
+    stream = get_probe_stream()
+    if stream is None:
+        return {"status": "none"}
+    if stream.status != "finished":
+        stream.status = "aborted"
+    return {"status": "success", "stream": stream.stats()}
+
+@app.get("/probe/stream")
+async def get_probe_stream_status():
+    """Live state of the streamed probe run."""
+    stream = get_probe_stream()
+    if stream is None:
+        return {"status": "none"}
+    return {"status": "success", "stream": stream.stats()}
+
 @app.post("/probe/simulate")
-async def simulate_probe_run(config: ProbeConfig):
+async def simulate_probe_run(config: SimulationConfig):
     """ 
     Directly creates a probe_result.json based on dimensions, 
     without needing to save a grid beforehand.
+    Surface model and seed are selectable for reproducible test runs.
     """
-    # Calculate grid points
-    xs = np.linspace(0, config.width, config.points_x)
-    ys = np.linspace(0, config.height, config.points_y)
+    from probing import simulate_surface, points_to_dicts
+    from visualization import generate_heightmap_image
 
-    # Simulate a curved surface (e.g., Sine wave + slight tilt)
-    simulated_points = []
-    for y in ys:
-        for x in xs:
-            # Fake Math: Warping of max approx. 0.5mm and a tilt
-            z_sim = 0.2 * np.sin(x / 20.0) + 0.01 * y + random.uniform(-0.005, 0.005)
-            simulated_points.append({"x": float(x), "y": float(y), "z": round(z_sim, 4)})
+    # Simulate the surface on the whole grid at once
+    try:
+        xs, ys, zs = simulate_surface(config.width, config.height, config.points_x, config.points_y,
+                                      model=config.model, seed=config.seed)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    simulated_points = points_to_dicts(xs, ys, zs)
 
     result_data = {"config": config.model_dump(), "points": simulated_points}
     
     result_path = os.path.join(DATA_DIR, "probe_result.json")
     with open(result_path, "w") as f:
-        json.dump(result_data, f, indent=2)
+        json.dump(result_data, f)
+    compile_probe_artifact(result_path)
 
     # Generate Heightmap Image immediately
     out_path_hm = os.path.join(DATA_DIR, "viz_heightmap.png")
     generate_heightmap_image(result_path, out_path_hm)
 
     viz = generate_viz_gcode(simulated_points)
+    RESULTS.remember(result_path, {"config": result_data["config"], "points": simulated_points, "viz_gcode": viz})
     return {"message": "Simulation complete", "file": result_path, "viz_gcode": viz, "points": simulated_points, "images": {"heightmap": out_path_hm}}
 
+@app.post("/probe/plan")
+async def plan_probe_points_endpoint(req: ProbePlanRequest):
+    """
+    Plans an adaptive probe point set from the processed toolpaths:
+    dense where isolation cuts are concentrated, nothing where no cuts are,
+    ordered as a short travel tour. Falls back to the bounding boxes from
+    'dimensions' if the G-code files are missing.
+    """
+    import numpy as np
+    from probing import read_cut_segments, plan_probe_points
+
+    state = DEFAULT_WORKSPACE.load_state()
+    if not state:
+        return {"status": "error", "message": "No processed toolpaths found. Please process Gerber files first."}
+
+    coverage, density = [], []
+    for key, path in state.get("files", {}).items():
+        if not path or not os.path.exists(path):
+            continue
+        segs = read_cut_segments(path)
+        coverage.append(segs)
+        if any(key == layer or key.startswith(f"{layer}_") for layer in req.layers):
+            density.append(segs)
+
+    source = "toolpaths"
+    if not coverage:
+        # Fallback: fill the bounding boxes with scan lines (uniform density)
+        source = "dimensions"
+        for dims in (state.get("dimensions") or {}).values():
+            ys = np.arange(dims["min_y"], dims["max_y"] + req.max_spacing / 2.0, req.max_spacing / 2.0)
+            segs = np.column_stack([np.full_like(ys, dims["min_x"]), ys, np.full_like(ys, dims["max_x"]), ys])
+            coverage.append(segs)
+            density.append(segs)
+    if not coverage:
+        return {"status": "error", "message": "Processed state contains no toolpaths or dimensions."}
+
+    coverage = np.vstack(coverage)
+    density = np.vstack(density) if density else np.empty((0, 4))
+    points, info = plan_probe_points(coverage, density, max_spacing=req.max_spacing, min_spacing=req.min_spacing,
+                                     length_per_point=req.length_per_point, max_points=req.max_points, margin=req.margin)
+    if len(points) == 0:
+        return {"status": "error", "message": info.get("reason", "No probe points planned")}
+
+    def estimate(n, travel):
+        return round(n * req.seconds_per_point + travel / req.travel_feed * 60.0, 1)
+    info["source"] = source
+    info["estimated_seconds"] = estimate(info["points"], info["travel_mm"])
+    info["uniform_grid_estimated_seconds"] = estimate(info["uniform_grid_points"], info["uniform_grid_travel_mm"])
+
+    b = info["bounds"]
+    plan_points = [{"x": x, "y": y} for x, y in points.tolist()]
+    return {
+        "status": "success",
+        "config": {"width": round(b["max_x"] - b["min_x"], 3), "height": round(b["max_y"] - b["min_y"], 3), "mode": "plan"},
+        "points": plan_points,
+        "plan": info,
+        "viz_gcode": generate_viz_gcode(plan_points)
+    }
+
 @app.get("/probe/latest")
 async def get_latest_probe_result():
     """ 
     Loads the last saved probe result (if available).
     """
-    file_path = os.path.join(DATA_DIR, "probe_result.json")
-    if not os.path.exists(file_path):
+    # Parsed points and viz G-code come from the result store (rebuilt only when the file changed)
+    view = RESULTS.load(PROBE_FILE, probe_view)
+    if view is None:
         return {"status": "none", "message": "No probe data found"}
     
-    with open(file_path, "r") as f:
-        data = json.load(f)
-    
-    # Regenerate visualization
-    viz = generate_viz_gcode(data.get("points", []))
-    
     return {
         "status": "success", 
-        "config": data.get("config"), 
-        "points": data.get("points"), 
-        "viz_gcode": viz
+        "config": view["config"], 
+        "points": view["points"], 
+        "viz_gcode": view["viz_gcode"]
     }
 
 @app.delete("/probe/reset")
 async def reset_probe_data():
     """Deletes the saved probe data."""
-    file_path = os.path.join(DATA_DIR, "probe_result.json")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    RESULTS.delete(PROBE_FILE)
+    partial_file = os.path.join(DATA_DIR, "probe_partial.jsonl")
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+    from heightmap import remove_heightmap_artifact
+    remove_heightmap_artifact(os.path.join(DATA_DIR, "probe_result.json"))
+    probe_stream["current"] = None
     return {"status": "success", "message": "Probe data cleared"}
 
 @app.delete("/process/reset")
 async def reset_process_data():
     """Clears the processing state."""
-    state_file = os.path.join(DATA_DIR, "process_state.json")
-    if os.path.exists(state_file):
-        os.remove(state_file)
+    DEFAULT_WORKSPACE.clear_state()
     return {"status": "success", "message": "Process state cleared"}
 
+# Warm-up state (reported by /status)
+warmup_state = {"status": "pending" if os.environ.get("PCB_BRIDGE_WARMUP", "1") != "0" else "disabled"}
+
+def warm_up():
+    """Preloads the heavy modules and the heightmap cache in the background."""
+    import time
+    import importlib
+    t0 = time.perf_counter()
+    warmup_state["status"] = "running"
+    try:
+        import transformer
+        # Imported for their side effect only (module load time), not used here
+        importlib.import_module("visualization")
+        try:
+            importlib.import_module("pocketing")
+        except ImportError as e:
+            print(f"Warm-up: Pocketing unavailable ({e})")
+        # Maps the compiled heightmap artifact (compiles it once if missing)
+        transformer.load_heightmap(os.path.join(DATA_DIR, "probe_result.json"))
+        # Fills the result store, so the first dialog open is a memory lookup
+        DEFAULT_WORKSPACE.load_result()
+        RESULTS.load(PROBE_FILE, probe_view)
+        warmup_state["status"] = "done"
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        print(f"Warm-up failed: {e}")
+    warmup_state["seconds"] = round(time.perf_counter() - t0, 3)
+    print(f"Warm-up {warmup_state['status']} in {warmup_state['seconds']}s")
+
+# Watch-folder processing (started at startup when PCB_BRIDGE_WATCH_DIR is set)
+watch_state = {"watcher": None}
+
+def run_watch_job(workspace, raw_paths, filenames, input_hashes, options, done):
+    """
+    Worker side of a watch-folder trigger: processes the export like /process/pcb.
+    done(ok) tells the watcher whether the export counts as processed.
+    """
+    metrics = RequestMetrics()
+    try:
+        result = process_locked(workspace, raw_paths, filenames, input_hashes, options, metrics)
+    except Exception:
+        done(False)
+        raise
+    done(result.get("status") == "success")
+    metrics.log(f"watch ({workspace.id})")
+    REGISTRY.observe(metrics, "watch")
+    result.pop("gcode", None)
+    return result
+
+def process_watched(paths, hashes, changed, done):
+    """
+    Called by the watcher when an export settled. Only the files in the folder are
+    used (a layer missing there is not taken from the previous run); offsets, panel
+    and isolation engine are kept from the last processing of the workspace.
+    Returns False while the workspace is busy; done(ok) is called when the job finished.
+    """
+    workspace = resolve_workspace(WATCH_PROJECT)
+    if workspace.id in JOBS.busy_projects():
+        return False
+    workspace.ensure_dirs()
+    old_state = workspace.load_state()
+    raw_paths, filenames, input_hashes = {}, {}, {}
+    for key, path in paths.items():
+        raw_paths[key], input_hashes[key] = store_file(path, workspace.uploads_dir)
+        filenames[key] = os.path.basename(path)
+    options = {"offset_x": 0.0, "offset_y": 0.0, "panel_x": 1, "panel_y": 1, "panel_spacing": 2.0, "isolation": ISOLATION_ENGINE}
+    options.update({k: v for k, v in (old_state.get("config") or {}).items() if k in BATCH_OPTIONS})
+    JOBS.submit(workspace.id, lambda: run_watch_job(workspace, raw_paths, filenames, input_hashes, options, done))
+    print(f"Watch folder: processing {', '.join(changed)} changed ({', '.join(filenames.values())})")
+    return True
+
+def start_watcher():
+    from watcher import FolderWatcher
+    if not os.path.isdir(WATCH_DIR):
+        print(f"Watch folder: {WATCH_DIR} does not exist, not watching")
+        return
+    try:
+        workspace = resolve_workspace(WATCH_PROJECT)
+    except ValueError as e:
+        print(f"Watch folder: {e}")
+        return
+    # Exports the watcher already processed do not trigger again after a restart
+    watcher = FolderWatcher(WATCH_DIR, process_watched, WATCH_INTERVAL, WATCH_DEBOUNCE,
+                            state_file=os.path.join(workspace.dir, "watch_state.json"))
+    watcher.start()
+    watch_state["watcher"] = watcher
+    print(f"Watch folder: watching {WATCH_DIR} (debounce {WATCH_DEBOUNCE}s)")
+
 @app.on_event("startup")
 async def startup_event():
     file_path = os.path.join(DATA_DIR, "probe_result.json")
@@ -155,299 +494,388 @@ async def startup_event():
     else:
         print("Startup: No existing probe data found.")
 
+    # Optional background warm-up (disable with PCB_BRIDGE_WARMUP=0)
+    if warmup_state["status"] == "pending":
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if WATCH_DIR:
+        start_watcher()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if watch_state["watcher"] is not None:
+        watch_state["watcher"].stop()
+    # Pending write-behind states have to reach the disk
+    if not RESULTS.flush():
+        print("Shutdown: result store writes did not finish in time")
+
 @app.get("/process/latest")
-async def get_latest_process():
+async def get_latest_process(project: Optional[str] = None):
     """ 
-    Loads the result of the last Gerber processing.
+    Loads the result of the last Gerber processing (of the default or the given project workspace).
     """
-    state_file = os.path.join(DATA_DIR, "process_state.json")
-    if not os.path.exists(state_file):
+    try:
+        workspace = resolve_workspace(project, create=False)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    if workspace is None:
         return {"status": "none"}
-        
-    with open(state_file, "r") as f:
-        state = json.load(f)
-        
-    # Load content of G-code files
-    gcode_data = {}
-    files_map = state.get("files", {})
-    for key, path in files_map.items():
-        if path and os.path.exists(path):
-            with open(path, "r") as f:
-                gcode_data[key] = f.read()
-        else:
-            gcode_data[key] = None
-            
-    return {
-        "status": "success",
-        "config": state.get("config"),
-        "gcode": gcode_data,
-        "dimensions": state.get("dimensions"),
-        "tool_metadata": state.get("tool_metadata", {}),
-        "filenames": state.get("filenames"),
-        "images": state.get("images")
-    }
+    return workspace.load_result()
 
-def get_config_value(key, default="?"):
-    """Reads a value from pcb2gcode.conf"""
+@app.post("/process/resume")
+async def resume_process(req: ResumeRequest):
+    """
+    Builds a restart program for an interrupted job: the rest of the leveled file from
+    the given line or location, preceded by retract, spindle/feed setup and plunge.
+    """
     try:
-        config_path = os.path.join(os.path.dirname(BASE_DIR), "config", "pcb2gcode.conf")
-        if os.path.exists(config_path):
-            with open(config_path, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith("#"): continue
-                    if "=" in line:
-                        k, v = line.split("=", 1)
-                        if k.strip() == key:
-                            return v.split("#")[0].strip()
-    except Exception:
-        pass
-    return default
-
-def get_ud_config_value(key, default="?"):
-    """Reads a value from user_drawings.conf"""
+        workspace = resolve_workspace(req.project, create=False)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    path = ((workspace.load_state() if workspace else {}).get("files") or {}).get(req.layer)
+    if not path or not os.path.exists(path):
+        return {"status": "error", "message": f"No processed G-code for layer '{req.layer}'."}
+    if req.line is None and (req.x is None or req.y is None):
+        return {"status": "error", "message": "Either line or x and y are required."}
+
+    from resume import load_index
+    index = load_index(path)
+    distance = None
+    if req.line is not None:
+        i = index.at_line(req.line)
+    else:
+        i, distance = index.nearest(req.x, req.y)
+    if i is None:
+        return {"status": "error", "message": "No cut moves left after this point."}
+
+    gcode, info = index.restart(i, req.layer)
+    if distance is not None:
+        info["distance"] = round(distance, 4)
+    out_path = os.path.join(workspace.processed_dir, f"pcb_resume_{req.layer}.gcode")
+    with open(out_path, "w") as f:
+        f.write(gcode)
+    print(f"Resume {req.layer}: line {info['line']} ({info['skipped_seconds']}s skipped)")
+    return {"status": "success", "layer": req.layer, "file": out_path, "gcode": gcode, "resume": info}
+
+@app.post("/process/plan")
+async def plan_process(req: JobPlanRequest):
+    """
+    Run order of the processed files with the fewest tool changes (outline last),
+    optionally merged into one program that pauses (M0) at every tool change.
+    """
     try:
-        config_path = os.path.join(os.path.dirname(BASE_DIR), "config", "user_drawings.conf")
-        if os.path.exists(config_path):
-            with open(config_path, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith("#"): continue
-                    if "=" in line:
-                        k, v = line.split("=", 1)
-                        if k.strip() == key:
-                            return v.split("#")[0].strip()
-    except Exception:
-        pass
-    return default
+        workspace = resolve_workspace(req.project, create=False)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    state = workspace.load_state() if workspace else {}
+    files = state.get("files") or {}
+    if not files:
+        return {"status": "error", "message": "No processed G-code available."}
+
+    from sequence import plan_jobs, merge_program
+    tool_metadata = state.get("tool_metadata") or {}
+    dimensions = state.get("dimensions") or {}
+    seconds = {key: ((dimensions.get(key) or {}).get("estimate") or {}).get("seconds", 0.0) for key in files}
+    if req.order:
+        unknown = [key for key in req.order if key not in files]
+        if unknown:
+            return {"status": "error", "message": f"Unknown layers: {', '.join(unknown)}"}
+    plan = plan_jobs(tool_metadata, seconds, order=req.order or None)
+    if not req.merge:
+        return {"status": "success", "plan": plan}
+
+    contents = {}
+    for key in plan["order"]:
+        if os.path.exists(files[key]):
+            with open(files[key], "r") as f:
+                contents[key] = f.read()
+    gcode = merge_program(plan, contents, tool_metadata)
+    out_path = os.path.join(workspace.processed_dir, "pcb_merged.gcode")
+    with open(out_path, "w") as f:
+        f.write(gcode)
+    print(f"Job plan: {' -> '.join(plan['order'])} ({plan['tool_changes']} tool changes)")
+    return {"status": "success", "plan": plan, "file": out_path, "gcode": gcode}
+
+@app.get("/process/streaming")
+async def simulate_streaming(project: Optional[str] = None, layer: Optional[str] = None):
+    """
+    Replays the processed files (or one layer) through the controller streaming model:
+    achieved vs commanded feed, stall time and time lost to planner starvation per layer.
+    """
+    try:
+        workspace = resolve_workspace(project, create=False)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    files = ((workspace.load_state() if workspace else {}).get("files") or {})
+    if layer is not None:
+        if layer not in files:
+            return {"status": "error", "message": f"No processed G-code for layer '{layer}'."}
+        files = {layer: files[layer]}
+    files = {key: path for key, path in files.items() if os.path.exists(path)}
+    if not files:
+        return {"status": "error", "message": "No processed G-code available."}
+
+    from streaming import controller_params, simulate_file
+    params = controller_params()
+    loop = asyncio.get_running_loop()
+    layers = {}
+    for key, path in files.items():
+        layers[key] = await loop.run_in_executor(None, simulate_file, path, params)
+        print(f"Streaming {key}: {layers[key]['achieved_feed']}/{layers[key]['commanded_feed']} mm/min, "
+              f"{layers[key]['stall_seconds']}s stalled")
+    return {"status": "success", "controller": params, "layers": layers}
+
+LAYER_KEYS = ("traces", "outline", "user_drawings", "drill")
+
+async def save_uploads(workspace, uploads, old_state):
+    """
+    Streams the uploaded files content-addressed into the workspace (hashing on the fly).
+    Layers without upload reuse the file of the previous run.
+    Returns (raw_paths, filenames, input_hashes).
+    """
+    from workspaces import store_upload, file_sha256
+    raw_paths = {}
+    filenames = {}
+    input_hashes = {}
+    for key in LAYER_KEYS:
+        upload = uploads.get(key)
+        old_raw = old_state.get("raw_paths", {}).get(key)
+        if upload:
+            raw_paths[key], input_hashes[key] = await store_upload(upload, workspace.uploads_dir)
+            filenames[key] = os.path.basename(upload.filename)
+        elif old_raw and os.path.exists(old_raw):
+            filenames[key] = old_state.get("filenames", {}).get(key)
+            raw_paths[key] = old_raw
+            # States written before hashing was introduced have no hashes
+            input_hashes[key] = old_state.get("input_hashes", {}).get(key) or file_sha256(old_raw)
+    return raw_paths, filenames, input_hashes
+
+def has_inputs(uploads, old_state):
+    """Validierung: Prüfen, ob überhaupt Eingabedaten vorhanden sind"""
+    for key in LAYER_KEYS:
+        old_raw = old_state.get("raw_paths", {}).get(key)
+        if uploads.get(key) is not None or (old_raw and os.path.exists(old_raw)):
+            return True
+    return False
+
+def check_panel(panel_x, panel_y, panel_spacing):
+    if panel_x < 1 or panel_y < 1 or panel_spacing < 0:
+        return "Invalid panel layout (panel_x/panel_y >= 1, panel_spacing >= 0)."
+    return None
+
+def check_isolation(isolation):
+    if isolation not in ISOLATION_ENGINES:
+        return f"Unknown isolation engine '{isolation}' (expected {' or '.join(ISOLATION_ENGINES)})."
+    return None
+
+def process_locked(workspace, raw_paths, filenames, input_hashes, options, metrics, profile=None):
+    """
+    Runs the pipeline under the workspace lock. Blocking: call from a worker thread, never on the event loop.
+    With profile (the ?profile mode) the run is profiled in this thread, without the
+    wait for the lock; the dump path goes to metrics.profile_path.
+    """
+    from pipeline import process_project
+    with workspace.lock:
+        if not profile:
+            return process_project(workspace, raw_paths, filenames, input_hashes, options, metrics, PROBE_FILE)
+        with profile_to(os.path.join(DATA_DIR, "profiles"), "process_pcb", profile, async_mode="disabled") as info:
+            result = process_project(workspace, raw_paths, filenames, input_hashes, options, metrics, PROBE_FILE)
+        metrics.profile_path = info["path"]
+        return result
+
+def resolve_workspace(project, create=True):
+    """Default workspace (data/) without project id, otherwise data/workspaces/<project>. Raises ValueError."""
+    if not project:
+        return DEFAULT_WORKSPACE
+    return WORKSPACES.get(project, create=create)
 
 @app.post("/process/pcb")
 async def process_pcb(
+    request: Request,
+    response: Response,
     traces: UploadFile = File(None),
     outline: UploadFile = File(None),
     user_drawings: UploadFile = File(None),
     drill: UploadFile = File(None),
     offset_x: float = Form(0.0),
-    offset_y: float = Form(0.0)
+    offset_y: float = Form(0.0),
+    panel_x: int = Form(1),
+    panel_y: int = Form(1),
+    panel_spacing: float = Form(2.0),
+    project: Optional[str] = Form(None),
+    isolation: Optional[str] = Form(None)
 ):
     """
     Accepts Gerber files, calls pcb2gcode, and applies leveling.
+    With panel_x/panel_y > 1 the processed board is replicated (step-and-repeat)
+    before leveling, pcb2gcode and pocketing still run only once.
+    With a project id, all files and the state go to that project workspace.
+    isolation selects the engine for the traces (default: PCB_BRIDGE_ISOLATION).
     """
-    upload_dir = os.path.join(DATA_DIR, "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    processed_dir = os.path.join(DATA_DIR, "gcode_processed")
-    os.makedirs(processed_dir, exist_ok=True)
-    state_file = os.path.join(DATA_DIR, "process_state.json")
-    
+    try:
+        workspace = resolve_workspace(project)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    workspace.ensure_dirs()
+    metrics = RequestMetrics()
+    uploads = {"traces": traces, "outline": outline, "user_drawings": user_drawings, "drill": drill}
+
     # Load old state to reuse paths if no new files are uploaded
-    old_state = {}
-    if os.path.exists(state_file):
-        try:
-            with open(state_file, "r") as f:
-                old_state = json.load(f)
-        except Exception:
-            pass
-    
-    # Save files
-    traces_path = None
-    outline_path = None
-    drill_path = None
-    filenames = {}
-    raw_paths = {} # New structure for raw file paths
-    
-    # Helper: Get path from old state
-    def get_old_raw(key):
-        return old_state.get("raw_paths", {}).get(key)
-    def get_old_name(key):
-        return old_state.get("filenames", {}).get(key)
-    
-    # Validierung: Prüfen, ob überhaupt Eingabedaten vorhanden sind
-    has_traces = traces is not None or (get_old_raw("traces") and os.path.exists(get_old_raw("traces")))
-    has_outline = outline is not None or (get_old_raw("outline") and os.path.exists(get_old_raw("outline")))
-    has_ud = user_drawings is not None or (get_old_raw("user_drawings") and os.path.exists(get_old_raw("user_drawings")))
-    has_drill = drill is not None or (get_old_raw("drill") and os.path.exists(get_old_raw("drill")))
-    
-    if not (has_traces or has_outline or has_drill or has_ud): 
+    old_state = workspace.load_state()
+    if not has_inputs(uploads, old_state):
         return {"status": "error", "message": "No input files provided and no previous state found. Please upload Gerber files."}
+    panel_error = check_panel(panel_x, panel_y, panel_spacing) or check_isolation(isolation or ISOLATION_ENGINE)
+    if panel_error:
+        return {"status": "error", "message": panel_error}
+
+    options = {"offset_x": offset_x, "offset_y": offset_y, "panel_x": panel_x, "panel_y": panel_y, "panel_spacing": panel_spacing,
+               "isolation": isolation or ISOLATION_ENGINE}
+    # Uploads are content-addressed, so they can be stored before the workspace lock is taken
+    with metrics.stage("upload"):
+        raw_paths, filenames, input_hashes = await save_uploads(workspace, uploads, old_state)
+    # The workspace lock may be held by a pool job: wait and process off the event loop
+    # (?profile is therefore applied in the worker thread, see WORKER_PROFILED_PATHS)
+    result = await asyncio.get_running_loop().run_in_executor(
+        None, process_locked, workspace, raw_paths, filenames, input_hashes, options, metrics,
+        request.query_params.get("profile"))
+    if metrics.profile_path:
+        response.headers["X-Profile-Path"] = metrics.profile_path
+        print(f"Profile written to {metrics.profile_path}")
+
+    metrics.log("/process/pcb")
+    REGISTRY.observe(metrics, "/process/pcb")
+    return result
+
+BATCH_OPTIONS = {"offset_x": float, "offset_y": float, "panel_x": int, "panel_y": int, "panel_spacing": float, "isolation": str}
+
+def run_batch_job(workspace, raw_paths, filenames, input_hashes, options):
+    """Worker side of a batch job: processes one project and cleans up old workspaces."""
+    metrics = RequestMetrics()
+    result = process_locked(workspace, raw_paths, filenames, input_hashes, options, metrics)
+    metrics.log(f"/batch ({workspace.id})")
+    REGISTRY.observe(metrics, "/batch")
+    removed = WORKSPACES.cleanup(WORKSPACE_MAX_AGE_HOURS, WORKSPACE_MAX_MB, busy=JOBS.busy_projects() | {workspace.id})
+    if removed:
+        print(f"Workspace cleanup: removed {', '.join(removed)}")
+    # The G-code itself stays in the workspace (GET /projects/{id})
+    result.pop("gcode", None)
+    return result
+
+@app.post("/batch")
+async def submit_batch(request: Request):
+    """
+    Queues several projects at once. Multipart fields are named "<project>.<field>":
+    files for traces/outline/user_drawings/drill and the options offset_x, offset_y,
+    panel_x, panel_y, panel_spacing, isolation. Each project is processed in its own workspace
+    by the worker pool; the state is polled via GET /batch/{id} or GET /jobs/{id}.
+    """
+    form = await request.form()
+    projects = {}
+    for name, value in form.multi_items():
+        project, _, field = name.partition(".")
+        if field not in LAYER_KEYS and field not in BATCH_OPTIONS:
+            return {"status": "error", "message": f"Unknown field '{name}' (expected <project>.<layer|option>)"}
+        entry = projects.setdefault(project, {"uploads": {}, "options": {}})
+        if field in LAYER_KEYS:
+            entry["uploads"][field] = value
+        else:
+            try:
+                entry["options"][field] = BATCH_OPTIONS[field](value)
+            except ValueError:
+                return {"status": "error", "message": f"Invalid value for '{name}': {value}"}
+    if not projects:
+        return {"status": "error", "message": "No projects in batch."}
+
+    # Validate everything before anything is queued
+    busy = JOBS.busy_projects()
+    workspaces = {}
+    for project, entry in projects.items():
+        try:
+            workspace = WORKSPACES.get(project, create=True)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        if project in busy:
+            return {"status": "error", "message": f"Project '{project}' is already queued or running."}
+        options = {"offset_x": 0.0, "offset_y": 0.0, "panel_x": 1, "panel_y": 1, "panel_spacing": 2.0, "isolation": ISOLATION_ENGINE}
+        options.update(entry["options"])
+        panel_error = check_panel(options["panel_x"], options["panel_y"], options["panel_spacing"]) or check_isolation(options["isolation"])
+        if panel_error:
+            return {"status": "error", "message": f"{project}: {panel_error}"}
+        old_state = workspace.load_state()
+        if not has_inputs(entry["uploads"], old_state):
+            return {"status": "error", "message": f"{project}: No input files provided and no previous state found."}
+        workspaces[project] = (workspace, options, old_state)
+
+    batch_id = new_batch_id()
+    jobs = []
+    for project, (workspace, options, old_state) in workspaces.items():
+        # Uploads are stored now (the temporary files end with the request), processing runs in the pool
+        workspace.ensure_dirs()
+        raw_paths, filenames, input_hashes = await save_uploads(workspace, projects[project]["uploads"], old_state)
+        job = JOBS.submit(project, lambda w=workspace, r=raw_paths, f=filenames, h=input_hashes, o=options: run_batch_job(w, r, f, h, o), batch_id)
+        jobs.append({"id": job["id"], "project": project, "status": job["status"]})
+    return {"status": "queued", "batch": batch_id, "jobs": jobs}
+
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    jobs = JOBS.batch(batch_id)
+    if not jobs:
+        return {"status": "error", "message": f"Unknown batch '{batch_id}'"}
+    return {"status": batch_status(jobs), "batch": batch_id, "jobs": jobs}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Unknown job '{job_id}'"}
+    return job
+
+@app.get("/projects")
+async def list_projects():
+    """Lists the project workspaces with size and last use."""
+    busy = JOBS.busy_projects()
+    projects = []
+    for ws in WORKSPACES.list():
+        info = ws.info()
+        info["busy"] = ws.id in busy
+        projects.append(info)
+    return {"status": "success", "projects": projects, "queue": JOBS.stats()}
+
+@app.get("/projects/{project}")
+async def get_project(project: str):
+    """Result of the last processing run of a project (like /process/latest)."""
+    try:
+        workspace = WORKSPACES.get(project)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    if workspace is None:
+        return {"status": "none"}
+    return workspace.load_result()
 
-    if traces:
-        safe_filename = os.path.basename(traces.filename)
-        traces_path = os.path.join(upload_dir, safe_filename)
-        filenames["traces"] = safe_filename
-        raw_paths["traces"] = traces_path
-        with open(traces_path, "wb") as buffer:
-            shutil.copyfileobj(traces.file, buffer)
-    elif get_old_raw("traces") and os.path.exists(get_old_raw("traces")):
-        traces_path = get_old_raw("traces")
-        filenames["traces"] = get_old_name("traces")
-        raw_paths["traces"] = traces_path
-            
-    if outline:
-        safe_filename = os.path.basename(outline.filename)
-        outline_path = os.path.join(upload_dir, safe_filename)
-        filenames["outline"] = safe_filename
-        raw_paths["outline"] = outline_path
-        with open(outline_path, "wb") as buffer:
-            shutil.copyfileobj(outline.file, buffer)
-    elif get_old_raw("outline") and os.path.exists(get_old_raw("outline")):
-        outline_path = get_old_raw("outline")
-        filenames["outline"] = get_old_name("outline")
-        raw_paths["outline"] = outline_path
-            
-    if user_drawings:
-        safe_filename = os.path.basename(user_drawings.filename)
-        ud_path = os.path.join(upload_dir, safe_filename)
-        filenames["user_drawings"] = safe_filename
-        raw_paths["user_drawings"] = ud_path
-        with open(ud_path, "wb") as buffer:
-            shutil.copyfileobj(user_drawings.file, buffer)
-    elif get_old_raw("user_drawings") and os.path.exists(get_old_raw("user_drawings")):
-        ud_path = get_old_raw("user_drawings")
-        filenames["user_drawings"] = get_old_name("user_drawings")
-        raw_paths["user_drawings"] = ud_path
-
-    if drill:
-        safe_filename = os.path.basename(drill.filename)
-        drill_path = os.path.join(upload_dir, safe_filename)
-        filenames["drill"] = safe_filename
-        raw_paths["drill"] = drill_path
-        with open(drill_path, "wb") as buffer:
-            shutil.copyfileobj(drill.file, buffer)
-    elif get_old_raw("drill") and os.path.exists(get_old_raw("drill")):
-        drill_path = get_old_raw("drill")
-        filenames["drill"] = get_old_name("drill")
-        raw_paths["drill"] = drill_path
-            
-    # Initialize Transformer
-    transformer = PcbTransformer(data_dir=DATA_DIR)
-    
-    # 1. Generate G-code
-    config = {
-        "offset_x": offset_x, 
-        "offset_y": offset_y
-    }
-    raw_files, pcb_params = transformer.run_pcb2gcode(traces_path, outline_path, drill_path, config)
-    
-    # Generate Pocketing if user_drawings exists
-    if has_ud and raw_paths.get("user_drawings"):
-        from pocketing import PocketingGenerator
-        ud_conf_path = os.path.join(os.path.dirname(BASE_DIR), "config", "user_drawings.conf")
-        pock_gen = PocketingGenerator(ud_conf_path)
-        raw_ud_gcode = os.path.join(DATA_DIR, "gcode_raw", "pcb_project_user_drawings.gcode")
-        mirror_x_abs = get_config_value("mirror-absolute", "0") == "1"
-        pock_gen.generate(raw_paths["user_drawings"], raw_ud_gcode, auto_mirror_x=mirror_x_abs)
-        raw_files["user_drawings"] = raw_ud_gcode
-
-    # Parse requested tools from Drill file if available
-    requested_tools = {}
-    if drill_path and os.path.exists(drill_path):
-        requested_tools = transformer.parse_excellon_tools(drill_path)
-
-    # 2. Apply leveling to all generated files
-    leveled_files = {}
-    gcode_contents = {}
-    dimensions = {}
-    tool_metadata = {}
-    
-    for key in ["traces", "user_drawings", "outline", "drill"]:
-        raw_path = raw_files.get(key)
-        if raw_path and os.path.exists(raw_path):
-            # Processing (Offset + Leveling + Dimensions)
-            header_params = pcb_params if key != "user_drawings" else None
-            gcode, dims = transformer.process_gcode(raw_path, offset_x, offset_y, extra_header=header_params)
-            
-            if dims:
-                dimensions[key] = dims
-            
-            # Header Injection: Insert tool change notice
-            # pcb2gcode does this automatically for drills, but often not for Front/Outline
-            header = ""
-            if key == "traces":
-                dia = get_config_value("mill-diameters", "unknown")
-                header = f"(MSG, Please insert Trace Isolation Tool: {dia})\n"
-            elif key == "outline":
-                dia = get_config_value("cutter-diameter", "unknown")
-                header = f"(MSG, Please insert Outline Cutter: {dia})\n"
-            elif key == "user_drawings":
-                dia = get_ud_config_value("tool-diameter", "unknown")
-                header = f"(MSG, Please insert Pocketing Tool: {dia})\n"
-            
-            if header:
-                gcode = header + gcode
-            
-            # Save to processed directory
-            out_path = os.path.join(processed_dir, f"pcb_leveled_{key}.gcode")
-            with open(out_path, "w") as f:
-                f.write(gcode)
-            
-            leveled_files[key] = out_path
-            gcode_contents[key] = gcode
-            
-            # Metadata for Traces/Outline
-            if key == "traces":
-                tool_metadata["traces"] = get_config_value("mill-diameters", "?")
-            elif key == "outline":
-                tool_metadata["outline"] = get_config_value("cutter-diameter", "?")
-            elif key == "user_drawings":
-                tool_metadata["user_drawings"] = get_ud_config_value("tool-diameter", "?")
-            
-            # Split Drill Files for Manual Tool Change
-            if key == "drill":
-                split_files = transformer.split_gcode_by_tool(gcode)
-                if split_files:
-                    # Remove original drill file from the main lists to hide it from UI
-                    drill_dims = dimensions.get("drill")
-                    del leveled_files["drill"]
-                    del gcode_contents["drill"]
-                    if "drill" in dimensions:
-                        del dimensions["drill"]
-
-                    for tool, content in split_files.items():
-                        sub_key = f"drill_{tool}"
-                        sub_path = os.path.join(processed_dir, f"pcb_leveled_{sub_key}.gcode")
-                        with open(sub_path, "w") as f:
-                            f.write(content)
-                        leveled_files[sub_key] = sub_path
-                        gcode_contents[sub_key] = content
-                        if drill_dims:
-                            dimensions[sub_key] = drill_dims
-                        
-                        # Extract Diameter
-                        actual_dia_str = transformer.extract_drill_diameter(content, tool)
-                        meta_label = actual_dia_str
-                        
-                        # Try to get requested tool info
-                        req_mm = None
-                        try:
-                            t_num = int(tool.replace('T', ''))
-                            if t_num in requested_tools:
-                                req_mm = requested_tools[t_num]
-                        except Exception:
-                            pass
-
-                        if req_mm is not None:
-                            meta_label = f"{req_mm:g}mm"
-                        
-                        tool_metadata[sub_key] = meta_label
-
-    # Generate G-code Visualization (All types)
-    images = {}
-    for key, path in leveled_files.items():
-        out_path_gc = os.path.join(DATA_DIR, f"viz_gcode_{key}.png")
-        if generate_gcode_image(path, out_path_gc):
-            images[f"gcode_{key}"] = out_path_gc
-
-    # Save state for reload
-    with open(state_file, "w") as f:
-        json.dump({"config": config, "files": leveled_files, "dimensions": dimensions, "tool_metadata": tool_metadata, "filenames": filenames, "raw_paths": raw_paths, "images": images}, f, indent=2)
-    
-    return {"status": "success", "files": leveled_files, "gcode": gcode_contents, "dimensions": dimensions, "tool_metadata": tool_metadata, "filenames": filenames, "images": images}
+@app.delete("/projects/{project}")
+async def delete_project(project: str):
+    if project in JOBS.busy_projects():
+        return {"status": "error", "message": f"Project '{project}' is queued or running."}
+    try:
+        removed = WORKSPACES.remove(project)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success" if removed else "none"}
+
+@app.post("/projects/cleanup")
+async def cleanup_projects(max_age_hours: Optional[float] = None, max_total_mb: Optional[float] = None):
+    """Removes old workspaces (defaults: PCB_BRIDGE_WORKSPACE_MAX_AGE_HOURS / _MAX_MB)."""
+    removed = WORKSPACES.cleanup(max_age_hours if max_age_hours is not None else WORKSPACE_MAX_AGE_HOURS,
+                                 max_total_mb if max_total_mb is not None else WORKSPACE_MAX_MB,
+                                 busy=JOBS.busy_projects())
+    return {"status": "success", "removed": removed}
 
 @app.post("/visualize/create")
 async def create_visualizations():
     """
     Generates PNG images for the Heightmap and the Leveled G-code.
     """
+    from visualization import generate_heightmap_image, generate_gcode_image
+
     images = {}
     
     # 1. Visualize Heightmap
@@ -466,9 +894,22 @@ async def create_visualizations():
 
     return {"status": "success", "images": images}
 
+@app.get("/watch")
+async def get_watch_status():
+    """State of the watch folder (PCB_BRIDGE_WATCH_DIR): recognized files, last trigger."""
+    watcher = watch_state["watcher"]
+    if watcher is None:
+        return {"status": "disabled" if not WATCH_DIR else "error", "directory": WATCH_DIR}
+    return {"status": "success", "watch": watcher.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage timings and per-layer counters in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/status")
 async def get_status():
-    return {"status": "pcb-bridge is running"}
+    return {"status": "pcb-bridge is running", "warmup": warmup_state, "result_store": RESULTS.stats()}
 
 if __name__ == "__main__":
     if getattr(sys, 'frozen', False):
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Per-layer counters reported by PcbTransformer.process_gcode
+LAYER_COUNTERS = ("input_lines", "output_lines", "segments", "interpolations", "output_bytes", "bytes_saved")
+
+class Registry:
+    """Process-wide totals, exposed in Prometheus text format by /metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}       # endpoint -> count
+        self.stage_sum = {}      # stage -> seconds
+        self.stage_count = {}    # stage -> count
+        self.layer_counters = {} # (layer, counter) -> value
+
+    def observe(self, request_metrics, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            for stage, seconds in request_metrics.stages.items():
+                self.stage_sum[stage] = self.stage_sum.get(stage, 0.0) + seconds
+                self.stage_count[stage] = self.stage_count.get(stage, 0) + 1
+            for layer, counters in request_metrics.layers.items():
+                for name, value in counters.items():
+                    key = (layer, name)
+                    self.layer_counters[key] = self.layer_counters.get(key, 0) + value
+
+    def render(self):
+        """Returns all metrics in Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP pcb_bridge_requests_total Processed requests per endpoint.",
+                "# TYPE pcb_bridge_requests_total counter",
+            ]
+            for endpoint, count in sorted(self.requests.items()):
+                lines.append(f'pcb_bridge_requests_total{{endpoint="{endpoint}"}} {count}')
+
+            lines += [
+                "# HELP pcb_bridge_stage_seconds Time spent per processing stage.",
+                "# TYPE pcb_bridge_stage_seconds summary",
+            ]
+            for stage in sorted(self.stage_sum):
+                lines.append(f'pcb_bridge_stage_seconds_sum{{stage="{stage}"}} {self.stage_sum[stage]:.6f}')
+                lines.append(f'pcb_bridge_stage_seconds_count{{stage="{stage}"}} {self.stage_count[stage]}')
+
+            for name in LAYER_COUNTERS:
+                values = sorted((layer, v) for (layer, n), v in self.layer_counters.items() if n == name)
+                lines += [
+                    f"# HELP pcb_bridge_layer_{name}_total {name.replace('_', ' ').capitalize()} per layer.",
+                    f"# TYPE pcb_bridge_layer_{name}_total counter",
+                ]
+                for layer, value in values:
+                    lines.append(f'pcb_bridge_layer_{name}_total{{layer="{layer}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class RequestMetrics:
+    """Collects stage timings and per-layer counters for a single request."""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages = {}
+        self.layers = {}
+        self.profile_path = None # set when the pipeline was profiled in its worker thread
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    def count(self, layer, stats):
+        """Adds the counters of one layer (dict as filled by process_gcode)."""
+        counters = self.layers.setdefault(layer, {})
+        for name, value in stats.items():
+            counters[name] = counters.get(name, 0) + value
+
+    def summary(self):
+        total = time.perf_counter() - self.t0
+        return {
+            "total_seconds": round(total, 4),
+            "stages": {k: round(v, 4) for k, v in self.stages.items()},
+            "layers": self.layers,
+        }
+
+    def log(self, label):
+        parts = " ".join(f"{k}={v:.3f}s" for k, v in self.stages.items())
+        print(f"Timing {label}: {parts} (total {time.perf_counter() - self.t0:.3f}s)")
+
+# One profile at a time: concurrent profilers would mix their samples (or, on
+# Python 3.12+, fail because only one profiling tool can be active)
+_profile_lock = threading.Lock()
+
+@contextmanager
+def profile_to(out_dir, name, mode="cprofile", async_mode="enabled"):
+    """
+    Profiles the enclosed block and dumps the result to out_dir.
+    mode "pyinstrument" writes an HTML report (if installed), otherwise a cProfile .prof file.
+    Only the calling thread is profiled (pass async_mode="disabled" in worker threads).
+    Yields a dict whose "path" is set after the block; it stays None when another
+    profile is already running (the block then runs unprofiled).
+    """
+    if not _profile_lock.acquire(blocking=False):
+        print(f"Profile {name} skipped: another profile is running")
+        yield {"path": None}
+        return
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        info = {"path": None}
+
+        profiler = None
+        if mode == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler(async_mode=async_mode)
+            except ImportError:
+                mode = "cprofile"
+
+        if mode == "pyinstrument":
+            profiler.start()
+            try:
+                yield info
+            finally:
+                profiler.stop()
+                info["path"] = os.path.join(out_dir, f"{name}_{stamp}.html")
+                with open(info["path"], "w") as f:
+                    f.write(profiler.output_html())
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield info
+            finally:
+                profiler.disable()
+                info["path"] = os.path.join(out_dir, f"{name}_{stamp}.prof")
+                profiler.dump_stats(info["path"])
+    finally:
+        _profile_lock.release()
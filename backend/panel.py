@@ -0,0 +1,221 @@
+import os
+import re
+import numpy as np
+
+# Step-and-repeat (panelization): the raw toolpaths of one processed board are
+# replicated N x M times by translation. Leveling happens afterwards on the
+# combined program, so every copy is leveled against its own heightmap area.
+
+_COORD_RE = re.compile(r"(?<![A-Za-z])([XY])(-?\d+(?:\.\d*)?|-?\.\d+)")
+_Z_RE = re.compile(r"(?<![A-Za-z])Z(-?\d+(?:\.\d*)?|-?\.\d+)")
+_TOOL_RE = re.compile(r"^T\d+\b")
+_MOTION_RE = re.compile(r"^G0?[01](?!\d)")
+
+class Section:
+    """One tool block of a raw program: tool change lines + translatable body."""
+    def __init__(self, tool_lines):
+        self.tool_lines = tool_lines
+        self.body = []
+        self.tail = []
+
+    def compile(self):
+        """Builds a single format string for the body, so each copy is one % operation."""
+        text = "\n".join(self.body).replace("%", "%%")
+        pieces = _COORD_RE.split(text)
+        # pieces: text, axis, value, text, axis, value, ..., text
+        axes = pieces[1::3]
+        self.values = np.array([float(v) for v in pieces[2::3]])
+        self.is_x = np.array([a == "X" for a in axes], dtype=bool)
+        fmt = [pieces[0]]
+        for axis, rest in zip(axes, pieces[3::3]):
+            fmt.append(axis + "%.5f" + rest)
+        self.fmt = "".join(fmt)
+
+        # Never travel to the next copy below the highest Z of the body
+        zs = [float(z) for z in _Z_RE.findall(text)]
+        if zs and zs[-1] < max(zs):
+            self.fmt += f"\nG0 Z{max(zs):.4f}"
+
+        xs, ys = self.values[self.is_x], self.values[~self.is_x]
+        self.bounds = (xs.min(), ys.min(), xs.max(), ys.max()) if len(xs) and len(ys) else None
+        # Entry/exit point of the body (first/last XY position, modal)
+        self.entry = self._position(first=True)
+        self.exit = self._position(first=False)
+
+    def _position(self, first):
+        x = y = None
+        order = range(len(self.values)) if first else range(len(self.values) - 1, -1, -1)
+        for i in order:
+            if self.is_x[i] and x is None: x = self.values[i]
+            if not self.is_x[i] and y is None: y = self.values[i]
+            if x is not None and y is not None:
+                break
+        return np.array([x or 0.0, y or 0.0])
+
+    def emit(self, dx, dy):
+        if not len(self.values):
+            return self.fmt
+        return self.fmt % tuple(self.values + np.where(self.is_x, dx, dy))
+
+class PanelTemplate:
+    """
+    Raw G-code split into header, tool sections and footer.
+    The body of a section runs from its first XY move to its last motion line
+    (so the retract after the last cut is part of every copy).
+    """
+    def __init__(self, path):
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+
+        self.header = []
+        self.sections = []
+        self.footer = []
+
+        current = None
+        pending = [] # lines since the last motion line of the current body
+        for line in lines:
+            code = line.split(";")[0].split("(")[0].strip()
+            if _TOOL_RE.match(code):
+                if current is not None:
+                    current.tail = pending
+                current = Section([line])
+                self.sections.append(current)
+                pending = []
+                continue
+
+            has_xy = bool(_COORD_RE.search(code))
+            if current is None:
+                if not has_xy:
+                    self.header.append(line)
+                    continue
+                current = Section([])
+                self.sections.append(current)
+
+            if not current.body:
+                if has_xy:
+                    current.body.append(line)
+                else:
+                    current.tool_lines.append(line)
+                continue
+
+            pending.append(line)
+            if _MOTION_RE.match(code) or has_xy or code.startswith("Z"):
+                current.body.extend(pending)
+                pending = []
+
+        # Lines after the last motion line end the program (spindle off, M2, ...)
+        if current is not None:
+            self.footer = pending
+        self.sections = [s for s in self.sections if s.body or s.tool_lines]
+        for s in self.sections:
+            s.compile()
+
+    @property
+    def bounds(self):
+        b = [s.bounds for s in self.sections if s.bounds]
+        if not b:
+            return None
+        b = np.array(b)
+        return (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max())
+
+    def render(self, orders, offsets):
+        """Writes the combined program: per section the tool change once, then all copies."""
+        out = list(self.header)
+        for section, order in zip(self.sections, orders):
+            out.extend(section.tool_lines)
+            for k in order:
+                dx, dy = offsets[k]
+                out.append(f"( Panel copy {k + 1}/{len(offsets)} )")
+                out.append(section.emit(dx, dy))
+            out.extend(section.tail)
+        out.extend(self.footer)
+        return "\n".join(out) + "\n"
+
+def grid_offsets(nx, ny, pitch_x, pitch_y):
+    """Offsets of all copies, row by row starting at the reference copy (0, 0)."""
+    return [(ix * pitch_x, iy * pitch_y) for iy in range(ny) for ix in range(nx)]
+
+def _serpentines(nx, ny):
+    """Boustrophedon orders over rows and columns, starting from every corner."""
+    idx = np.arange(nx * ny).reshape(ny, nx)
+    orders = []
+    for grid in (idx, idx.T):
+        for g in (grid, grid[::-1], grid[:, ::-1], grid[::-1, ::-1]):
+            rows = [row if i % 2 == 0 else row[::-1] for i, row in enumerate(g)]
+            orders.append([int(k) for k in np.concatenate(rows)])
+    return orders
+
+def _travel(order, offsets, entry, exit, start):
+    pos = start
+    total = 0.0
+    for k in order:
+        total += float(np.hypot(*(entry + offsets[k] - pos)))
+        pos = exit + offsets[k]
+    return total, pos
+
+def _nearest_neighbour(offsets, entry, exit, start):
+    remaining = list(range(len(offsets)))
+    pos = start
+    order = []
+    while remaining:
+        d = np.hypot(*(entry + offsets[remaining] - pos).T)
+        k = remaining.pop(int(np.argmin(d)))
+        order.append(k)
+        pos = exit + offsets[k]
+    return order
+
+def order_copies(section, offsets, nx, ny, start):
+    """
+    Order of the copies for one section with the shortest travel between them
+    (serpentine variants and nearest neighbour, using the entry/exit point of the body).
+    """
+    offsets = np.asarray(offsets, dtype=float)
+    candidates = _serpentines(nx, ny) + [_nearest_neighbour(offsets, section.entry, section.exit, start)]
+    best = None
+    for order in candidates:
+        travel, end = _travel(order, offsets, section.entry, section.exit, start)
+        if best is None or travel < best[1]:
+            best = (order, travel, end)
+    return best
+
+def panelize(raw_files, nx, ny, spacing, out_dir):
+    """
+    Replicates the raw G-code files nx x ny times.
+    The pitch is the extent of all toolpaths (same for every layer) plus spacing.
+    Returns (panel raw files, info dict).
+    """
+    templates = {key: PanelTemplate(path) for key, path in raw_files.items() if path and os.path.exists(path)}
+    bounds = np.array([t.bounds for t in templates.values() if t.bounds is not None])
+    if not len(bounds):
+        return raw_files, None
+    min_x, min_y = bounds[:, 0].min(), bounds[:, 1].min()
+    max_x, max_y = bounds[:, 2].max(), bounds[:, 3].max()
+    pitch_x = (max_x - min_x) + spacing
+    pitch_y = (max_y - min_y) + spacing
+    offsets = grid_offsets(nx, ny, pitch_x, pitch_y)
+
+    panel_files = {}
+    travel = {}
+    for key, template in templates.items():
+        pos = np.zeros(2)
+        orders = []
+        total = 0.0
+        for section in template.sections:
+            order, dist, pos = order_copies(section, offsets, nx, ny, pos)
+            orders.append(order)
+            total += dist
+        out_path = os.path.join(out_dir, f"pcb_project_{key}_panel.gcode")
+        with open(out_path, "w") as f:
+            f.write(template.render(orders, offsets))
+        panel_files[key] = out_path
+        travel[key] = round(total, 1)
+
+    info = {
+        "nx": nx, "ny": ny, "copies": nx * ny, "spacing": spacing,
+        "pitch_x": round(pitch_x, 4), "pitch_y": round(pitch_y, 4),
+        "bounds": {"min_x": float(min_x), "min_y": float(min_y),
+                   "max_x": float(min_x + (nx - 1) * pitch_x + (max_x - min_x)),
+                   "max_y": float(min_y + (ny - 1) * pitch_y + (max_y - min_y))},
+        "travel_mm": travel,
+    }
+    return panel_files, info
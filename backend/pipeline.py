@@ -0,0 +1,327 @@
+import os
+from settings import pcb_config, ud_config, machine_config, drill_config, effective_hash, USER_DRAWINGS_CONF
+from emitter import write_text
+from store import RESULTS
+
+# Processing pipeline of one project (pcb2gcode, pocketing, panelization, leveling,
+# drill split, rendering). Used by /process/pcb and the batch workers; all outputs
+# go to the given workspace, only the heightmap is shared.
+
+def get_config_value(key, default="?"):
+    """Reads a value from pcb2gcode.conf (cached per file mtime)"""
+    return pcb_config().get(key, default)
+
+def get_ud_config_value(key, default="?"):
+    """Reads a value from user_drawings.conf (cached per file mtime)"""
+    return ud_config().get(key, default)
+
+def probe_stamp(probe_file):
+    """Identifies the current probe data (the heightmap is cached on the same stamp)."""
+    try:
+        stat = os.stat(probe_file)
+    except OSError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def _cached_files(entry, key):
+    """Returns the cached stage entry if its key matches and all its files still exist."""
+    if not entry or entry.get("key") != key:
+        return None
+    if not all(os.path.exists(p) for p in entry.get("files", {}).values()):
+        return None
+    return entry
+
+def process_project(workspace, raw_paths, filenames, input_hashes, options, metrics, probe_file):
+    """
+    Runs the whole pipeline for the input files in raw_paths and stores the
+    state in the workspace. options: offset_x, offset_y, panel_x, panel_y, panel_spacing.
+    input_hashes (sha256 per layer) short-circuit unchanged work: the whole run if
+    inputs, parameters and probe data are unchanged, otherwise pcb2gcode and pocketing
+    individually. Returns the response dict of /process/pcb.
+    """
+    from transformer import PcbTransformer
+    from visualization import generate_gcode_image
+
+    workspace.ensure_dirs()
+    offset_x = options.get("offset_x", 0.0)
+    offset_y = options.get("offset_y", 0.0)
+    panel_x = options.get("panel_x", 1)
+    panel_y = options.get("panel_y", 1)
+    panel_spacing = options.get("panel_spacing", 2.0)
+    isolation = options.get("isolation", "pcb2gcode")
+    traces_path = raw_paths.get("traces")
+    outline_path = raw_paths.get("outline")
+    drill_path = raw_paths.get("drill")
+    processed_dir = workspace.processed_dir
+
+    # Initialize Transformer (outputs in the workspace, heightmap shared)
+    transformer = PcbTransformer(data_dir=workspace.dir, probe_file=probe_file)
+    
+    # 1. Generate G-code
+    config = {
+        "offset_x": offset_x, 
+        "offset_y": offset_y
+    }
+    if panel_x * panel_y > 1:
+        config.update({"panel_x": panel_x, "panel_y": panel_y, "panel_spacing": panel_spacing})
+    if isolation != "pcb2gcode":
+        config["isolation"] = isolation
+    # Stable key over all effective parameters (for downstream caches)
+    config_hash = effective_hash(pcb_config(), ud_config(), extra=config)
+    inputs = {k: input_hashes.get(k) for k in raw_paths}
+    result_key = effective_hash(pcb_config(), ud_config(), machine_config(), drill_config(), extra={"config": config, "inputs": inputs, "probe": probe_stamp(probe_file)})
+
+    old_state = workspace.load_state()
+    cache = old_state.get("cache", {})
+    if old_state.get("result_key") == result_key and all(os.path.exists(p) for p in old_state.get("files", {}).values()):
+        # Nothing changed: return the stored result
+        result = workspace.load_result()
+        result.update({"cached": True, "cache_hits": ["result"], "metrics": metrics.summary()})
+        return result
+
+    cache_hits = []
+    # Native isolation engine for the traces (falls back to pcb2gcode on errors)
+    native_files = {}
+    raw_texts = {} # Raw G-code already in memory, leveled without reading the file back
+    isolation_info = None
+    if isolation == "native" and traces_path:
+        isolation_key = effective_hash(pcb_config(), extra={"traces": inputs.get("traces"), "engine": "native"})
+        cached = _cached_files(cache.get("isolation"), isolation_key)
+        if cached:
+            native_files = dict(cached["files"])
+            isolation_info = cached.get("info")
+            cache_hits.append("isolation")
+        else:
+            try:
+                with metrics.stage("isolation"):
+                    from isolation import generate_isolation
+                    text, isolation_info = generate_isolation(traces_path, pcb_config())
+                native_path = os.path.join(workspace.raw_dir, "pcb_project_traces_native.gcode")
+                # Still written for the stage cache and panelization, but not read back below
+                write_text(native_path, text)
+                native_files = {"traces": native_path}
+                raw_texts["traces"] = text
+                cache["isolation"] = {"key": isolation_key, "files": dict(native_files), "info": isolation_info}
+            except Exception as e:
+                print(f"Native isolation failed, falling back to pcb2gcode: {e}")
+                isolation_info = {"engine": "pcb2gcode", "fallback": str(e)}
+
+    # Direct Excellon drilling, opt-in via drilling.conf engine=native (falls back to pcb2gcode on errors)
+    excellon = None
+    if drill_path and drill_config().get("engine", "pcb2gcode") == "native":
+        try:
+            with metrics.stage("drilling"):
+                from drilling import ExcellonFile
+                excellon = ExcellonFile.parse(drill_path)
+            if not excellon.holes:
+                raise ValueError("no holes found in drill file")
+            native_files["drill"] = None # Generated below, after leveling of the other layers
+        except Exception as e:
+            print(f"Direct drilling failed, falling back to pcb2gcode: {e}")
+            excellon = None
+
+    pcb_inputs = {k: inputs[k] for k in ("traces", "outline", "drill") if k in inputs and k not in native_files}
+    pcb2gcode_key = effective_hash(pcb_config(), extra=pcb_inputs)
+    cached = _cached_files(cache.get("pcb2gcode"), pcb2gcode_key)
+    if not pcb_inputs:
+        # Everything came from the native engine, pcb2gcode is not needed
+        raw_files, pcb_params = {}, transformer.log_params()
+    elif cached:
+        raw_files, pcb_params = dict(cached["files"]), cached["params"]
+        cache_hits.append("pcb2gcode")
+    else:
+        with metrics.stage("pcb2gcode"):
+            raw_files, pcb_params = transformer.run_pcb2gcode(None if "traces" in native_files else traces_path, outline_path,
+                                                              None if "drill" in native_files else drill_path, config)
+        # Only layers with an input (older outputs of other layers may still be on disk)
+        raw_files = {k: v for k, v in raw_files.items() if k in pcb_inputs}
+        cache["pcb2gcode"] = {"key": pcb2gcode_key, "files": dict(raw_files), "params": pcb_params}
+    raw_files.update({k: v for k, v in native_files.items() if v})
+    
+    # Generate Pocketing if user_drawings exists
+    pocketing_info = None
+    if raw_paths.get("user_drawings") and os.path.exists(raw_paths["user_drawings"]):
+        mirror_x_abs = pcb_config().get_bool("mirror-absolute")
+        pocketing_key = effective_hash(ud_config(), extra={"user_drawings": inputs.get("user_drawings"), "mirror": mirror_x_abs})
+        cached = _cached_files(cache.get("pocketing"), pocketing_key)
+        if cached:
+            raw_files["user_drawings"] = cached["files"]["user_drawings"]
+            pocketing_info = cached.get("info")
+            cache_hits.append("pocketing")
+        else:
+            with metrics.stage("pocketing"):
+                from pocketing import PocketingGenerator
+                pock_gen = PocketingGenerator(USER_DRAWINGS_CONF)
+                raw_ud_gcode = os.path.join(workspace.raw_dir, "pcb_project_user_drawings.gcode")
+                pocketing_info = pock_gen.generate(raw_paths["user_drawings"], raw_ud_gcode, auto_mirror_x=mirror_x_abs)
+                raw_files["user_drawings"] = raw_ud_gcode
+            cache["pocketing"] = {"key": pocketing_key, "files": {"user_drawings": raw_ud_gcode}, "info": pocketing_info}
+
+    # Step-and-repeat: replicate the raw toolpaths, leveling below then covers every copy
+    if excellon is not None and panel_x * panel_y > 1:
+        # The panel needs the raw drill program, it is leveled and split like the pcb2gcode output
+        from drilling import raw_drill_program, drill_params
+        raw_drill = os.path.join(workspace.raw_dir, "pcb_project_drill_native.gcode")
+        write_text(raw_drill, raw_drill_program(excellon, drill_params()))
+        raw_files["drill"] = raw_drill
+    panel_info = None
+    if panel_x * panel_y > 1:
+        with metrics.stage("panelize"):
+            from panel import panelize
+            from heightmap import load_heightmap
+            raw_files, panel_info = panelize(raw_files, panel_x, panel_y, panel_spacing, workspace.raw_dir)
+            raw_texts = {}
+        if panel_info:
+            heightmap = load_heightmap(transformer.probe_file)
+            b = panel_info["bounds"]
+            if heightmap is not None:
+                (hx0, hy0), (hx1, hy1) = heightmap.points.min(axis=0), heightmap.points.max(axis=0)
+                if b["min_x"] + offset_x < hx0 or b["max_x"] + offset_x > hx1 or b["min_y"] + offset_y < hy0 or b["max_y"] + offset_y > hy1:
+                    panel_info["warning"] = "Panel exceeds the probed area, copies outside are not leveled."
+
+    # Parse requested tools from Drill file if available
+    requested_tools = {}
+    if excellon is not None:
+        requested_tools = dict(excellon.tools)
+    elif drill_path and os.path.exists(drill_path):
+        requested_tools = transformer.parse_excellon_tools(drill_path)
+
+    # 2. Apply leveling to all generated files
+    leveled_files = {}
+    gcode_contents = {}
+    dimensions = {}
+    tool_metadata = {}
+    
+    for key in ["traces", "user_drawings", "outline", "drill"]:
+        raw_path = raw_files.get(key)
+        if raw_path and os.path.exists(raw_path):
+            # Processing (Offset + Leveling + Dimensions)
+            header_params = pcb_params if key != "user_drawings" else None
+            layer_stats = {}
+            with metrics.stage("leveling"):
+                gcode, dims = transformer.process_gcode(raw_path, offset_x, offset_y, extra_header=header_params,
+                                                        stats=layer_stats, text=raw_texts.get(key))
+            metrics.count(key, layer_stats)
+            
+            if dims:
+                dimensions[key] = dims
+            
+            # Header Injection: Insert tool change notice
+            # pcb2gcode does this automatically for drills, but often not for Front/Outline
+            header = ""
+            if key == "traces":
+                dia = get_config_value("mill-diameters", "unknown")
+                header = f"(MSG, Please insert Trace Isolation Tool: {dia})\n"
+            elif key == "outline":
+                dia = get_config_value("cutter-diameter", "unknown")
+                header = f"(MSG, Please insert Outline Cutter: {dia})\n"
+            elif key == "user_drawings":
+                dia = get_ud_config_value("tool-diameter", "unknown")
+                header = f"(MSG, Please insert Pocketing Tool: {dia})\n"
+            
+            if header:
+                gcode = header + gcode
+            
+            # Save to processed directory
+            out_path = os.path.join(processed_dir, f"pcb_leveled_{key}.gcode")
+            write_text(out_path, gcode)
+            RESULTS.remember(out_path, gcode)
+            
+            leveled_files[key] = out_path
+            gcode_contents[key] = gcode
+            
+            # Metadata for Traces/Outline
+            if key == "traces":
+                tool_metadata["traces"] = get_config_value("mill-diameters", "?")
+            elif key == "outline":
+                tool_metadata["outline"] = get_config_value("cutter-diameter", "?")
+            elif key == "user_drawings":
+                tool_metadata["user_drawings"] = get_ud_config_value("tool-diameter", "?")
+            
+            # Split Drill Files for Manual Tool Change
+            if key == "drill":
+                with metrics.stage("drill_split"):
+                    split_files = transformer.split_gcode_by_tool(gcode)
+                if split_files:
+                    # Remove original drill file from the main lists to hide it from UI
+                    drill_dims = dimensions.get("drill")
+                    del leveled_files["drill"]
+                    del gcode_contents["drill"]
+                    if "drill" in dimensions:
+                        del dimensions["drill"]
+
+                    for tool, content in split_files.items():
+                        sub_key = f"drill_{tool}"
+                        sub_path = os.path.join(processed_dir, f"pcb_leveled_{sub_key}.gcode")
+                        write_text(sub_path, content)
+                        RESULTS.remember(sub_path, content)
+                        leveled_files[sub_key] = sub_path
+                        gcode_contents[sub_key] = content
+                        if drill_dims:
+                            dimensions[sub_key] = dict(drill_dims)
+                        
+                        # Extract Diameter
+                        actual_dia_str = transformer.extract_drill_diameter(content, tool)
+                        meta_label = actual_dia_str
+                        
+                        # Try to get requested tool info
+                        req_mm = None
+                        try:
+                            t_num = int(tool.replace('T', ''))
+                            if t_num in requested_tools:
+                                req_mm = requested_tools[t_num]
+                        except Exception:
+                            pass
+
+                        if req_mm is not None:
+                            meta_label = f"{req_mm:g}mm"
+                        
+                        tool_metadata[sub_key] = meta_label
+
+    # Direct drilling: per-tool leveled programs from the parsed hole arrays
+    if excellon is not None and "drill" not in raw_files:
+        from drilling import drill_jobs, drill_params
+        from heightmap import load_heightmap
+        with metrics.stage("drilling"):
+            jobs = drill_jobs(excellon, drill_params(), offset_x, offset_y, load_heightmap(transformer.probe_file))
+        for tool, job in jobs.items():
+            sub_key = f"drill_{tool}"
+            sub_path = os.path.join(processed_dir, f"pcb_leveled_{sub_key}.gcode")
+            write_text(sub_path, job["gcode"])
+            RESULTS.remember(sub_path, job["gcode"])
+            leveled_files[sub_key] = sub_path
+            gcode_contents[sub_key] = job["gcode"]
+            dimensions[sub_key] = job["dims"]
+            tool_metadata[sub_key] = f"{job['diameter']:g}mm" if job["diameter"] else "?"
+        metrics.count("drill", {"output_lines": sum(job["gcode"].count("\n") for job in jobs.values())})
+
+    # Cycle-time estimate per file (cut/rapid length, plunges, time)
+    with metrics.stage("estimate"):
+        from estimate import estimate_gcode, machine_limits
+        limits = machine_limits()
+        estimates = {key: estimate_gcode(content, limits) for key, content in gcode_contents.items()}
+    for key, est in estimates.items():
+        if dimensions.get(key):
+            dimensions[key]["estimate"] = est
+    total_seconds = round(sum(e["seconds"] for e in estimates.values()), 1)
+    if panel_info:
+        panel_info["estimated_seconds"] = {key: e["seconds"] for key, e in estimates.items()}
+
+    # Recommended run order (fewest tool changes, outline last)
+    from sequence import plan_jobs
+    plan = plan_jobs(tool_metadata, {key: e["seconds"] for key, e in estimates.items()})
+
+    # Generate G-code Visualization (All types)
+    images = {}
+    with metrics.stage("rendering"):
+        for key, path in leveled_files.items():
+            out_path_gc = os.path.join(workspace.dir, f"viz_gcode_{key}.png")
+            if generate_gcode_image(path, out_path_gc):
+                images[f"gcode_{key}"] = out_path_gc
+
+    # Save state for reload
+    timing = metrics.summary()
+    workspace.save_state({"config": config, "files": leveled_files, "dimensions": dimensions, "tool_metadata": tool_metadata, "filenames": filenames, "raw_paths": raw_paths, "input_hashes": input_hashes, "images": images, "config_hash": config_hash, "result_key": result_key, "cache": cache, "panel": panel_info, "estimated_seconds": total_seconds, "isolation": isolation_info, "pocketing": pocketing_info, "plan": plan, "metrics": timing})
+    workspace.prune_uploads(raw_paths.values())
+    
+    return {"status": "success", "project": workspace.id, "files": leveled_files, "gcode": gcode_contents, "dimensions": dimensions, "tool_metadata": tool_metadata, "filenames": filenames, "images": images, "input_hashes": input_hashes, "config_hash": config_hash, "panel": panel_info, "estimated_seconds": total_seconds, "isolation": isolation_info, "pocketing": pocketing_info, "plan": plan, "cached": False, "cache_hits": cache_hits, "metrics": timing}
@@ -1,42 +1,108 @@
-import os
 import gerber
-from gerber.primitives import Region, Line
+from gerber.primitives import Region
 from shapely.geometry import Polygon, LineString
+from shapely.strtree import STRtree
+import shapely
 import shapely.affinity
-import math
-import re
+import numpy as np
+from settings import load_config, parse_quantity
+from emitter import MoveBuffer, render, write_text
+
+DEFAULTS = {
+    "tool-diameter": "5.0mm",
+    "z-pocket": "-0.1mm",
+    "pocket-feed": "500mm/min",
+    "spindle-speed": "24000rpm",
+    "stepover": "0.5"
+}
+
+def merge_regions(polygons):
+    """
+    Unites overlapping or touching polygons, so every area is pocketed once.
+    Candidates come from an STRtree, groups are the connected components of the
+    intersection graph, each group is united separately.
+    Returns (merged polygons, info with counts and the removed duplicate area).
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    polygons = [p if p.is_valid else p.buffer(0) for p in polygons]
+    polygons = [p for p in polygons if not p.is_empty]
+    info = {"regions": len(polygons), "pockets": len(polygons), "duplicate_area": 0.0}
+    if len(polygons) < 2:
+        return polygons, info
+
+    tree = STRtree(polygons)
+    a, b = tree.query(polygons, predicate="intersects")
+    n = len(polygons)
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    merged = []
+    # Keep the drawing order (first polygon of each group)
+    _, first = np.unique(labels, return_index=True)
+    for label in labels[np.sort(first)]:
+        group = [polygons[i] for i in np.flatnonzero(labels == label)]
+        union = group[0] if len(group) == 1 else shapely.union_all(group)
+        merged.extend(g for g in getattr(union, "geoms", [union]) if isinstance(g, Polygon) and not g.is_empty)
+
+    total = sum(p.area for p in polygons)
+    info["pockets"] = len(merged)
+    info["duplicate_area"] = round(total - sum(p.area for p in merged), 3)
+    return merged, info
+
+def zigzag_runs(geom, stepover):
+    """
+    X-parallel zig-zag paths for a (possibly concave or holed) polygon, as runs of
+    points that can be cut without lifting. A new run starts whenever the straight
+    link to the next scan-line piece would leave the polygon (across a notch or a hole).
+    """
+    minx, miny, maxx, maxy = geom.bounds
+    # Tolerance: scan pieces end exactly on the boundary
+    reach = geom.buffer(1e-6)
+    shapely.prepare(reach)
+    runs = []
+    y = miny
+    left_to_right = True
+    while y <= maxy:
+        scan_line = LineString([(minx - 1, y), (maxx + 1, y)])
+        intersection = scan_line.intersection(geom)
+        parts = intersection.geoms if hasattr(intersection, 'geoms') else [intersection]
+        pieces = [list(part.coords) for part in parts if isinstance(part, LineString) and not part.is_empty]
+        pieces.sort(key=lambda c: min(c[0][0], c[-1][0]))
+        if not left_to_right:
+            pieces = [list(reversed(c)) for c in reversed(pieces)]
+        for coords in pieces:
+            if runs and reach.covers(LineString([runs[-1][-1], coords[0]])):
+                runs[-1].extend(coords)
+            else:
+                runs.append(coords)
+        y += stepover
+        left_to_right = not left_to_right
+    return runs
+
+def contour_rings(geom):
+    """Finishing contours: the outer boundary and the boundary of every hole."""
+    return [list(geom.exterior.coords)] + [list(ring.coords) for ring in geom.interiors]
 
 class PocketingGenerator:
     def __init__(self, config_file):
         self.config_file = config_file
 
-    def parse_config(self):
-        config = {
-            "tool-diameter": "5.0mm",
-            "z-pocket": "-0.1mm",
-            "pocket-feed": "500mm/min",
-            "spindle-speed": "24000rpm",
-            "stepover": "0.5"
-        }
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                for line in f:
-                    line = line.split('#')[0].strip()
-                    if not line or '=' not in line: continue
-                    k, v = line.split('=', 1)
-                    config[k.strip()] = v.strip()
-        return config
-
-    def generate(self, gerber_path, output_path, auto_mirror_x=False):
-        config = self.parse_config()
+    def generate(self, gerber_path, output_path, auto_mirror_x=False, merge=True):
+        """
+        Writes the pocketing G-code to output_path. Overlapping regions are united first
+        (merge=False pockets every region separately). Returns the emitter stats
+        (size, suppressed words) and the region counts / removed duplicate area.
+        """
+        cfg = load_config(self.config_file)
         
         # Parameter extrahieren
         try:
-            tool_dia = float(config.get("tool-diameter", "5.0mm").replace("mm", ""))
-            z_pocket = float(config.get("z-pocket", "-0.1mm").replace("mm", ""))
-            f_pocket = float(config.get("pocket-feed", "500mm/min").replace("mm/min", ""))
-            s_speed = int(config.get("spindle-speed", "24000rpm").replace("rpm", ""))
-            stepover_ratio = float(config.get("stepover", "0.5"))
+            tool_dia = parse_quantity(cfg.get("tool-diameter", DEFAULTS["tool-diameter"]), "mm")
+            z_pocket = parse_quantity(cfg.get("z-pocket", DEFAULTS["z-pocket"]), "mm")
+            f_pocket = parse_quantity(cfg.get("pocket-feed", DEFAULTS["pocket-feed"]), "mm/min")
+            s_speed = int(parse_quantity(cfg.get("spindle-speed", DEFAULTS["spindle-speed"]), "rpm"))
+            stepover_ratio = parse_quantity(cfg.get("stepover", DEFAULTS["stepover"]))
         except ValueError:
             tool_dia, z_pocket, f_pocket, s_speed, stepover_ratio = 5.0, -0.1, 500, 24000, 0.5
 
@@ -60,7 +126,7 @@ class PocketingGenerator:
             gcode.append(f"; Fehler beim Lesen der Gerber-Datei: {e}")
             with open(output_path, 'w') as f:
                 f.write("\n".join(gcode) + "\n")
-            return
+            return None
 
         # Polygone aus Gerber-Regionen (G36) extrahieren
         polygons = []
@@ -80,71 +146,67 @@ class PocketingGenerator:
                         
                     polygons.append(poly)
 
-        gcode.append("G0 Z2.0")
+        # Overlapping/adjacent drawings become one pocket
+        merge_info = {"regions": len(polygons), "pockets": len(polygons), "duplicate_area": 0.0}
+        if merge:
+            polygons, merge_info = merge_regions(polygons)
+        gcode.append(f"; Regions: {merge_info['regions']} -> Pockets: {merge_info['pockets']} "
+                     f"(duplicate area removed: {merge_info['duplicate_area']} mm^2)")
+
+        # Moves go through the bulk emitter (repeated G1/F and unchanged axes are left out)
+        out = MoveBuffer()
+        for line in gcode:
+            out.add_text(line)
+        out.add_move(0, z=2.0)
 
         for i, poly in enumerate(polygons):
-            gcode.append(f"\n; --- Pocket {i+1} ---")
+            out.add_text("")
+            out.add_text(f"; --- Pocket {i+1} ---")
             
             # 1. Offset nach innen (Fräserradius)
             offset_poly = poly.buffer(-tool_radius)
             
             if offset_poly.is_empty:
-                gcode.append("; Polygon zu klein für diesen Fraeser. Uebersprungen.")
+                out.add_text("; Polygon zu klein für diesen Fraeser. Uebersprungen.")
                 continue
                 
             # Falls das Polygon durch den Offset in mehrere Teile zerfällt (MultiPolygon)
             geoms = offset_poly.geoms if hasattr(offset_poly, 'geoms') else [offset_poly]
             
             for geom_idx, geom in enumerate(geoms):
-                minx, miny, maxx, maxy = geom.bounds
-                
-                # 2. X-parallele Zick-Zack Pfade berechnen
-                y = miny
-                zigzag_paths = []
-                left_to_right = True
-                
-                while y <= maxy:
-                    scan_line = LineString([(minx - 1, y), (maxx + 1, y)])
-                    intersection = scan_line.intersection(geom)
-                    
-                    if not intersection.is_empty:
-                        parts = intersection.geoms if hasattr(intersection, 'geoms') else [intersection]
-                        for part in parts:
-                            if isinstance(part, LineString):
-                                coords = list(part.coords)
-                                if not left_to_right:
-                                    coords.reverse()
-                                zigzag_paths.append(coords)
-                    
-                    y += stepover_mm
-                    left_to_right = not left_to_right
+                # 2. X-parallele Zick-Zack Pfade berechnen (Rückzug, wo die Verbindung
+                #    das Polygon verlassen würde: Einbuchtungen, Inseln)
+                runs = zigzag_runs(geom, stepover_mm)
 
                 # 3. Zick-Zack G-Code schreiben
-                if zigzag_paths:
-                    gcode.append(f"; Zig-Zag Clearing (Teil {geom_idx+1})")
-                    start_pt = zigzag_paths[0][0]
-                    gcode.append(f"G0 X{start_pt[0]:.4f} Y{start_pt[1]:.4f}")
-                    gcode.append(f"G1 Z{z_pocket:.4f} F{f_pocket}") # Eintauchen
-                    
-                    for path in zigzag_paths:
-                        gcode.append(f"G1 X{path[0][0]:.4f} Y{path[0][1]:.4f} F{f_pocket}")
-                        for pt in path[1:]:
-                            gcode.append(f"G1 X{pt[0]:.4f} Y{pt[1]:.4f} F{f_pocket}")
-                            
-                    gcode.append("G0 Z2.0") # Rückzug nach dem Zick-Zack
-
-                # 4. Innenkontur abfahren (Finishing Pass)
-                contour_coords = list(geom.exterior.coords)
-                if contour_coords:
-                    gcode.append(f"; Contour Finishing Pass (Teil {geom_idx+1})")
+                if runs:
+                    out.add_text(f"; Zig-Zag Clearing (Teil {geom_idx+1})")
+                for run in runs:
+                    out.add_move(0, run[0][0], run[0][1])
+                    out.add_move(1, z=z_pocket, f=f_pocket) # Eintauchen
+                    pts = np.array(run[1:])
+                    if len(pts):
+                        out.add_moves(1, pts[:, 0], pts[:, 1], np.nan, f=f_pocket)
+                    out.add_move(0, z=2.0) # Rückzug
+
+                # 4. Außen- und Innenkonturen abfahren (Finishing Pass)
+                for ring_idx, contour_coords in enumerate(contour_rings(geom)):
+                    if not contour_coords:
+                        continue
+                    label = "" if ring_idx == 0 else f", Insel {ring_idx}"
+                    out.add_text(f"; Contour Finishing Pass (Teil {geom_idx+1}{label})")
                     start_pt = contour_coords[0]
-                    gcode.append(f"G0 X{start_pt[0]:.4f} Y{start_pt[1]:.4f}")
-                    gcode.append(f"G1 Z{z_pocket:.4f} F{f_pocket}")
-                    for pt in contour_coords[1:]:
-                        gcode.append(f"G1 X{pt[0]:.4f} Y{pt[1]:.4f} F{f_pocket}")
-                    gcode.append("G0 Z2.0")
+                    out.add_move(0, start_pt[0], start_pt[1])
+                    out.add_move(1, z=z_pocket, f=f_pocket)
+                    pts = np.array(contour_coords[1:])
+                    if len(pts):
+                        out.add_moves(1, pts[:, 0], pts[:, 1], np.nan, f=f_pocket)
+                    out.add_move(0, z=2.0)
 
-        gcode.append("\nM5") # Spindel aus
+        out.add_text("")
+        out.add_text("M5") # Spindel aus
 
-        with open(output_path, 'w') as f:
-            f.write("\n".join(gcode) + "\n")
\ No newline at end of file
+        text, stats = render(out, precision=4)
+        write_text(output_path, text + "\n")
+        stats.update(merge_info)
+        return stats
\ No newline at end of file
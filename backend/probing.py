@@ -0,0 +1,313 @@
+import re
+import json
+import numpy as np
+
+# Synthetic surface models for simulated probe runs (Z deviation in mm).
+# u, v are the normalized coordinates (-1..1) over the probe area.
+def _wave(x, y, u, v, rng):
+    # Original simulation: sine warping of max. approx. 0.2mm and a tilt in Y
+    return 0.2 * np.sin(x / 20.0) + 0.01 * y + rng.uniform(-0.005, 0.005, x.shape)
+
+def _tilt(x, y, u, v, rng):
+    return 0.1 * u + 0.05 * v
+
+def _bow(x, y, u, v, rng):
+    # Dome, highest in the center
+    return 0.15 * (1.0 - (u ** 2 + v ** 2) / 2.0)
+
+def _twist(x, y, u, v, rng):
+    # Diagonally opposite corners bent up/down
+    return 0.1 * u * v
+
+def _noise(x, y, u, v, rng):
+    return rng.normal(0.0, 0.01, x.shape)
+
+SURFACE_MODELS = {
+    "default": _wave,
+    "tilt": _tilt,
+    "bow": _bow,
+    "twist": _twist,
+    "noise": _noise,
+}
+
+def simulate_surface(width, height, points_x, points_y, model="default", seed=None):
+    """
+    Returns (xs, ys, zs) as flat arrays for a points_x * points_y grid (row by row in Y).
+    model may combine several surface models with '+', e.g. "tilt+bow+noise".
+    """
+    names = [m.strip() for m in (model or "default").split("+") if m.strip()]
+    unknown = [m for m in names if m not in SURFACE_MODELS]
+    if unknown:
+        raise ValueError(f"Unknown surface model(s): {', '.join(unknown)}. Available: {', '.join(SURFACE_MODELS)}")
+
+    rng = np.random.default_rng(seed)
+    gx, gy = np.meshgrid(np.linspace(0, width, points_x), np.linspace(0, height, points_y))
+    u = 2.0 * gx / width - 1.0 if width else np.zeros_like(gx)
+    v = 2.0 * gy / height - 1.0 if height else np.zeros_like(gy)
+
+    gz = np.zeros_like(gx)
+    for name in names:
+        gz += SURFACE_MODELS[name](gx, gy, u, v, rng)
+    return gx.ravel(), gy.ravel(), np.round(gz.ravel(), 4)
+
+def points_to_dicts(xs, ys, zs):
+    """Converts coordinate arrays to the JSON point list format ({x, y, z})."""
+    return [{"x": x, "y": y, "z": z} for x, y, z in zip(np.asarray(xs, dtype=float).tolist(),
+                                                      np.asarray(ys, dtype=float).tolist(),
+                                                      np.asarray(zs, dtype=float).tolist())]
+
+# --- Adaptive probe planning ---
+
+_AXIS_RE = re.compile(r"([XYZ])\s*(-?\d*\.?\d+)")
+
+def read_cut_segments(gcode_path):
+    """
+    Returns the XY cut moves (G1 with XY change) of a G-code file as array (n, 4): x0, y0, x1, y1.
+    """
+    segs = []
+    x = y = 0.0
+    mode = None
+    with open(gcode_path, "r") as f:
+        for line in f:
+            code = line.split(";")[0].split("(")[0].upper()
+            if not code.strip():
+                continue
+            words = code.split()
+            if "G0" in words or "G00" in words: mode = "G0"
+            elif "G1" in words or "G01" in words: mode = "G1"
+            nx, ny = x, y
+            for axis, val in _AXIS_RE.findall(code):
+                if axis == "X": nx = float(val)
+                elif axis == "Y": ny = float(val)
+            if mode == "G1" and (nx != x or ny != y):
+                segs.append((x, y, nx, ny))
+            x, y = nx, ny
+    return np.array(segs, dtype=float).reshape(-1, 4)
+
+def sample_segments(segs, step):
+    """Samples points along segments (spacing <= step). Returns (points (n, 2), weights = represented length)."""
+    if len(segs) == 0:
+        return np.empty((0, 2)), np.empty(0)
+    d = segs[:, 2:] - segs[:, :2]
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    counts = np.maximum(1, np.ceil(lengths / step).astype(int))
+    idx = np.repeat(np.arange(len(segs)), counts)
+    # Midpoints of the sub-segments
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = (offsets + 0.5) / counts[idx]
+    pts = segs[idx, :2] + d[idx] * t[:, None]
+    return pts, lengths[idx] / counts[idx]
+
+def tour_order(points, start=(0.0, 0.0), passes=3):
+    """
+    Orders points as a short travel tour: nearest neighbour from start, improved by 2-opt.
+    Returns the index order.
+    """
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+    remaining = np.ones(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    current = np.asarray(start, dtype=float)
+    for i in range(n):
+        dist = np.hypot(points[:, 0] - current[0], points[:, 1] - current[1])
+        dist[~remaining] = np.inf
+        j = int(np.argmin(dist))
+        order[i] = j
+        remaining[j] = False
+        current = points[j]
+
+    # 2-opt (open path): reverse order[i+1..j] if it shortens the tour
+    for _ in range(passes):
+        improved = False
+        for i in range(n - 2):
+            p = points[order]
+            a, b = p[i], p[i + 1]
+            c, d = p[i + 2:], np.vstack([p[i + 3:], [[np.nan, np.nan]]])
+            old = np.hypot(*(b - a)) + np.nan_to_num(np.hypot(d[:, 0] - c[:, 0], d[:, 1] - c[:, 1]))
+            new = np.hypot(c[:, 0] - a[0], c[:, 1] - a[1]) + np.nan_to_num(np.hypot(d[:, 0] - b[0], d[:, 1] - b[1]))
+            gain = old - new
+            k = int(np.argmax(gain))
+            if gain[k] > 1e-9:
+                j = i + 2 + k
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+def path_length(points, start=(0.0, 0.0)):
+    if len(points) == 0:
+        return 0.0
+    pts = np.vstack([np.asarray(start, dtype=float), points])
+    return float(np.hypot(*np.diff(pts, axis=0).T).sum())
+
+def plan_probe_points(coverage_segs, density_segs, max_spacing=20.0, min_spacing=5.0,
+                      length_per_point=40.0, max_points=400, margin=1.0, start=(0.0, 0.0)):
+    """
+    Plans an adaptive probe point set over the toolpaths.
+
+    The toolpath area is divided into cells of max_spacing. Only cells containing cuts
+    (coverage_segs) get probe points at their corners, so every cut lies inside the
+    probed area. Cells are refined down to min_spacing depending on their cut length
+    (density_segs, approx. one point per length_per_point mm of cut).
+    Returns (points (n, 2) in tour order, info dict).
+    """
+    cov_pts, _ = sample_segments(coverage_segs, min_spacing / 2.0)
+    if len(cov_pts) == 0:
+        return np.empty((0, 2)), {"reason": "no cut moves found"}
+    den_pts, den_w = sample_segments(density_segs, min_spacing / 2.0)
+
+    min_xy = cov_pts.min(axis=0) - margin
+    max_xy = cov_pts.max(axis=0) + margin
+    size = max_xy - min_xy
+    nx, ny = (np.maximum(1, np.ceil(size / max_spacing))).astype(int)
+    x_edges = np.linspace(min_xy[0], max_xy[0], nx + 1)
+    y_edges = np.linspace(min_xy[1], max_xy[1], ny + 1)
+
+    active, _, _ = np.histogram2d(cov_pts[:, 0], cov_pts[:, 1], bins=[x_edges, y_edges])
+    active = active > 0
+    if len(den_pts):
+        cut_len, _, _ = np.histogram2d(den_pts[:, 0], den_pts[:, 1], bins=[x_edges, y_edges], weights=den_w)
+    else:
+        cut_len = np.zeros_like(active, dtype=float)
+
+    cell_w = size / np.array([nx, ny])
+    max_ref = max(1, int(np.ceil(float(min(cell_w)) / min_spacing)))
+
+    def build(lpp):
+        # Subdivision per cell: r*r points for approx. cut_len / lpp points
+        ref = np.clip(np.ceil(np.sqrt(cut_len / lpp)), 1, max_ref).astype(int)
+        pts = []
+        for i, j in zip(*np.nonzero(active)):
+            r = ref[i, j]
+            sx = np.linspace(x_edges[i], x_edges[i + 1], r + 1)
+            sy = np.linspace(y_edges[j], y_edges[j + 1], r + 1)
+            gx, gy = np.meshgrid(sx, sy)
+            pts.append(np.column_stack([gx.ravel(), gy.ravel()]))
+        pts = np.vstack(pts)
+        # Shared cell corners/edges -> deduplicate
+        return np.unique(np.round(pts, 3), axis=0)
+
+    lpp = float(length_per_point)
+    points = build(lpp)
+    while len(points) > max_points and lpp < 1e6:
+        lpp *= 1.5
+        points = build(lpp)
+
+    order = tour_order(points, start)
+    points = points[order]
+
+    # Reference: uniform grid at min_spacing over the same area (serpentine order)
+    ux = int(np.ceil(size[0] / min_spacing)) + 1
+    uy = int(np.ceil(size[1] / min_spacing)) + 1
+    info = {
+        "bounds": {"min_x": float(min_xy[0]), "max_x": float(max_xy[0]), "min_y": float(min_xy[1]), "max_y": float(max_xy[1])},
+        "cells": {"x": int(nx), "y": int(ny), "active": int(active.sum())},
+        "points": int(len(points)),
+        "travel_mm": round(path_length(points, start), 1),
+        "uniform_grid_points": ux * uy,
+        "uniform_grid_travel_mm": round(float(size[0] * uy + size[1]), 1),
+    }
+    return points, info
+
+# --- Incremental probe ingestion ---
+
+class ProbeStream:
+    """
+    Probe run that receives its points one by one (or in small batches).
+
+    The Delaunay triangulation is extended incrementally and a plane z = a*x + b*y + c
+    is fitted from running sums, so deviation stats are available after every point.
+    Points are appended to a JSON lines file, so an aborted run keeps its data.
+    """
+    def __init__(self, config, partial_file, write_header=True):
+        self.config = config
+        self.partial_file = partial_file
+        self.xy = []
+        self.z = []
+        self.tri = None
+        self._tri_count = 0 # Points already inserted into the triangulation
+        self._ata = np.zeros((3, 3))
+        self._atz = np.zeros(3)
+        self.status = "running"
+        if write_header:
+            with open(partial_file, "w") as f:
+                f.write(json.dumps({"config": config}) + "\n")
+
+    @classmethod
+    def resume(cls, partial_file):
+        """Restores a stream from its partial file (e.g. after a restart or an aborted run)."""
+        with open(partial_file, "r") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or "config" not in lines[0]:
+            return None
+        stream = cls(lines[0]["config"], partial_file, write_header=False)
+        stream.status = "aborted"
+        stream._ingest([(p["x"], p["y"], p["z"]) for p in lines[1:]])
+        return stream
+
+    def add(self, points):
+        """Adds points [(x, y, z), ...] and persists them."""
+        with open(self.partial_file, "a") as f:
+            for x, y, z in points:
+                f.write(json.dumps({"x": x, "y": y, "z": z}) + "\n")
+        self._ingest(points)
+
+    def _ingest(self, points):
+        if not points:
+            return
+        arr = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.xy.extend(arr[:, :2].tolist())
+        self.z.extend(arr[:, 2].tolist())
+        a = np.column_stack([arr[:, 0], arr[:, 1], np.ones(len(arr))])
+        self._ata += a.T @ a
+        self._atz += a.T @ arr[:, 2]
+        self._update_triangulation()
+
+    def _update_triangulation(self):
+        from scipy.spatial import Delaunay, QhullError
+        if self.tri is None:
+            if len(self.xy) < 3:
+                return
+            try:
+                # Fails as long as all points are collinear (e.g. the first grid row)
+                self.tri = Delaunay(np.array(self.xy), incremental=True)
+                self._tri_count = len(self.xy)
+            except QhullError:
+                return
+        elif len(self.xy) > self._tri_count:
+            self.tri.add_points(np.array(self.xy[self._tri_count:]))
+            self._tri_count = len(self.xy)
+
+    def plane(self):
+        """Least-squares plane (a, b, c) or None if not determined yet."""
+        if len(self.z) < 3 or np.linalg.matrix_rank(self._ata) < 3:
+            return None
+        return np.linalg.solve(self._ata, self._atz)
+
+    def stats(self):
+        info = {"status": self.status, "count": len(self.z), "ready": self.tri is not None, "plane": None}
+        coeffs = self.plane()
+        if coeffs is not None:
+            xy = np.array(self.xy)
+            residual = np.array(self.z) - (xy @ coeffs[:2] + coeffs[2])
+            info["plane"] = {"a": float(coeffs[0]), "b": float(coeffs[1]), "c": float(coeffs[2])}
+            info["deviation"] = {
+                "max": float(np.max(np.abs(residual))),
+                "rms": float(np.sqrt(np.mean(residual ** 2))),
+                "last": float(residual[-1]),
+            }
+        return info
+
+    def result(self):
+        """Probe result in the probe_result.json format."""
+        return {"config": self.config, "points": [{"x": x, "y": y, "z": z} for (x, y), z in zip(self.xy, self.z)]}
+
+    def heightmap(self):
+        """Heightmap on the incrementally built triangulation (no re-triangulation)."""
+        from heightmap import Heightmap
+        if self.tri is None:
+            return None
+        n = self._tri_count
+        return Heightmap(np.array(self.xy[:n]), np.array(self.z[:n]), tri=self.tri)
@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from estimate import parse_moves, estimate_moves, machine_limits
+
+# Restart programs for interrupted jobs (e.g. broken bit halfway through the traces).
+# The cut segments of a leveled file are indexed with a KD-tree over their midpoints;
+# the restart point is the nearest segment to an XY location or the first cut at/after
+# a line number. Everything before it is skipped.
+
+_COMMENT_RE = re.compile(r"\([^)\n]*\)|;[^\n]*")
+_SPINDLE_RE = re.compile(r"\bS\s*(\d*\.?\d+)")
+_M_RE = re.compile(r"\bM\s*0*(\d+)")
+_DWELL_RE = re.compile(r"\bG0*4\s*P\s*(\d*\.?\d+)")
+_UNITS_RE = re.compile(r"\bG\s*(20|21)\b")
+_MOTION_RE = re.compile(r"\bG\s*0*[0-3]\b")
+
+_index_cache = {}
+MAX_CACHED_INDEXES = 16
+_index_lock = threading.Lock()
+
+class ToolpathIndex:
+    def __init__(self, text, stamp=None):
+        self.stamp = stamp
+        self.lines = text.split("\n")
+        self.moves, _ = parse_moves(text)
+        m = self.moves
+        # Segment k ends at move cuts[k] and starts at the move before it
+        self.cuts = np.flatnonzero(m["mode"][1:] != 0) + 1
+        x0, y0 = m["x"][self.cuts - 1], m["y"][self.cuts - 1]
+        x1, y1 = m["x"][self.cuts], m["y"][self.cuts]
+        self.segments = np.column_stack([x0, y0, x1, y1])
+        self.tree = None
+        if len(self.cuts):
+            self.tree = cKDTree(np.column_stack([(x0 + x1) / 2.0, (y0 + y1) / 2.0]))
+            self.max_half_length = float(np.hypot(x1 - x0, y1 - y0).max()) / 2.0
+
+    def nearest(self, x, y):
+        """Move index of the cut segment closest to (x, y) and its distance."""
+        if self.tree is None:
+            return None, None
+        # Every segment within (nearest midpoint + half the longest segment) is a candidate
+        d0, _ = self.tree.query([x, y])
+        cand = np.array(sorted(self.tree.query_ball_point([x, y], d0 + self.max_half_length + 1e-9)))
+        seg = self.segments[cand]
+        d = seg[:, 2:] - seg[:, :2]
+        len2 = (d * d).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(((x - seg[:, 0]) * d[:, 0] + (y - seg[:, 1]) * d[:, 1]) / len2, 0.0, 1.0)
+        t = np.nan_to_num(t)
+        dist = np.hypot(seg[:, 0] + t * d[:, 0] - x, seg[:, 1] + t * d[:, 1] - y)
+        # Equal distance (e.g. two passes over the same spot): the earlier one, so nothing is skipped
+        k = int(np.flatnonzero(dist <= dist.min() + 1e-6)[0])
+        return int(self.cuts[cand[k]]), float(dist[k])
+
+    def at_line(self, line):
+        """Move index of the first cut on or after line (1-based, as shown in the editor)."""
+        k = np.searchsorted(self.moves["line"][self.cuts], line - 1)
+        return int(self.cuts[k]) if k < len(self.cuts) else None
+
+    def restart(self, i, title=""):
+        """
+        Restart program from cut move i: retract, spindle and feed state, rapid to the
+        start of the segment, plunge to its (leveled) Z, then the rest of the file.
+        Returns (gcode, info).
+        """
+        m = self.moves
+        p = i - 1
+        start_line = int(m["line"][i])
+        prefix = [_COMMENT_RE.sub("", l) for l in self.lines[:start_line]]
+        raw_prefix = self.lines[:start_line]
+
+        # Modal state from the skipped part
+        spindle, spindle_on, dwell, units = None, False, 1.0, "G21"
+        for l in prefix:
+            s = _SPINDLE_RE.search(l)
+            if s:
+                spindle = s.group(1)
+            for code in _M_RE.findall(l):
+                if code in ("3", "4"):
+                    spindle_on = code
+                elif code == "5":
+                    spindle_on = False
+            d = _DWELL_RE.search(l)
+            if d and float(d.group(1)) > 0:
+                dwell = float(d.group(1))
+            u = _UNITS_RE.search(l)
+            if u:
+                units = "G" + u.group(1)
+        messages = [l.strip() for l in raw_prefix if l.strip().upper().startswith("(MSG")]
+
+        # Retract height: the last rapid level before the restart point
+        z = m["z"]
+        rapid = np.flatnonzero((m["mode"][:i] == 0) & (z[:i] >= 0))
+        z_safe = float(z[rapid[-1]]) if len(rapid) else float(z.max())
+        z_safe = max(z_safe, float(z[p]))
+        # Plunge feed: the last pure Z feed move before the restart point
+        xy = np.hypot(np.diff(m["x"][:i + 1]), np.diff(m["y"][:i + 1]))
+        dz = np.diff(z[:i + 1])
+        plunges = np.flatnonzero((m["mode"][1:i + 1] != 0) & (xy < 1e-6) & (dz < 0)) + 1
+        plunge_feed = float(m["f"][plunges[-1]]) if len(plunges) else float(m["f"][i])
+
+        out = [f"( pcb-bridge resume{': ' + title if title else ''} from line {start_line + 1} )"]
+        out += messages[-1:]
+        out += ["G94", units, "G90", f"G0 Z{z_safe:.4f}"]
+        if spindle_on:
+            out.append(f"{'S' + spindle + ' ' if spindle else ''}M{spindle_on}")
+            out.append(f"G04 P{dwell:.5f}")
+        out.append(f"G0 X{m['x'][p]:.4f} Y{m['y'][p]:.4f}")
+        out.append(f"G1 Z{z[p]:.4f} F{plunge_feed:.5f}")
+        out.append(f"F{m['f'][i]:.5f}")
+        first = self.lines[start_line]
+        if not _MOTION_RE.search(_COMMENT_RE.sub("", first)) and m["mode"][i] != 1:
+            first = f"G{int(m['mode'][i])} " + first
+        out.append(first)
+        out += self.lines[start_line + 1:]
+
+        limits = machine_limits()
+        remaining = estimate_moves({k: v[p:] for k, v in m.items()}, 0.0, limits)
+        total = estimate_moves(m, 0.0, limits)
+        info = {
+            "line": start_line + 1,
+            "x": round(float(m["x"][p]), 4),
+            "y": round(float(m["y"][p]), 4),
+            "z": round(float(z[p]), 4),
+            "z_safe": round(z_safe, 4),
+            "skipped_lines": start_line,
+            "remaining_seconds": remaining["seconds"],
+            "skipped_seconds": round(max(total["seconds"] - remaining["seconds"], 0.0), 1),
+            "remaining_cut_length": remaining["cut_length"],
+        }
+        return "\n".join(out), info
+
+def load_index(path):
+    """Index for a G-code file, cached per file modification time."""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+    with open(path, "r") as f:
+        index = ToolpathIndex(f.read(), stamp)
+    with _index_lock:
+        _index_cache[path] = index
+        while len(_index_cache) > MAX_CACHED_INDEXES:
+            _index_cache.pop(next(iter(_index_cache)))
+    return index
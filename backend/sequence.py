@@ -0,0 +1,114 @@
+import re
+from settings import machine_config, pcb_config, parse_quantity
+
+# Job sequencing: the processed files (traces, user_drawings, outline, drill_Txx) are
+# put into a run order with as few manual tool changes as possible. Jobs that use the
+# same tool (same kind and diameter from tool_metadata) run back to back, the outline
+# always comes last because it frees the board. Optionally the files are merged into
+# one program with a pause at every remaining tool change.
+
+# Usual order of the machining steps (tie-break between tool groups)
+STEP_PRIORITY = {"traces": 0, "user_drawings": 1, "drill": 2, "outline": 3}
+# Layers that have to run at the very end
+LAST_LAYERS = ("outline",)
+# Order of the buttons in ProcessGerber.js (the order operators used so far)
+MACRO_ORDER = {"traces": 1, "user_drawings": 2, "outline": 3, "drill": 4}
+
+_PROGRAM_END_RE = re.compile(r"^\s*M0*(2|30)(?!\d)", re.IGNORECASE)
+_MSG_RE = re.compile(r"\(\s*MSG\s*,", re.IGNORECASE)
+
+def tool_change_seconds():
+    """Time for one manual tool change incl. re-zeroing (config/machine.conf: tool-change-time)."""
+    return machine_config().get_float("tool-change-time", 120.0)
+
+def layer_step(key):
+    return "drill" if key.startswith("drill") else key
+
+def tool_diameter(label):
+    """Diameter in mm from a tool_metadata label ("0.8mm", "0.2", "0.1mm,0.2mm"), None if unknown."""
+    try:
+        return parse_quantity(str(label).split(",")[0], "mm")
+    except (TypeError, ValueError):
+        return None
+
+def _tool_id(key, label):
+    """Jobs with equal id share the tool. Unknown diameters never share."""
+    diameter = tool_diameter(label)
+    if diameter is None:
+        return ("job", key)
+    return ("drill" if layer_step(key) == "drill" else "mill", round(diameter, 3))
+
+def _count_changes(order, tools):
+    return sum(1 for a, b in zip(order, order[1:]) if tools[a] != tools[b])
+
+def macro_order(keys):
+    """Order in which ProcessGerber.js lists the layers."""
+    return sorted(keys, key=lambda k: (MACRO_ORDER.get(k, 4), k))
+
+def plan_jobs(tool_metadata, seconds, change_seconds=None, order=None):
+    """
+    Recommended run order for the processed files (or the evaluation of a given order).
+    tool_metadata: {key: diameter label}, seconds: {key: estimated machining time}.
+    Returns order, tool groups, number of tool changes (compared to the macro order)
+    and the estimated total time including the tool changes.
+    """
+    change_seconds = tool_change_seconds() if change_seconds is None else change_seconds
+    keys = list(seconds)
+    tools = {k: _tool_id(k, tool_metadata.get(k)) for k in keys}
+
+    groups = {}
+    for key in keys:
+        groups.setdefault(tools[key], []).append(key)
+    for members in groups.values():
+        members.sort(key=lambda k: (k in LAST_LAYERS, STEP_PRIORITY.get(layer_step(k), 2), k))
+
+    def group_rank(item):
+        tool, members = item
+        diameter = tool[1] if tool[0] != "job" else float("inf")
+        return (any(k in LAST_LAYERS for k in members),
+                min(STEP_PRIORITY.get(layer_step(k), 2) for k in members), diameter)
+
+    ordered = sorted(groups.items(), key=group_rank)
+    if order is None:
+        order = [k for _, members in ordered for k in members]
+    changes = _count_changes(order, tools)
+    default = macro_order(keys)
+    default_changes = _count_changes(default, tools)
+    machining = sum(seconds.values())
+    return {
+        "order": order,
+        "groups": [{"tool": tool_metadata.get(members[0], "?"), "kind": tool[0], "jobs": members}
+                   for tool, members in ordered],
+        "tool_changes": changes,
+        "default_order": default,
+        "default_tool_changes": default_changes,
+        "tool_change_seconds": change_seconds,
+        "machining_seconds": round(machining, 1),
+        "total_seconds": round(machining + changes * change_seconds, 1),
+        "saved_seconds": round(max(0, default_changes - changes) * change_seconds, 1),
+    }
+
+def merge_program(plan, gcode_contents, tool_metadata):
+    """
+    One program in plan order. Program ends between the jobs are removed; at every
+    tool change the spindle stops, Z goes to zchange and M0 waits for the operator.
+    Prompts of jobs that keep the tool become plain comments.
+    """
+    z_change = pcb_config().get_length("zchange", 20.0)
+    order = [k for k in plan["order"] if gcode_contents.get(k)]
+    out = [f"( pcb-bridge job plan: {', '.join(order)} | {plan['tool_changes']} tool changes )"]
+    previous = None
+    for n, key in enumerate(order):
+        tool = _tool_id(key, tool_metadata.get(key))
+        lines = gcode_contents[key].splitlines()
+        if n < len(order) - 1:
+            lines = [line for line in lines if not _PROGRAM_END_RE.match(line)]
+        if previous is not None and tool != previous:
+            out += [f"G0 Z{z_change:.4f}", "M5",
+                    f"(MSG, Change tool for {key}: {tool_metadata.get(key, '?')} - re-zero Z, then resume)", "M0"]
+        elif previous is not None:
+            lines = [_MSG_RE.sub("(", line) for line in lines]
+        out.append(f"( ---- {key} ---- )")
+        out += lines
+        previous = tool
+    return "\n".join(out) + "\n"
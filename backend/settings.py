@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+
+# Determine project root (config/ lives next to backend/, or next to the frozen EXE)
+if getattr(sys, 'frozen', False):
+    PROJECT_ROOT = os.path.dirname(sys.executable)
+else:
+    PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(PROJECT_ROOT, "config")
+PCB2GCODE_CONF = os.path.join(CONFIG_DIR, "pcb2gcode.conf")
+USER_DRAWINGS_CONF = os.path.join(CONFIG_DIR, "user_drawings.conf")
+MACHINE_CONF = os.path.join(CONFIG_DIR, "machine.conf")
+DRILLING_CONF = os.path.join(CONFIG_DIR, "drilling.conf")
+
+# Known unit suffixes, longest first so "mm/min" wins over "mm"
+UNITS = ("mm/s^2", "mm/min", "mm/s", "rpm", "mm")
+
+def parse_quantity(value, unit=None):
+    """
+    Parses a config value like "0.2mm", "500mm/min" or "24000rpm" into a float.
+    If unit is given, only that suffix is accepted.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    suffixes = (unit,) if unit else UNITS
+    for suffix in suffixes:
+        if text.lower().endswith(suffix):
+            text = text[:-len(suffix)].strip()
+            break
+    return float(text)
+
+class ConfigFile:
+    """
+    Parsed view of one key=value config file (pcb2gcode.conf style).
+    Lines without '=' are treated as flags, '#' starts a comment.
+    """
+    def __init__(self, path, values=None, flags=None, mtime=None):
+        self.path = path
+        self.values = values or {}
+        self.flags = flags or []
+        self.mtime = mtime
+
+    @classmethod
+    def parse(cls, path):
+        values = {}
+        flags = []
+        mtime = None
+        if os.path.exists(path):
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    line = line.split('#')[0].strip()
+                    if not line: continue
+                    if '=' in line:
+                        k, v = line.split('=', 1)
+                        values[k.strip()] = v.strip()
+                    elif line not in flags:
+                        flags.append(line)
+        return cls(path, values, flags, mtime)
+
+    def get(self, key, default="?"):
+        """Returns the raw string value."""
+        return self.values.get(key, default)
+
+    def get_float(self, key, default=0.0, unit=None):
+        """Returns the value as float, stripping a unit suffix. Falls back to default."""
+        raw = self.values.get(key)
+        if raw is None:
+            return default
+        try:
+            return parse_quantity(raw, unit)
+        except ValueError:
+            return default
+
+    def get_length(self, key, default=0.0):
+        return self.get_float(key, default, "mm")
+
+    def get_feed(self, key, default=0.0):
+        return self.get_float(key, default, "mm/min")
+
+    def get_rpm(self, key, default=0):
+        return int(self.get_float(key, default, "rpm"))
+
+    def get_bool(self, key, default=False):
+        raw = self.values.get(key)
+        if raw is None:
+            return key in self.flags or default
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+
+    def params_hash(self):
+        """Stable hash of the effective parameters (independent of comments and ordering)."""
+        payload = json.dumps({"values": self.values, "flags": sorted(self.flags)}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_config(path):
+    """
+    Returns the parsed ConfigFile for path. Results are cached per file mtime,
+    so repeated lookups within and across requests do not touch the disk again.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached.mtime == mtime:
+            return cached
+    parsed = ConfigFile.parse(path)
+    with _cache_lock:
+        _cache[path] = parsed
+    return parsed
+
+def pcb_config():
+    return load_config(PCB2GCODE_CONF)
+
+def ud_config():
+    return load_config(USER_DRAWINGS_CONF)
+
+def machine_config():
+    return load_config(MACHINE_CONF)
+
+def drill_config():
+    return load_config(DRILLING_CONF)
+
+def effective_hash(*configs, extra=None):
+    """Combined hash over several configs (+ optional request parameters) for cache keys."""
+    h = hashlib.sha256()
+    for cfg in configs:
+        h.update(cfg.params_hash().encode())
+    if extra:
+        h.update(json.dumps(extra, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
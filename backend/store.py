@@ -0,0 +1,176 @@
+import os
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+# Process-wide result store: the latest process states, G-code file contents and
+# derived data (probe viz G-code) stay in memory, so /process/latest and
+# /probe/latest are lookups instead of reading and parsing files on every call.
+# Values loaded from a file are valid while the file's mtime/size are unchanged.
+# Values put into the store are authoritative and written to disk by a background
+# thread (latest version per file wins). Entries are evicted least recently used
+# beyond the size cap; nothing is loaded before it is first asked for.
+
+RESULT_CACHE_MB = float(os.environ.get("PCB_BRIDGE_RESULT_CACHE_MB", "64"))
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+class ResultStore:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # path -> [value, size, stamp]; stamp None = written by the store
+        self._pending = {}            # path -> text waiting to be written
+        self._writing = set()         # paths handed to the writer, not yet on disk
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._io_lock = threading.Lock()
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # --- memory ---
+    def _insert(self, path, value, size, stamp):
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[path] = [value, size, stamp]
+        self._bytes += size
+        # Evict least recently used entries that are already on disk
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes or key == path:
+                break
+            if key in self._pending or key in self._writing:
+                continue
+            self._bytes -= self._entries.pop(key)[1]
+
+    def load(self, path, loader=read_text):
+        """
+        Value for path: from memory, or loader(path) when the file changed since it
+        was cached. None if the file does not exist.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and (path in self._pending or path in self._writing):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[0]
+            stamp = file_stamp(path)
+            if entry is not None and stamp is not None and entry[2] == stamp:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        if stamp is None:
+            self.discard(path)
+            return None
+        value = loader(path)
+        with self._lock:
+            if path not in self._pending and path not in self._writing:
+                self._insert(path, value, stamp[1], stamp)
+        return value
+
+    def remember(self, path, value, size=None):
+        """Caches value for a file that was just written (no read back)."""
+        stamp = file_stamp(path)
+        if stamp is None:
+            return
+        with self._lock:
+            if path not in self._pending and path not in self._writing:
+                self._insert(path, value, size if size is not None else stamp[1], stamp)
+
+    def put_json(self, path, value):
+        """Stores a JSON document now; it is written to path in the background."""
+        text = json.dumps(value, indent=2)
+        with self._lock:
+            self._insert(path, copy.deepcopy(value), len(text), None)
+            self._pending[path] = text
+            self._start_writer()
+            self._changed.notify_all()
+
+    def discard(self, path):
+        """Forgets path (memory and pending write), the file itself is kept."""
+        with self._lock:
+            self._pending.pop(path, None)
+            self._writing.discard(path)
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def delete(self, path):
+        """Forgets path and removes the file."""
+        self.discard(path)
+        with self._io_lock:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def discard_tree(self, directory):
+        """Forgets every entry below directory (before the directory is removed)."""
+        prefix = os.path.join(os.path.abspath(directory), "")
+        with self._lock:
+            paths = [p for p in set(self._entries) | set(self._pending) if os.path.abspath(p).startswith(prefix)]
+        for path in paths:
+            self.discard(path)
+
+    # --- write-behind ---
+    def _start_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="result-store-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._changed.wait()
+                path, text = self._pending.popitem()
+                self._writing.add(path)
+            with self._io_lock:
+                with self._lock:
+                    # Deleted or replaced in the meantime
+                    if path not in self._writing or path in self._pending:
+                        self._writing.discard(path)
+                        self._changed.notify_all()
+                        continue
+                try:
+                    tmp = path + ".tmp"
+                    with open(tmp, "w") as f:
+                        f.write(text)
+                    os.replace(tmp, path)
+                    self.writes += 1
+                except OSError as e:
+                    print(f"Result store: writing {path} failed: {e}")
+                with self._lock:
+                    self._writing.discard(path)
+                    entry = self._entries.get(path)
+                    if entry is not None and path not in self._pending:
+                        entry[2] = file_stamp(path)
+                    self._changed.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Waits until all pending writes are on disk. Returns False on timeout."""
+        with self._lock:
+            return self._changed.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "pending_writes": len(self._pending) + len(self._writing),
+                    "hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+RESULTS = ResultStore(int(RESULT_CACHE_MB * 1024 * 1024))
@@ -0,0 +1,183 @@
+import re
+import math
+import numpy as np
+from settings import machine_config
+from estimate import parse_moves, machine_limits
+
+# Offline model of streaming a file to a GRBL-style controller: lines arrive over the
+# serial link (baud rate + per-line parse time), wait for a free slot in the planner
+# buffer and are executed with trapezoidal acceleration. The planner only knows the
+# blocks already in its buffer and must be able to stop at the end of the last one,
+# so many short segments arriving slower than they are executed pull the speed down
+# (planner starvation) or let the buffer run empty (stalls). Junction speeds follow
+# GRBL's junction deviation formula.
+
+_COMMENT_RE = re.compile(r"\([^)\n]*\)|;[^\n]*")
+
+def controller_params():
+    """Controller model from config/machine.conf (GRBL defaults where not set)."""
+    cfg = machine_config()
+    limits = machine_limits()
+    return {
+        "baud": cfg.get_float("baud-rate", 115200.0),
+        "planner_blocks": int(cfg.get_float("planner-blocks", 15)),
+        "junction_deviation": cfg.get_length("junction-deviation", 0.01),
+        "line_seconds": cfg.get_float("line-process-time", 1.0) / 1000.0,
+        "acceleration": limits["acceleration"],
+        "rapid_xy": limits["rapid_xy"],
+        "rapid_z": limits["rapid_z"],
+        "default_feed": limits["default_feed"],
+    }
+
+def line_bytes(text):
+    """Bytes sent per line: comments stripped like the sender does, newline included, 0 for empty lines."""
+    n = np.array([len(line.strip()) for line in _COMMENT_RE.sub("", text).split("\n")])
+    return n + (n > 0)
+
+def _block_seconds(length, v_in, v_out, v_nom, accel):
+    """Time of one block with a trapezoidal (or triangular) speed profile."""
+    v_peak = min(v_nom, math.sqrt(max(0.0, (2.0 * accel * length + v_in * v_in + v_out * v_out) / 2.0)))
+    v_peak = max(v_peak, v_in, v_out, 1e-9)
+    ramp = (2.0 * v_peak * v_peak - v_in * v_in - v_out * v_out) / (2.0 * accel)
+    cruise = max(0.0, length - ramp)
+    return (v_peak - v_in) / accel + (v_peak - v_out) / accel + cruise / v_peak
+
+def _run(length, v_nom2, v_junction2, arrive_serial, params):
+    """
+    Steps through the blocks. arrive_serial[i] is the serial + parse time of block i
+    (None = unlimited stream). Returns (seconds per block, idle gaps, buffer fill).
+    """
+    n = len(length)
+    accel = params["acceleration"]
+    depth = params["planner_blocks"]
+    length_l = length.tolist()
+    v_nom2_l = v_nom2.tolist()
+    vj2_l = v_junction2.tolist()
+    serial_l = arrive_serial.tolist() if arrive_serial is not None else None
+
+    enter = [0.0] * n   # block is in the planner buffer
+    done = [0.0] * n    # block finished
+    seconds = [0.0] * n
+    idle = [0.0] * n
+    fill = [0] * n
+    received = 0.0
+    known = 0           # enter[] is computed for blocks < known
+    v_prev = 0.0
+
+    def admit(k):
+        nonlocal received
+        if serial_l is None:
+            enter[k] = done[k - depth] if k >= depth else 0.0
+            return
+        # Next line is read once the previous one left the receive buffer
+        received = max(received, enter[k - 1] if k else 0.0) + serial_l[k]
+        enter[k] = max(received, done[k - depth] if k >= depth else 0.0)
+
+    for i in range(n):
+        if known <= i:
+            admit(i)
+            known = i + 1
+        previous_done = done[i - 1] if i else enter[0]
+        start = max(previous_done, enter[i])
+        if i:
+            idle[i] = start - previous_done
+        # Planner sees the blocks that arrive while this one runs (at nominal speed)
+        horizon = start + length_l[i] / math.sqrt(v_nom2_l[i])
+        last = i
+        while last + 1 < n and last + 1 < i + depth:
+            if known <= last + 1:
+                admit(last + 1)
+                known = last + 2
+            if enter[last + 1] > horizon:
+                break
+            last += 1
+        fill[i] = last - i + 1
+        # Backward pass: stop at the end of the last known block
+        v2 = 0.0
+        for k in range(last, i, -1):
+            v2 = min(vj2_l[k], v_nom2_l[k], v2 + 2.0 * accel * length_l[k])
+        v_in = v_prev
+        v_out = math.sqrt(min(v2, v_in * v_in + 2.0 * accel * length_l[i]))
+        seconds[i] = _block_seconds(length_l[i], v_in, v_out, math.sqrt(v_nom2_l[i]), accel)
+        done[i] = start + seconds[i]
+        v_prev = v_out
+    return np.array(seconds), np.array(idle), np.array(fill)
+
+def simulate_stream(text, params=None):
+    """
+    Streams a G-code string through the controller model. Returns commanded vs achieved
+    cut feed, simulated time, stall time (planner empty) and the time lost against an
+    unlimited stream.
+    """
+    params = params or controller_params()
+    moves, dwell = parse_moves(text, params["default_feed"])
+    sent = line_bytes(text)
+    report = {"moves": 0, "lines": int((sent > 0).sum()), "bytes": int(sent.sum()),
+              "serial_seconds": 0.0, "seconds": round(dwell, 1), "unlimited_seconds": round(dwell, 1),
+              "starvation_seconds": 0.0, "stall_seconds": 0.0, "stalls": 0,
+              "commanded_feed": 0.0, "achieved_feed": 0.0, "feed_ratio": 1.0,
+              "slow_cut_moves": 0, "avg_planner_blocks": 0.0}
+    if not len(moves["x"]):
+        return report
+
+    # Serial time of every line up to each move (non-motion lines travel along)
+    cum_bytes = np.cumsum(sent)
+    cum_lines = np.cumsum(sent > 0)
+    serial = np.diff(cum_bytes[moves["line"]] / (params["baud"] / 10.0)
+                     + cum_lines[moves["line"]] * params["line_seconds"], prepend=0.0)
+
+    x, y, z = moves["x"], moves["y"], moves["z"]
+    delta = np.column_stack([np.diff(x, prepend=x[0]), np.diff(y, prepend=y[0]), np.diff(z, prepend=z[0])])
+    length = np.sqrt((delta * delta).sum(axis=1))
+    # Zero-length moves are dropped by the controller, their serial time stays
+    keep = length > 1e-9
+    serial = np.diff(np.concatenate([[0.0], np.cumsum(serial)[keep]]))
+    delta, length = delta[keep], length[keep]
+    rapid = moves["mode"][keep] == 0
+    feed = moves["f"][keep]
+    if not len(length):
+        return report
+
+    # Nominal speed [mm/s]: feed for cuts, rapid rate for G0 (Z limited by its own rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_limit = np.where(np.abs(delta[:, 2]) > 1e-9, params["rapid_z"] * length / np.abs(delta[:, 2]), np.inf)
+    v_nom = np.maximum(np.where(rapid, np.minimum(params["rapid_xy"], z_limit), feed) / 60.0, 1e-3)
+
+    # Junction deviation: v^2 = a * d * sin(theta/2) / (1 - sin(theta/2))
+    unit = delta / length[:, None]
+    cos_theta = -np.einsum("ij,ij->i", unit[1:], unit[:-1])
+    sin_half = np.sqrt(np.clip(0.5 * (1.0 - cos_theta), 0.0, 1.0))
+    with np.errstate(divide="ignore"):
+        vj2 = np.where(sin_half < 1.0 - 1e-9,
+                       params["acceleration"] * params["junction_deviation"] * sin_half / (1.0 - sin_half), np.inf)
+    vj2 = np.minimum(vj2, np.minimum(v_nom[1:], v_nom[:-1]) ** 2)
+    v_junction2 = np.concatenate([[0.0], vj2])
+
+    seconds, idle, fill = _run(length, v_nom ** 2, v_junction2, serial, params)
+    unlimited, _, _ = _run(length, v_nom ** 2, v_junction2, None, params)
+    cut = ~rapid
+    cut_length = float(length[cut].sum())
+    cut_seconds = float(seconds[cut].sum())
+    commanded = cut_length / float((length[cut] / v_nom[cut]).sum()) * 60.0 if cut_length else 0.0
+    achieved = cut_length / cut_seconds * 60.0 if cut_seconds else 0.0
+    stalled = idle > 1e-6
+    total = float(seconds.sum() + idle.sum()) + dwell
+    report.update({
+        "moves": int(len(length)),
+        "serial_seconds": round(float(serial.sum()), 1),
+        "seconds": round(total, 1),
+        "unlimited_seconds": round(float(unlimited.sum()) + dwell, 1),
+        "starvation_seconds": round(total - float(unlimited.sum()) - dwell, 1),
+        "stall_seconds": round(float(idle.sum()), 2),
+        "stalls": int(stalled.sum()),
+        "commanded_feed": round(commanded, 1),
+        "achieved_feed": round(achieved, 1),
+        "feed_ratio": round(achieved / commanded, 3) if commanded else 1.0,
+        "slow_cut_moves": int((cut & (length / np.maximum(seconds, 1e-12) < 0.9 * v_nom)).sum()),
+        "avg_planner_blocks": round(float(fill.mean()), 1),
+    })
+    return report
+
+def simulate_file(path, params=None):
+    with open(path, "r") as f:
+        return simulate_stream(f.read(), params)
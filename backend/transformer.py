@@ -1,14 +1,15 @@
 import os
 import subprocess
-import json
 import numpy as np
-from scipy.interpolate import griddata
 import platform
 import sys
 import re
+from settings import load_config, PCB2GCODE_CONF
+from heightmap import load_heightmap
+from emitter import MoveBuffer, render
 
 class PcbTransformer:
-    def __init__(self, data_dir=None):
+    def __init__(self, data_dir=None, probe_file=None):
         # Determine paths (relative to project root)
         # transformer.py is in backend/, so we go one level up
         
@@ -20,9 +21,13 @@ class PcbTransformer:
             project_root = os.path.dirname(base_dir)
             self.data_dir = data_dir if data_dir else os.path.join(base_dir, "data")
             
-        self.probe_file = os.path.join(self.data_dir, "probe_result.json")
+        # Project workspaces keep their own data_dir but share the probe data
+        self.probe_file = probe_file or os.path.join(self.data_dir, "probe_result.json")
         
-        if platform.system() == "Windows":
+        if os.environ.get("PCB2GCODE_BIN"):
+            # Explicit override (e.g. a wrapper script or the benchmark stand-in)
+            self.pcb2gcode_bin = os.environ["PCB2GCODE_BIN"]
+        elif platform.system() == "Windows":
             # Windows: Check for .bat/.cmd wrapper if available, else .exe
             self.pcb2gcode_bin = os.path.join(project_root, "bin", "pcb2gcode.exe") # Default Fallback
             for ext in ["bat", "cmd", "exe"]:
@@ -33,7 +38,7 @@ class PcbTransformer:
         else:
             self.pcb2gcode_bin = os.path.join(project_root, "bin", "pcb2gcode")
             
-        self.config_file = os.path.join(project_root, "config", "pcb2gcode.conf")
+        self.config_file = PCB2GCODE_CONF
 
     def run_pcb2gcode(self, traces_gerber, outline_gerber, drill_gerber, config):
         """
@@ -49,27 +54,7 @@ class PcbTransformer:
             cmd = ["pcb2gcode"] # Fallback to System PATH
             
         # Collect parameters (Dict to avoid duplicates)
-        params = {}
-        flags = set()
-        
-        # 1. Load config file
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                for line in f:
-                    line = line.split('#')[0].strip()
-                    if not line: continue
-                    
-                    if '=' in line:
-                        k, v = line.split('=', 1)
-                        params[k.strip()] = v.strip()
-                    else:
-                        flags.add(line)
-
-        # 2. Remove ignored keys (Input/Output is set manually)
-        ignore_keys = {"front", "back", "outline", "drill", "front-output", "back-output", "outline-output", "drill-output", "output-dir"}
-        
-        for k in ignore_keys:
-            params.pop(k, None)
+        params, flags = self.config_params()
             
         # 6. Assemble command
         for k, v in params.items():
@@ -101,46 +86,60 @@ class PcbTransformer:
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"pcb2gcode failed: {e.stderr.decode()}")
             
-        # Prepare log params for header
-        log_params = params.copy()
-        for f in flags:
-            log_params[f] = "True (Flag)"
-            
         # Rückgabe der generierten Dateipfade
         return {
             "traces": os.path.join(output_dir, "pcb_project_traces.gcode"),
             "outline": os.path.join(output_dir, "pcb_project_outline.gcode"),
             "drill": os.path.join(output_dir, "pcb_project_drill.gcode")
-        }, log_params
+        }, self.log_params()
+
+    def config_params(self):
+        """
+        pcb2gcode parameters from the config file (shared, mtime-cached parser),
+        without the input/output keys that are set per call. Returns (params, flags).
+        """
+        cfg = load_config(self.config_file)
+        params = dict(cfg.values)
+        flags = set(cfg.flags)
+        ignore_keys = {"front", "back", "outline", "drill", "front-output", "back-output", "outline-output", "drill-output", "output-dir"}
+        for k in ignore_keys:
+            params.pop(k, None)
+        return params, flags
+
+    def log_params(self):
+        """Parameters for the G-code header (flags marked as such)."""
+        params, flags = self.config_params()
+        for f in flags:
+            params[f] = "True (Flag)"
+        return params
 
-    def process_gcode(self, gcode_path, offset_x=0.0, offset_y=0.0, extra_header=None):
+    def process_gcode(self, gcode_path, offset_x=0.0, offset_y=0.0, extra_header=None, stats=None, text=None):
         """
         Reads G-code, applies offset, segments long G1 moves,
         and applies leveling.
+        If text is given (e.g. from the native isolation engine), it is used instead of reading gcode_path.
+        If a stats dict is given, it is filled with input_lines, output_lines,
+        segments and interpolations counters.
         """
         MAX_SEGMENT_LENGTH = 1.0 # mm - Maximum length of a segment for leveling
 
-        probe_data = None
-        points = None
-        values = None
-
-        # Load probe data
-        if os.path.exists(self.probe_file):
-            with open(self.probe_file, 'r') as f:
-                probe_data = json.load(f)
-            if probe_data and 'points' in probe_data:
-                points = np.array([[p['x'], p['y']] for p in probe_data['points']])
-                values = np.array([p['z'] for p in probe_data['points']])
+        # Load probe data (cached per probe file mtime)
+        heightmap = load_heightmap(self.probe_file)
         
-        with open(gcode_path, 'r') as f:
-            lines = f.readlines()
+        if text is not None:
+            lines = text.splitlines()
+        else:
+            with open(gcode_path, 'r') as f:
+                lines = f.readlines()
             
-        new_lines = ["; Processed by pcb-bridge (Offset + Segmentation + Leveling)"]
+        # Output lines are collected as columns and formatted in bulk (emitter.py)
+        out = MoveBuffer()
+        out.add_text("; Processed by pcb-bridge (Offset + Segmentation + Leveling)")
         if extra_header:
-            new_lines.append("; --- pcb2gcode Configuration ---")
+            out.add_text("; --- pcb2gcode Configuration ---")
             for k, v in extra_header.items():
-                new_lines.append(f"; {k}={v}")
-            new_lines.append("; -------------------------------")
+                out.add_text(f"; {k}={v}")
+            out.add_text("; -------------------------------")
         
         current_x = 0.0
         current_y = 0.0
@@ -152,23 +151,31 @@ class PcbTransformer:
         min_z, max_z = float('inf'), float('-inf')
         has_coords = False
 
+        segments_created = 0
+        interp_calls = 0
+
         # Helper for Z-interpolation
         def get_z_offset(x, y):
-            if points is None: return 0.0
-            # griddata is robust, but slow with many points. OK for PCB G-code (<10k lines).
-            return float(griddata(points, values, (x, y), method='linear', fill_value=0.0))
+            nonlocal interp_calls
+            if heightmap is None: return 0.0
+            interp_calls += 1
+            return heightmap.z_offset(x, y)
 
         for line in lines:
             line_stripped = line.strip()
             if not line_stripped or line_stripped.startswith(';') or line_stripped.startswith('('):
-                new_lines.append(line_stripped)
+                out.add_text(line_stripped)
                 continue
             
-            parts = line_stripped.split()
+            # A trailing ';' comment stays at the end of the line
+            code, sep, comment = line_stripped.partition(';')
+            comment = sep + comment
+            parts = code.split()
             
             # Detect mode (G0 vs G1)
-            if 'G0' in parts or 'G00' in parts: current_mode = 'G0'
-            elif 'G1' in parts or 'G01' in parts: current_mode = 'G1'
+            line_mode = np.nan
+            if 'G0' in parts or 'G00' in parts: current_mode, line_mode = 'G0', 0
+            elif 'G1' in parts or 'G01' in parts: current_mode, line_mode = 'G1', 1
             
             # Parse target coordinates
             target_x = current_x
@@ -178,7 +185,8 @@ class PcbTransformer:
             has_x = False
             has_y = False
             has_z = False
-            other_parts = [] # F, S, M Befehle
+            feed = np.nan
+            other_parts = [] # S, M, T and other G commands
 
             for part in parts:
                 if part.startswith('X'):
@@ -190,69 +198,67 @@ class PcbTransformer:
                 elif part.startswith('Z'):
                     target_z = float(part[1:])
                     has_z = True
-                elif not part.startswith('G'): # Everything that is not a G-command or coordinate (F, S, M, T)
+                elif part.startswith('F'):
+                    # Feed is a column of its own (repeated values are suppressed)
+                    try:
+                        feed = float(part[1:])
+                    except ValueError:
+                        other_parts.append(part)
+                elif not part.startswith('G'): # Everything that is not a G-command or coordinate (S, M, T)
                     # Filter out Stop (M0) and Tool Change (M6) commands
                     if part in ['M0', 'M00', 'M6', 'M06']: continue
                     other_parts.append(part)
                 elif part not in ['G0', 'G00', 'G1', 'G01']: # Other G-commands (G21, G90 etc)
                     other_parts.append(part)
+            extra = " ".join(other_parts)
             
             # Check segmentation (only for G1 and if probe data exists)
             dist = 0.0
             if has_x or has_y:
                 dist = np.sqrt((target_x - current_x)**2 + (target_y - current_y)**2)
             
-            if current_mode == 'G1' and dist > MAX_SEGMENT_LENGTH and points is not None:
-                # Segment!
+            if current_mode == 'G1' and dist > MAX_SEGMENT_LENGTH and heightmap is not None:
+                # Segment! All points of the move at once
                 num_segments = int(np.ceil(dist / MAX_SEGMENT_LENGTH))
+                segments_created += num_segments
+                t = np.arange(1, num_segments + 1) / num_segments
+                seg_x = current_x + (target_x - current_x) * t
+                seg_y = current_y + (target_y - current_y) * t
                 
-                for i in range(1, num_segments + 1):
-                    t = i / num_segments
-                    seg_x = current_x + (target_x - current_x) * t
-                    seg_y = current_y + (target_y - current_y) * t
-                    
-                    # Linear Z interpolation (if ramp) + Leveling Offset
-                    seg_z_base = current_z + (target_z - current_z) * t
-                    z_offset = get_z_offset(seg_x, seg_y)
-                    seg_z_final = seg_z_base + z_offset
-                    
-                    # Stats update
-                    if seg_z_final < min_z: min_z = seg_z_final
-                    if seg_z_final > max_z: max_z = seg_z_final
-                    
-                    # Build line
-                    seg_line = f"G1 X{seg_x:.4f} Y{seg_y:.4f} Z{seg_z_final:.4f}"
-                    # Append F-values etc. only to the first segment
-                    if i == 1 and other_parts:
-                        seg_line += " " + " ".join(other_parts)
-                    new_lines.append(seg_line)
+                # Linear Z interpolation (if ramp) + Leveling Offset
+                seg_z_base = current_z + (target_z - current_z) * t
+                if hasattr(heightmap, "z_offsets"):
+                    z_offset = heightmap.z_offsets(seg_x, seg_y)
+                    interp_calls += num_segments
+                else:
+                    z_offset = np.array([get_z_offset(sx, sy) for sx, sy in zip(seg_x, seg_y)])
+                seg_z_final = seg_z_base + z_offset
+                
+                # Stats update
+                min_z = min(min_z, float(seg_z_final.min()))
+                max_z = max(max_z, float(seg_z_final.max()))
+                
+                # F-values etc. only on the first segment
+                out.add_moves(1, seg_x, seg_y, seg_z_final, f=np.r_[feed, np.full(num_segments - 1, np.nan)], extra=extra)
                 
                 # State update
                 current_x, current_y, current_z = target_x, target_y, target_z
             
             else:
                 # Standard processing (no segmentation, e.g., G0 or short G1)
-                new_line_parts = []
-                if 'G0' in parts or 'G00' in parts: new_line_parts.append('G0')
-                elif 'G1' in parts or 'G01' in parts: new_line_parts.append('G1')
-                # Reconstruct command from other_parts (G0, G1, F, S, M...)
-                new_line_parts.extend(other_parts)
-                
-                if has_x: new_line_parts.append(f"X{target_x:.4f}")
-                if has_y: new_line_parts.append(f"Y{target_y:.4f}")
-                
                 # Apply Z-Leveling
                 final_z_val = target_z
+                out_z = np.nan
                 if has_z or (has_x or has_y): # Auch bei XY-Move Z anpassen (Leveling)
                     z_offset = get_z_offset(target_x, target_y)
                     final_z_val = target_z + z_offset
-                    new_line_parts.append(f"Z{final_z_val:.4f}")
+                    out_z = final_z_val
                 
                 # If line became empty (e.g. only contained M6 which was filtered), skip it
-                if not new_line_parts:
+                if np.isnan(line_mode) and not extra and np.isnan(feed) and np.isnan(out_z) and not comment:
                     continue
 
-                new_lines.append(" ".join(new_line_parts))
+                out.add_move(line_mode, target_x if has_x else np.nan, target_y if has_y else np.nan, out_z, feed, extra, comment)
                 
                 # State update
                 current_x, current_y, current_z = target_x, target_y, target_z
@@ -280,8 +286,15 @@ class PcbTransformer:
             if max_y == float('-inf'): max_y = 0.0
             
             dims = {"min_x": min_x, "max_x": max_x, "min_y": min_y, "max_y": max_y, "width": max_x - min_x, "height": max_y - min_y, "min_z": min_z, "max_z": max_z}
+
+        gcode, emit_stats = render(out)
             
-        return "\n".join(new_lines), dims
+        if stats is not None:
+            stats.update({"input_lines": len(lines), "output_lines": emit_stats["lines"],
+                          "segments": segments_created, "interpolations": interp_calls,
+                          "output_bytes": emit_stats["bytes"], "bytes_saved": emit_stats["bytes_saved"]})
+
+        return gcode, dims
 
     def split_gcode_by_tool(self, gcode_content):
         """
@@ -1,31 +1,52 @@
 import os
-import json
+import functools
+import threading
 import matplotlib
 # Set backend to 'Agg' to prevent GUI windows on server
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.collections import LineCollection
+from matplotlib.tri import Triangulation
 
 # Standard-Theme verwenden (hell)
 plt.style.use('default')
 
+# pyplot keeps global figure state, so batch workers render one image at a time
+_plot_lock = threading.Lock()
+
+def _serialized(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _plot_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+def _grid_shape(x, y):
+    """Returns (ny, nx, order) if the points form a full regular grid, else None."""
+    ux = np.unique(x)
+    uy = np.unique(y)
+    if len(ux) * len(uy) != len(x) or len(ux) < 2 or len(uy) < 2:
+        return None
+    order = np.lexsort((x, y)) # Row by row in Y, sorted by X
+    return len(uy), len(ux), order
+
+@_serialized
 def generate_heightmap_image(probe_file: str, output_path: str) -> bool:
     """Generates a heatmap image from the probe data."""
+    from heightmap import load_heightmap
     if not os.path.exists(probe_file):
         return False
     
     try:
-        with open(probe_file, "r") as f:
-            data = json.load(f)
-        
-        points = data.get("points", [])
-        if not points:
+        # Arrays and triangulation come from the (mtime-cached) heightmap
+        heightmap = load_heightmap(probe_file)
+        if heightmap is None:
             return False
 
-        x = [p['x'] for p in points]
-        y = [p['y'] for p in points]
-        z = [p['z'] for p in points]
+        x = heightmap.points[:, 0]
+        y = heightmap.points[:, 1]
+        z = heightmap.values
         
         plt.figure(figsize=(10, 6))
         
@@ -34,13 +55,21 @@ def generate_heightmap_image(probe_file: str, output_path: str) -> bool:
         plt.gcf().patch.set_facecolor('#E8E8E8')
         
         # Determine symmetric range for colorbar to keep 0 neutral
-        max_val = max(max([abs(v) for v in z]), 0.05)
+        max_val = max(float(np.max(np.abs(z))), 0.05)
         levels = np.linspace(-max_val, max_val, 21)
         
-        # Create a triangulation for interpolation/plotting
-        cntr = plt.tricontourf(x, y, z, levels=levels, cmap="RdYlBu_r", extend="both")
+        grid = _grid_shape(x, y)
+        if grid:
+            # Regular grid: contour directly on the 2D arrays (no triangulation needed)
+            ny, nx, order = grid
+            cntr = plt.contourf(x[order].reshape(ny, nx), y[order].reshape(ny, nx), z[order].reshape(ny, nx),
+                                levels=levels, cmap="RdYlBu_r", extend="both")
+        else:
+            # Irregular points: reuse the Delaunay triangulation of the heightmap
+            triang = Triangulation(x, y, triangles=heightmap.simplices)
+            cntr = plt.tricontourf(triang, z, levels=levels, cmap="RdYlBu_r", extend="both")
         plt.colorbar(cntr, label="Z Height [mm]", orientation='horizontal', pad=0.15)
-        plt.scatter(x, y, c='black', s=10, label='Probe Points')
+        plt.scatter(x, y, c='black', s=10 if len(x) <= 1000 else 2, label='Probe Points')
         plt.title("PCB Heightmap Interpolation")
         plt.xlabel("X [mm]")
         plt.ylabel("Y [mm]")
@@ -54,6 +83,7 @@ def generate_heightmap_image(probe_file: str, output_path: str) -> bool:
         print(f"Visualization Error (Heightmap): {e}")
         return False
 
+@_serialized
 def generate_gcode_image(gcode_path: str, output_path: str) -> bool:
     """Generates a plot of the G-code path colored by Z-height."""
     if not os.path.exists(gcode_path):
@@ -67,32 +97,32 @@ def generate_gcode_image(gcode_path: str, output_path: str) -> bool:
         
         with open(gcode_path, "r") as f:
             current_x, current_y, current_z = 0.0, 0.0, 0.0
+            mode = None # Modal motion: lines without G0/G1 continue the last one
             for line in f:
                 line = line.strip()
                 if not line or line.startswith(";") or line.startswith("("): continue
                 
-                upline = line.upper()
-                
-                # Check for cut commands (G1, G01) or Canned Cycles (G81, G82, G83)
-                is_cut = "G1" in upline or "G01" in upline or \
-                         "G81" in upline or "G82" in upline or "G83" in upline
+                parts = line.split(";")[0].upper().split()
                 
-                # Check for rapid commands
-                is_rapid = "G0" in upline or "G00" in upline
+                # Cut commands (G1, G01) or Canned Cycles (G81, G82, G83), rapid commands (G0, G00)
+                for p in parts:
+                    if p in ("G1", "G01", "G81", "G82", "G83"): mode = "cut"
+                    elif p in ("G0", "G00"): mode = "rapid"
+                    elif p in ("G2", "G02", "G3", "G03"): mode = None
                 
-                if is_cut or is_rapid:
-                    parts = upline.split()
+                if mode is not None:
                     new_x, new_y, new_z = current_x, current_y, current_z
+                    moved = False
                     
                     for p in parts:
                         try:
-                            if p.startswith("X"): new_x = float(p[1:])
-                            if p.startswith("Y"): new_y = float(p[1:])
-                            if p.startswith("Z"): new_z = float(p[1:])
+                            if p.startswith("X"): new_x = float(p[1:]); moved = True
+                            if p.startswith("Y"): new_y = float(p[1:]); moved = True
+                            if p.startswith("Z"): new_z = float(p[1:]); moved = True
                         except ValueError:
                             pass
                     
-                    if is_cut:
+                    if mode == "cut" and moved:
                         if current_x == new_x and current_y == new_y:
                             drill_pts.append((new_x, new_y))
                             drill_zs.append((current_z + new_z) / 2.0)
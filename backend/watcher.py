@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+from workspaces import file_sha256
+
+# Watch-folder auto-processing: a directory (e.g. the EDA export folder) is polled,
+# the layer files are recognized by the same name rules as ProcessGerber.js, and
+# once a burst of writes has settled (no size/mtime change for the debounce time)
+# the changed files are hashed and handed to the pipeline in the background.
+
+# Same rules as the folder selection in macros/ProcessGerber.js
+LAYER_SUFFIXES = (
+    ("traces", "-B_Cu.gbr"),
+    ("outline", "-Edge_Cuts.gbr"),
+    ("drill", ".drl"),
+    ("user_drawings", "-User_Drawings.gbr"),
+)
+
+def match_layer(name):
+    for layer, suffix in LAYER_SUFFIXES:
+        if name.endswith(suffix):
+            return layer
+    return None
+
+def scan_layers(directory):
+    """{layer: (path, (mtime_ns, size))}; with several candidates the newest file wins."""
+    found = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return found
+    for entry in entries:
+        layer = match_layer(entry.name)
+        if layer is None or not entry.is_file():
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        stamp = (st.st_mtime_ns, st.st_size)
+        if layer not in found or stamp[0] > found[layer][1][0]:
+            found[layer] = (entry.path, stamp)
+    return found
+
+class FolderWatcher:
+    """
+    Polls directory every interval seconds. on_change(paths, hashes, changed, done) is
+    called with all layer files once the folder was unchanged for debounce seconds and
+    at least one file hash differs from the last successfully processed one. It returns
+    False when the files could not be queued (retried after the next debounce) and
+    calls done(ok) when processing has finished.
+    Only the hashes of successful runs are kept (also in state_file, so an export that
+    was already processed does not trigger again after a restart; uploads from the
+    dialog are not taken into account: they must not be overwritten by an old export).
+    A failed run is retried with a growing delay (up to retry_max seconds) while the
+    folder stays unchanged; a new export is picked up as usual.
+    """
+    def __init__(self, directory, on_change, interval=1.0, debounce=2.0, state_file=None, retry_max=300.0):
+        self.directory = directory
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self.state_file = state_file
+        self.retry_max = retry_max
+        self.hashes = self._load_hashes()
+        self._seen = None
+        self._changed_at = None
+        self._lock = threading.RLock() # poll (watcher thread) vs. done (job thread)
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_scan = None
+        self.last_trigger = None
+        self.last_result = None
+        self.triggers = 0
+        self.failures = 0
+        self.error = None
+
+    def _load_hashes(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Hashes of another watch folder do not count
+        if state.get("directory") != os.path.abspath(self.directory):
+            return {}
+        return state.get("hashes") or {}
+
+    def _save_hashes(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"directory": os.path.abspath(self.directory), "hashes": self.hashes}, f, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def poll(self, now=None):
+        """One scan step. Returns the changed layers when processing was triggered."""
+        with self._lock:
+            return self._poll(time.monotonic() if now is None else now)
+
+    def _poll(self, now):
+        current = scan_layers(self.directory)
+        self.last_scan = time.time()
+        if current != self._seen:
+            # Still being written: restart the debounce window
+            self._seen = current
+            self._changed_at = now
+            return None
+        if self._changed_at is None or now - self._changed_at < self.debounce:
+            return None
+        self._changed_at = None
+        if not current:
+            return None
+
+        paths = {layer: path for layer, (path, _) in current.items()}
+        try:
+            hashes = {layer: file_sha256(path) for layer, path in paths.items()}
+        except OSError:
+            # Removed/renamed between scan and hashing: next burst
+            self._changed_at = now
+            return None
+        changed = sorted(layer for layer in hashes if self.hashes.get(layer) != hashes[layer])
+        if not changed:
+            return None
+        try:
+            queued = self.on_change(paths, hashes, changed, lambda ok: self._done(hashes, ok))
+        except Exception:
+            self._done(hashes, False)
+            raise
+        if queued is False:
+            self._changed_at = now
+            return None
+        self.triggers += 1
+        self.last_trigger = {"time": time.time(), "layers": changed, "files": {k: os.path.basename(p) for k, p in paths.items()}}
+        return changed
+
+    def _done(self, hashes, ok, now=None):
+        """Result of a triggered run: keeps the hashes on success, schedules a retry otherwise."""
+        with self._lock:
+            self.last_result = {"time": time.time(), "ok": bool(ok)}
+            if ok:
+                self.failures = 0
+                self.hashes = hashes
+                self._save_hashes()
+                return
+            self.failures += 1
+            delay = min(self.retry_max, self.debounce * 2 ** self.failures)
+            # Same export again once the delay is over (a change in between restarts the debounce)
+            self._changed_at = (time.monotonic() if now is None else now) + delay - self.debounce
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+                print(f"Watch folder: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="watch-folder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval": self.interval,
+            "debounce": self.debounce,
+            "files": {layer: os.path.basename(path) for layer, (path, _) in (self._seen or {}).items()},
+            "last_scan": self.last_scan,
+            "last_trigger": self.last_trigger,
+            "last_result": self.last_result,
+            "triggers": self.triggers,
+            "failures": self.failures,
+            "error": self.error,
+        }
@@ -0,0 +1,260 @@
+import os
+import re
+import copy
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import threading
+from store import RESULTS, read_json
+
+# Project workspaces: every project gets its own directory with the same layout
+# the single-project mode uses in data/ (uploads/, gcode_raw/, gcode_processed/,
+# process_state.json, viz_gcode_*.png). The default workspace is data/ itself.
+# States and G-code contents are served from the result store (store.py).
+
+WORKSPACE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+# Uploads are stored content-addressed: uploads/<sha256><ext>
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9_]+)?$")
+# Unreferenced uploads younger than this are kept (may belong to a request in flight)
+UPLOAD_PRUNE_MIN_AGE = 3600
+
+async def store_upload(upload, directory):
+    """
+    Streams an UploadFile in chunks into directory while hashing it.
+    Returns (path, sha256). An identical file that already exists is reused.
+    """
+    loop = asyncio.get_running_loop()
+    os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(os.path.basename(upload.filename or ""))[1]
+    if not re.match(r"^\.[A-Za-z0-9_]+$", ext):
+        ext = ""
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+    h = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                await loop.run_in_executor(None, f.write, chunk)
+        digest = h.hexdigest()
+        path = os.path.join(directory, digest + ext.lower())
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path) # mark as recently used (see prune_uploads)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, digest
+
+def store_file(source, directory):
+    """Copies a local file content-addressed into directory (like store_upload). Returns (path, sha256)."""
+    os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(os.path.basename(source))[1]
+    if not re.match(r"^\.[A-Za-z0-9_]+$", ext):
+        ext = ""
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+    h = hashlib.sha256()
+    try:
+        with open(source, "rb") as src, open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_SIZE), b""):
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        path = os.path.join(directory, digest + ext.lower())
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, digest
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Workspace:
+    def __init__(self, path, workspace_id="default"):
+        self.id = workspace_id
+        self.dir = path
+        self.uploads_dir = os.path.join(path, "uploads")
+        self.raw_dir = os.path.join(path, "gcode_raw")
+        self.processed_dir = os.path.join(path, "gcode_processed")
+        self.state_file = os.path.join(path, "process_state.json")
+        # One processing run per workspace at a time
+        self.lock = threading.Lock()
+
+    def ensure_dirs(self):
+        for d in (self.uploads_dir, self.raw_dir, self.processed_dir):
+            os.makedirs(d, exist_ok=True)
+
+    def load_state(self):
+        """Copy of the stored state ({} if there is none)."""
+        try:
+            return copy.deepcopy(RESULTS.load(self.state_file, read_json) or {})
+        except Exception:
+            return {}
+
+    def save_state(self, state):
+        """Updates the state in memory; process_state.json is written in the background."""
+        RESULTS.put_json(self.state_file, state)
+
+    def clear_state(self):
+        RESULTS.delete(self.state_file)
+
+    def load_result(self):
+        """Loads the state of the last processing run incl. the G-code contents."""
+        state = self.load_state()
+        if not state:
+            return {"status": "none"}
+
+        # Load content of G-code files
+        gcode_data = {}
+        files_map = state.get("files", {})
+        for key, path in files_map.items():
+            gcode_data[key] = RESULTS.load(path) if path else None
+
+        return {
+            "status": "success",
+            "project": self.id,
+            "config": state.get("config"),
+            "gcode": gcode_data,
+            "dimensions": state.get("dimensions"),
+            "tool_metadata": state.get("tool_metadata", {}),
+            "filenames": state.get("filenames"),
+            "images": state.get("images"),
+            "input_hashes": state.get("input_hashes", {}),
+            "config_hash": state.get("config_hash"),
+            "panel": state.get("panel"),
+            "estimated_seconds": state.get("estimated_seconds"),
+            "isolation": state.get("isolation"),
+            "pocketing": state.get("pocketing"),
+            "plan": state.get("plan"),
+        }
+
+    def prune_uploads(self, keep):
+        """Removes stored uploads that are no longer referenced (keep: paths in use)."""
+        keep = {os.path.abspath(p) for p in keep if p}
+        if not os.path.isdir(self.uploads_dir):
+            return
+        now = time.time()
+        for name in os.listdir(self.uploads_dir):
+            path = os.path.join(self.uploads_dir, name)
+            if not UPLOAD_NAME_RE.match(name) or os.path.abspath(path) in keep:
+                continue
+            try:
+                if now - os.path.getmtime(path) > UPLOAD_PRUNE_MIN_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def size_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def last_used(self):
+        """Time of the last processing run (or creation)."""
+        for path in (self.state_file, self.dir):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                continue
+        return 0.0
+
+    def info(self):
+        state = self.load_state()
+        return {
+            "id": self.id,
+            "filenames": state.get("filenames", {}),
+            "config_hash": state.get("config_hash"),
+            "last_used": self.last_used(),
+            "size_bytes": self.size_bytes(),
+        }
+
+class WorkspaceStore:
+    """Creates, looks up and cleans up the project workspaces below data/workspaces/."""
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._workspaces = {}
+
+    def get(self, workspace_id, create=False):
+        """Returns the workspace or None. Raises ValueError for invalid ids."""
+        if not WORKSPACE_ID_RE.match(workspace_id or ""):
+            raise ValueError(f"Invalid project id '{workspace_id}' (allowed: letters, digits, '-', '_')")
+        with self._lock:
+            ws = self._workspaces.get(workspace_id)
+            if ws is None:
+                path = os.path.join(self.root, workspace_id)
+                if not os.path.isdir(path):
+                    if not create:
+                        return None
+                    os.makedirs(path, exist_ok=True)
+                ws = Workspace(path, workspace_id)
+                self._workspaces[workspace_id] = ws
+        return ws
+
+    def create(self, workspace_id=None):
+        return self.get(workspace_id or uuid.uuid4().hex[:12], create=True)
+
+    def list(self):
+        if not os.path.isdir(self.root):
+            return []
+        ids = sorted(name for name in os.listdir(self.root)
+                     if os.path.isdir(os.path.join(self.root, name)) and WORKSPACE_ID_RE.match(name))
+        return [self.get(i) for i in ids]
+
+    def remove(self, workspace_id):
+        ws = self.get(workspace_id)
+        if ws is None:
+            return False
+        with ws.lock:
+            RESULTS.discard_tree(ws.dir)
+            shutil.rmtree(ws.dir, ignore_errors=True)
+        with self._lock:
+            self._workspaces.pop(workspace_id, None)
+        return True
+
+    def cleanup(self, max_age_hours=None, max_total_mb=None, busy=()):
+        """
+        Removes workspaces not used for max_age_hours, then the oldest ones until
+        the total size is below max_total_mb. Workspaces in busy are kept.
+        Returns the removed ids.
+        """
+        removed = []
+        candidates = [ws for ws in self.list() if ws.id not in busy]
+        now = time.time()
+        if max_age_hours is not None:
+            for ws in list(candidates):
+                if now - ws.last_used() > max_age_hours * 3600:
+                    self.remove(ws.id)
+                    removed.append(ws.id)
+                    candidates.remove(ws)
+        if max_total_mb is not None:
+            sizes = {ws.id: ws.size_bytes() for ws in self.list()}
+            total = sum(sizes.values())
+            for ws in sorted(candidates, key=lambda w: w.last_used()):
+                if total <= max_total_mb * 1024 * 1024:
+                    break
+                total -= sizes.get(ws.id, 0)
+                self.remove(ws.id)
+                removed.append(ws.id)
+        return removed
@@ -33,12 +33,17 @@
                     </div>
 
                     <div class="row">
-                        <div class="cell-6">
+                        <div class="cell-4">
                             <button class="button primary w-100" id="pb_sim">
                                 <span class="mif-magic-wand"></span> Simulation
                             </button>
                         </div>
-                        <div class="cell-6">
+                        <div class="cell-4">
+                            <button class="button secondary w-100" id="pb_plan" title="Plan probe points from the processed toolpaths">
+                                <span class="mif-location"></span> Plan
+                            </button>
+                        </div>
+                        <div class="cell-4">
                             <button class="button alert w-100" id="pb_probe">
                                 <span class="mif-target"></span> Probing
                             </button>
@@ -69,6 +74,7 @@
         ],
         onShow: function(dialog) {
             var el = dialog.element;
+            var plannedProbe = null; // { config, points } from /probe/plan
             
             function updateEditor(gCode) {
                 // 1. Write code to editor
@@ -145,8 +151,8 @@
                     if(data.status === "success") {
                         if (!isAutoLoad) Metro.toast.create("Loaded! " + data.points.length + " points.", null, 3000, "success");
                         
-                        // Update config fields if available
-                        if(data.config) {
+                        // Update config fields if available (planned point sets have no grid)
+                        if(data.config && data.config.points_x) {
                             el.find('#pb_width').val(data.config.width);
                             el.find('#pb_height').val(data.config.height);
                             el.find('#pb_px').val(data.config.points_x);
@@ -189,6 +195,7 @@
                     el.find('#pb_py').val(3);
                     el.find('#probe_stats').hide();
                     el.find('#viz_container').hide();
+                    plannedProbe = null;
                     
                     // Clear editor
                     if (typeof editor !== 'undefined' && editor.session) editor.session.setValue("");
@@ -219,13 +226,64 @@
                 });
             });
 
+            // Changing the grid discards a planned point set
+            el.find('#pb_width, #pb_height, #pb_px, #pb_py').on('change', function() {
+                plannedProbe = null;
+            });
+
+            el.find('#pb_plan').on('click', function() {
+                fetch('http://127.0.0.1:8000/probe/plan', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({})
+                })
+                .then(r => r.json())
+                .then(data => {
+                    if (data.status !== "success") {
+                        Metro.toast.create(data.message || "Planning failed.", null, 5000, "alert");
+                        return;
+                    }
+                    plannedProbe = { config: data.config, points: data.points };
+                    var plan = data.plan;
+                    if (data.viz_gcode) updateEditor(data.viz_gcode);
+                    el.find('#probe_stats').html(`<b>Probe Plan:</b> ${plan.points} points (uniform grid: ${plan.uniform_grid_points}) | 
+                        Est. ${(plan.estimated_seconds / 60).toFixed(1)} min (uniform: ${(plan.uniform_grid_estimated_seconds / 60).toFixed(1)} min)`).show();
+                    Metro.toast.create("Probe plan ready. 'Probing' will use the planned points.", null, 3000, "success");
+                })
+                .catch(e => {
+                    Metro.toast.create("Error: " + e, null, 3000, "alert");
+                });
+            });
+
             el.find('#pb_probe').on('click', function() {
-                var payload = getPayload();
-                if(!payload) return;
+                var payload;
+                var points = [];
 
-                if (payload.points_x < 2 || payload.points_y < 2) {
-                    Metro.toast.create("Please specify at least 2 points per axis.", null, 3000, "alert");
-                    return;
+                if (plannedProbe) {
+                    // Irregular point set from /probe/plan (already in tour order)
+                    payload = plannedProbe.config;
+                    points = plannedProbe.points.map(p => ({ x: p.x, y: p.y }));
+                } else {
+                    payload = getPayload();
+                    if(!payload) return;
+
+                    if (payload.points_x < 2 || payload.points_y < 2) {
+                        Metro.toast.create("Please specify at least 2 points per axis.", null, 3000, "alert");
+                        return;
+                    }
+
+                    // Generate points
+                    var stepX = payload.width / (payload.points_x - 1);
+                    var stepY = payload.height / (payload.points_y - 1);
+
+                    for(var y=0; y < payload.points_y; y++) {
+                        for(var x=0; x < payload.points_x; x++) {
+                            points.push({
+                                x: x * stepX,
+                                y: y * stepY
+                            });
+                        }
+                    }
                 }
 
                 // Configuration
@@ -233,20 +291,6 @@
                 var zProbeMin = -2.0;  // Max depth [mm]
                 var feed = 100;        // Probing feed rate [mm/min]
 
-                // Generate points
-                var points = [];
-                var stepX = payload.width / (payload.points_x - 1);
-                var stepY = payload.height / (payload.points_y - 1);
-
-                for(var y=0; y < payload.points_y; y++) {
-                    for(var x=0; x < payload.points_x; x++) {
-                        points.push({
-                            x: x * stepX,
-                            y: y * stepY
-                        });
-                    }
-                }
-
                 var results = [];
                 var currentIndex = 0;
                 var btn = $(this);
@@ -254,6 +298,29 @@
                 btn.prop('disabled', true);
                 Metro.toast.create("Probing started...", null, 2000, "info");
 
+                // Stream every point to the backend as soon as it is measured.
+                // Requests are chained so the points arrive in order; an aborted run keeps its data.
+                var streamChain = fetch('http://127.0.0.1:8000/probe/stream/start', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify(payload)
+                }).then(r => r.json());
+
+                function streamPoint(point, isFinal) {
+                    streamChain = streamChain.then(() => fetch('http://127.0.0.1:8000/probe/stream/points', {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({ points: [point], final: isFinal })
+                    })).then(r => r.json());
+                    return streamChain;
+                }
+
+                function showStreamStats(stream) {
+                    if (!stream || !stream.deviation) return;
+                    el.find('#probe_stats').html(`<b>Probing:</b> ${stream.count} / ${points.length} points | 
+                        Plane deviation max: ${stream.deviation.max.toFixed(4)} mm | RMS: ${stream.deviation.rms.toFixed(4)} mm`).show();
+                }
+
                 // Disable old listeners to be safe
                 socket.off('prbResult');
 
@@ -268,6 +335,12 @@
                             z_raw: prbdata.z
                         });
 
+                        // Normalization: Z relative to the first point
+                        var last = results[results.length - 1];
+                        var isFinal = currentIndex + 1 >= points.length;
+                        streamPoint({ x: last.x, y: last.y, z: last.z_raw - results[0].z_raw }, isFinal)
+                            .then(data => { if (!isFinal) showStreamStats(data.stream); });
+
                         currentIndex++;
                         nextPoint();
                     } else {
@@ -310,32 +383,22 @@
                     });
 
                     if (success && results.length > 0) {
-                        // Normalization: Z relative to the first point (0,0)
-                        var refZ = results[0].z_raw;
-                        var finalPoints = results.map(p => ({
-                            x: p.x,
-                            y: p.y,
-                            z: p.z_raw - refZ
-                        }));
-
-                        var finalPayload = { config: payload, points: finalPoints };
-
-                        fetch('http://127.0.0.1:8000/probe/save', {
-                            method: 'POST',
-                            headers: {'Content-Type': 'application/json'},
-                            body: JSON.stringify(finalPayload)
-                        })
-                        .then(r => r.json())
-                        .then(data => {
+                        // The final point already saved the result (leveling is ready)
+                        streamChain.then(data => {
                             Metro.toast.create("Probing finished! File saved.", null, 3000, "success");
                             console.log(data);
                             if (data.viz_gcode) updateEditor(data.viz_gcode);
-                            updateStats(finalPoints);
+                            updateStats(results.map(p => ({ x: p.x, y: p.y, z: p.z_raw - results[0].z_raw })));
                             updateImage();
                         })
                         .catch(e => {
                             Metro.toast.create("Error: " + e, null, 5000, "alert");
                         });
+                    } else {
+                        streamChain.then(() => fetch('http://127.0.0.1:8000/probe/stream/abort', { method: 'POST' }))
+                        .then(() => {
+                            Metro.toast.create("Probing aborted. " + results.length + " points kept on the backend.", null, 5000, "warning");
+                        });
                     }
                 }
 
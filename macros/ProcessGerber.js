@@ -26,10 +26,26 @@
                                 <input type="number" id="val_offset_y" value="0" data-role="input">
                             </div>
                         </div>
+
+                        <div class="row mb-2">
+                            <div class="cell-4">
+                                <label>Panel X [Stk]</label>
+                                <input type="number" id="val_panel_x" value="1" min="1" data-role="input">
+                            </div>
+                            <div class="cell-4">
+                                <label>Panel Y [Stk]</label>
+                                <input type="number" id="val_panel_y" value="1" min="1" data-role="input">
+                            </div>
+                            <div class="cell-4">
+                                <label>Abstand [mm]</label>
+                                <input type="number" id="val_panel_spacing" value="2" min="0" data-role="input">
+                            </div>
+                        </div>
                     </form>
                     
                     <div class="d-flex flex-justify-between flex-align-center mt-2 mb-2">
                         <div id="dimensions_info" class="text-small text-muted border p-1 mr-2" style="display:none; flex-grow: 1;"></div>
+                        <button class="button small info outline mr-1" id="btn_resume" title="Neustart ab der Cursor-Zeile im Editor (z.B. nach Fräserbruch)"><span class="mif-play"></span> Ab Zeile</button>
                         <button class="button small warning outline" id="btn_reset" title="Reset All"><span class="mif-bin"></span> Reset</button>
                     </div>
 
@@ -66,6 +82,8 @@
             var currentGcodeData = { traces: null, outline: null, drill: null, user_drawings: null };
             var currentDimensions = { traces: null, outline: null, drill: null, user_drawings: null };
             var currentToolMetadata = {};
+            var currentPlan = null;
+            var currentLayer = null;
 
             function updateEditor(gCode) {
                 // 1. Write code to editor
@@ -84,12 +102,22 @@
                 if (typeof resetView === "function") resetView();
             }
 
+            function formatDuration(seconds) {
+                var s = Math.round(seconds);
+                var h = Math.floor(s / 3600), m = Math.floor((s % 3600) / 60);
+                var pad = (v) => (v < 10 ? '0' : '') + v;
+                return (h ? h + ':' + pad(m) : m) + ':' + pad(s % 60);
+            }
+
             function updateDimensionsInfo(dims) {
                 var div = el.find('#dimensions_info');
                 if (dims) {
                     div.html(`<b>Leveling Stats:</b> ${dims.width.toFixed(2)} x ${dims.height.toFixed(2)} mm <br> 
                               <b>Range:</b> X: ${dims.min_x.toFixed(2)}..${dims.max_x.toFixed(2)} / Y: ${dims.min_y.toFixed(2)}..${dims.max_y.toFixed(2)} <br>
-                              <b>Z-Range (Final):</b> ${dims.min_z.toFixed(3)} .. ${dims.max_z.toFixed(3)} mm`);
+                              <b>Z-Range (Final):</b> ${dims.min_z.toFixed(3)} .. ${dims.max_z.toFixed(3)} mm` +
+                              (dims.estimate ? `<br><b>Laufzeit (ca.):</b> ${formatDuration(dims.estimate.seconds)} |
+                              Fräsweg ${dims.estimate.cut_length.toFixed(0)} mm, Eilgang ${dims.estimate.rapid_length.toFixed(0)} mm,
+                              ${dims.estimate.plunges} Eintauchungen` : ''));
                     div.show();
                 } else {
                     div.html('');
@@ -123,7 +151,11 @@
                     'drill': { label: 'Drill', icon: 'mif-more-vert', cls: 'warning' }
                 };
 
+                // Recommended run order (fewest tool changes, outline last), numbered
+                var planOrder = (currentPlan && currentPlan.order) || [];
                 var keys = Object.keys(currentGcodeData).sort((a, b) => {
+                    var pa = planOrder.indexOf(a), pb = planOrder.indexOf(b);
+                    if (pa >= 0 && pb >= 0) return pa - pb;
                     var order = {'traces': 1, 'user_drawings': 2, 'outline': 3, 'drill': 4};
                     var oa = order[a] || 4;
                     var ob = order[b] || 5;
@@ -146,9 +178,13 @@
                             if (meta) {
                                 labelText += " (" + meta + ")";
                             }
+                            if (planOrder.indexOf(key) >= 0) {
+                                labelText = (planOrder.indexOf(key) + 1) + ". " + labelText;
+                            }
                             
                             var btn = $(`<button class="button small ${config.cls} flex-fill"><span class="${config.icon}"></span> ${labelText}</button>`);
                             btn.on('click', function() {
+                                currentLayer = key;
                                 updateEditor(currentGcodeData[key]);
                                 updateDimensionsInfo(currentDimensions[key]);
                                 updateImage(key);
@@ -190,10 +226,12 @@
                         currentGcodeData = data.gcode;
                         currentDimensions = data.dimensions || {};
                         currentToolMetadata = data.tool_metadata || {};
+                        currentPlan = data.plan || null;
                         renderViewButtons();
                         
                         // Automatically load Traces if available
                         if (currentGcodeData.traces) {
+                            currentLayer = 'traces';
                             updateEditor(currentGcodeData.traces);
                             updateDimensionsInfo(currentDimensions.traces);
                             Metro.toast.create("Latest processing loaded.", null, 2000, "success");
@@ -203,6 +241,9 @@
                         if (data.config) {
                             if(data.config.offset_x) el.find('#val_offset_x').val(data.config.offset_x);
                             if(data.config.offset_y) el.find('#val_offset_y').val(data.config.offset_y);
+                            if(data.config.panel_x) el.find('#val_panel_x').val(data.config.panel_x);
+                            if(data.config.panel_y) el.find('#val_panel_y').val(data.config.panel_y);
+                            if(data.config.panel_spacing !== undefined) el.find('#val_panel_spacing').val(data.config.panel_spacing);
                         }
 
                         // Display filenames
@@ -248,6 +289,8 @@
                     currentGcodeData = { traces: null, outline: null, drill: null, user_drawings: null };
                     currentDimensions = { traces: null, outline: null, drill: null, user_drawings: null };
                     currentToolMetadata = {};
+                    currentPlan = null;
+                    currentLayer = null;
                     
                     // 3. Clear editor
                     if (typeof editor !== 'undefined' && editor.session) editor.session.setValue("");
@@ -270,6 +313,30 @@
                 });
             });
 
+            // Restart program from the editor cursor line of the loaded layer
+            el.find('#btn_resume').on('click', function() {
+                if (!currentLayer || typeof editor === 'undefined') {
+                    Metro.toast.create("Bitte zuerst eine Ebene laden.", null, 3000, "warning");
+                    return;
+                }
+                var line = editor.getCursorPosition().row + 1;
+                fetch('http://127.0.0.1:8000/process/resume', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ layer: currentLayer, line: line })
+                })
+                .then(r => r.json())
+                .then(data => {
+                    if (data.status === "success") {
+                        updateEditor(data.gcode);
+                        Metro.toast.create(`Neustart ab Zeile ${data.resume.line} (spart ca. ${formatDuration(data.resume.skipped_seconds)})`, null, 4000, "success");
+                    } else {
+                        Metro.toast.create("Error: " + data.message, null, 5000, "alert");
+                    }
+                })
+                .catch(e => Metro.toast.create("Backend Error: " + e, null, 3000, "alert"));
+            });
+
             el.find('#btn_process').on('click', function() {
                 var btn = $(this);
                 // Find and lock close button in dialog wrapper
@@ -288,6 +355,9 @@
 
                 formData.append("offset_x", el.find('#val_offset_x').val());
                 formData.append("offset_y", el.find('#val_offset_y').val());
+                formData.append("panel_x", el.find('#val_panel_x').val() || 1);
+                formData.append("panel_y", el.find('#val_panel_y').val() || 1);
+                formData.append("panel_spacing", el.find('#val_panel_spacing').val() || 0);
 
                 Metro.toast.create("Processing started. Please wait...", null, 2000, "info");
 
@@ -299,10 +369,14 @@
                 .then(data => {
                     if(data.status === "success") {
                         Metro.toast.create("Processing successful!", null, 3000, "success");
+                        if (data.panel && data.panel.warning) {
+                            Metro.toast.create(data.panel.warning, null, 5000, "warning");
+                        }
                         
                         currentGcodeData = data.gcode;
                         currentDimensions = data.dimensions || {};
                         currentToolMetadata = data.tool_metadata || {};
+                        currentPlan = data.plan || null;
                         renderViewButtons();
                         
                         // Update filenames (if newly uploaded)
@@ -317,6 +391,7 @@
 
                         // Show Traces by default
                         if (data.gcode.traces) {
+                            currentLayer = 'traces';
                             updateEditor(data.gcode.traces);
                             updateDimensionsInfo(currentDimensions.traces);
                         }
@@ -0,0 +1,312 @@
+"""
+Benchmark suite for the backend hot paths, run against the bundled sample board
+(tests/samples/). pcb2gcode is replaced by fake_pcb2gcode.py, which replays stored
+outputs (real recordings from tests/benchmarks/recorded/ if present, otherwise the
+synthetic approximations in tests/benchmarks/synthetic/), so no external binary is needed.
+
+Usage:
+    python tests/benchmarks/bench_backend.py                  # run all, print table
+    python tests/benchmarks/bench_backend.py --save           # store results/<commit>.json
+    python tests/benchmarks/bench_backend.py --compare HEAD~1 # compare with stored results
+    python tests/benchmarks/bench_backend.py --only process_gcode
+
+Results are stored per commit in tests/benchmarks/results/ (ignored by Git).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, "backend")
+SAMPLES_DIR = os.path.join(PROJECT_ROOT, "tests", "samples")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+PROBE_GRIDS = (5, 20, 100)
+
+BENCHMARKS = []
+
+def bench(name):
+    """Registers a benchmark. The decorated function gets the context and returns the callable to time."""
+    def decorator(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return decorator
+
+class Context:
+    """Temporary data directory with replayed raw G-code, probe data and environment for the backend."""
+    def __init__(self):
+        self.tmp = tempfile.mkdtemp(prefix="pcb-bridge-bench-")
+        self.data_dir = os.path.join(self.tmp, "data")
+        self.raw_dir = os.path.join(self.data_dir, "gcode_raw")
+        os.makedirs(self.raw_dir)
+
+        # Wrapper so the stand-in runs with this interpreter (PcbTransformer calls one executable)
+        fake = os.path.join(BENCH_DIR, "fake_pcb2gcode.py")
+        if os.name == "nt":
+            wrapper = os.path.join(self.tmp, "pcb2gcode.bat")
+            with open(wrapper, "w") as f:
+                f.write(f'@"{sys.executable}" "{fake}" %*\n')
+        else:
+            wrapper = os.path.join(self.tmp, "pcb2gcode")
+            with open(wrapper, "w") as f:
+                f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake}" "$@"\n')
+            os.chmod(wrapper, 0o755)
+
+        os.environ["PCB2GCODE_BIN"] = wrapper
+        os.environ["PCB_BRIDGE_DATA_DIR"] = self.data_dir
+        os.environ["PCB_BRIDGE_WARMUP"] = "0"
+        sys.path.insert(0, BACKEND_DIR)
+
+        import fake_pcb2gcode
+        fake_pcb2gcode.replay([
+            "--back", "traces", "--back-output", "pcb_project_traces.gcode",
+            "--outline", "outline", "--outline-output", "pcb_project_outline.gcode",
+            "--drill", "drill", "--drill-output", "pcb_project_drill.gcode",
+            "--output-dir", self.raw_dir,
+        ])
+        self.raw = {k: os.path.join(self.raw_dir, f"pcb_project_{k}.gcode") for k in ("traces", "outline", "drill")}
+        self.probe_file = os.path.join(self.data_dir, "probe_result.json")
+
+    def write_probe_grid(self, n, model="tilt+bow+twist+noise", seed=42):
+        """Writes an n x n probe grid over the (mirrored) sample board with a reproducible synthetic surface."""
+        from probing import simulate_surface, points_to_dicts
+        xs, ys, zs = simulate_surface(104.0, 155.0, n, n, model=model, seed=seed)
+        config = {"width": 104.0, "height": 155.0, "points_x": n, "points_y": n, "model": model, "seed": seed}
+        with open(self.probe_file, "w") as f:
+            json.dump({"config": config, "points": points_to_dicts(xs - 84.0, ys - 25.0, zs)}, f)
+
+    def cleanup(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def _process_gcode_case(n):
+    def setup(ctx):
+        from transformer import PcbTransformer
+        ctx.write_probe_grid(n)
+        t = PcbTransformer(data_dir=ctx.data_dir)
+        return lambda: t.process_gcode(ctx.raw["traces"])
+    return setup
+
+for _n in PROBE_GRIDS:
+    bench(f"process_gcode[traces,{_n}x{_n}]")(_process_gcode_case(_n))
+
+@bench("split_gcode_by_tool")
+def _split(ctx):
+    from transformer import PcbTransformer
+    ctx.write_probe_grid(PROBE_GRIDS[0])
+    t = PcbTransformer(data_dir=ctx.data_dir)
+    gcode, _ = t.process_gcode(ctx.raw["drill"])
+    return lambda: t.split_gcode_by_tool(gcode)
+
+@bench("parse_excellon_tools")
+def _excellon(ctx):
+    from transformer import PcbTransformer
+    t = PcbTransformer(data_dir=ctx.data_dir)
+    drill = os.path.join(SAMPLES_DIR, "Drill.drl")
+    return lambda: t.parse_excellon_tools(drill)
+
+@bench("drilling.drill_jobs")
+def _drilling(ctx):
+    from drilling import ExcellonFile, drill_jobs, drill_params
+    from heightmap import load_heightmap
+    ctx.write_probe_grid(PROBE_GRIDS[0])
+    drill = os.path.join(SAMPLES_DIR, "Drill.drl")
+    params = drill_params()
+    def run():
+        return drill_jobs(ExcellonFile.parse(drill), params, heightmap=load_heightmap(ctx.probe_file))
+    return run
+
+@bench("pocketing.generate")
+def _pocketing(ctx):
+    from pocketing import PocketingGenerator
+    from settings import USER_DRAWINGS_CONF
+    gen = PocketingGenerator(USER_DRAWINGS_CONF)
+    src = os.path.join(SAMPLES_DIR, "User_Drawings.gbr")
+    out = os.path.join(ctx.raw_dir, "pcb_project_user_drawings.gcode")
+    return lambda: gen.generate(src, out, auto_mirror_x=True)
+
+@bench("isolation.native[traces]")
+def _isolation(ctx):
+    from isolation import generate_isolation, compare_toolpaths
+    src = os.path.join(SAMPLES_DIR, "Front.gbr")
+    # Deviation from the replayed pcb2gcode output, as reference for regressions.
+    # With the synthetic reference this only tracks changes, it is no accuracy measure.
+    from fake_pcb2gcode import reference_info
+    reference = "synthetic reference" if reference_info()["synthetic"] else "pcb2gcode"
+    gcode, info = generate_isolation(src)
+    with open(ctx.raw["traces"], "r") as f:
+        diff = compare_toolpaths(gcode, f.read())
+    print(f"  native isolation: {info['contours']} contours, {diff['cut_length']} mm cut "
+          f"({reference} {diff['reference_cut_length']} mm), Hausdorff {diff['hausdorff']} mm", flush=True)
+    return lambda: generate_isolation(src)
+
+@bench("generate_gcode_image[traces]")
+def _gcode_image(ctx):
+    from transformer import PcbTransformer
+    from visualization import generate_gcode_image
+    ctx.write_probe_grid(PROBE_GRIDS[0])
+    gcode, _ = PcbTransformer(data_dir=ctx.data_dir).process_gcode(ctx.raw["traces"])
+    leveled = os.path.join(ctx.tmp, "leveled_traces.gcode")
+    with open(leveled, "w") as f:
+        f.write(gcode)
+    out = os.path.join(ctx.tmp, "viz_traces.png")
+    return lambda: generate_gcode_image(leveled, out)
+
+@bench(f"streaming.simulate[traces,{PROBE_GRIDS[1]}x{PROBE_GRIDS[1]}]")
+def _streaming(ctx):
+    from transformer import PcbTransformer
+    from streaming import simulate_stream, controller_params
+    ctx.write_probe_grid(PROBE_GRIDS[1])
+    gcode, _ = PcbTransformer(data_dir=ctx.data_dir).process_gcode(ctx.raw["traces"])
+    params = controller_params()
+    # Effective throughput of the leveled file, as reference for segmentation/compaction changes
+    report = simulate_stream(gcode, params)
+    print(f"  streaming: {report['achieved_feed']} of {report['commanded_feed']} mm/min, "
+          f"{report['stall_seconds']}s stalled, {report['starvation_seconds']}s lost "
+          f"({report['seconds']}s vs {report['unlimited_seconds']}s unlimited)", flush=True)
+    return lambda: simulate_stream(gcode, params)
+
+@bench("GET /process/latest")
+def _process_latest(ctx):
+    from fastapi.testclient import TestClient
+    import main
+    _process_pcb(ctx)()
+    client = TestClient(main.app)
+    # Served from the result store after the first call
+    return lambda: client.get("/process/latest")
+
+@bench(f"generate_heightmap_image[{PROBE_GRIDS[-1]}x{PROBE_GRIDS[-1]}]")
+def _heightmap_image(ctx):
+    from visualization import generate_heightmap_image
+    ctx.write_probe_grid(PROBE_GRIDS[-1])
+    out = os.path.join(ctx.tmp, "viz_heightmap.png")
+    return lambda: generate_heightmap_image(ctx.probe_file, out)
+
+@bench(f"POST /probe/simulate[{PROBE_GRIDS[-1]}x{PROBE_GRIDS[-1]}]")
+def _probe_simulate(ctx):
+    from fastapi.testclient import TestClient
+    import main
+    client = TestClient(main.app)
+    n = PROBE_GRIDS[-1]
+    payload = {"width": 104.0, "height": 155.0, "points_x": n, "points_y": n, "model": "tilt+bow+twist+noise", "seed": 42}
+    return lambda: client.post("/probe/simulate", json=payload)
+
+def _process_pcb(ctx):
+    from fastapi.testclient import TestClient
+    import main
+    ctx.write_probe_grid(PROBE_GRIDS[1])
+    client = TestClient(main.app)
+    names = {"traces": "Front.gbr", "outline": "Edge_Cuts.gbr", "drill": "Drill.drl", "user_drawings": "User_Drawings.gbr"}
+
+    def run():
+        files = {k: (v, open(os.path.join(SAMPLES_DIR, v), "rb")) for k, v in names.items()}
+        try:
+            response = client.post("/process/pcb", files=files, data={"offset_x": "0", "offset_y": "0"})
+        finally:
+            for _, fh in files.values():
+                fh.close()
+        if response.status_code != 200 or response.json().get("status") != "success":
+            raise RuntimeError(f"/process/pcb failed: {response.text[:200]}")
+    return run
+
+def _process_pcb_case(cached):
+    def setup(ctx):
+        from store import RESULTS
+        run = _process_pcb(ctx)
+        state_file = os.path.join(ctx.data_dir, "process_state.json")
+        def full():
+            # Without the stored state every stage runs (no input-hash short-circuit)
+            RESULTS.delete(state_file)
+            run()
+        return run if cached else full
+    return setup
+
+bench("POST /process/pcb")(_process_pcb_case(cached=False))
+bench("POST /process/pcb[unchanged]")(_process_pcb_case(cached=True))
+
+def run_benchmarks(repeat, only=None):
+    ctx = Context()
+    results = {}
+    try:
+        for name, setup in BENCHMARKS:
+            if only and only not in name:
+                continue
+            func = setup(ctx)
+            func()  # warm-up run (imports, caches)
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - t0)
+            results[name] = {"median": statistics.median(times), "min": min(times), "runs": repeat}
+            print(f"{name:<40}{results[name]['median'] * 1000:>12.1f}{results[name]['min'] * 1000:>12.1f}", flush=True)
+    finally:
+        ctx.cleanup()
+    return results
+
+def git_label(ref="HEAD"):
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", ref], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if ref == "HEAD":
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        if dirty:
+            sha += "-dirty"
+    return sha
+
+def load_results(ref):
+    path = ref if os.path.exists(ref) else os.path.join(RESULTS_DIR, f"{git_label(ref) or ref}.json")
+    if not os.path.exists(path):
+        sys.exit(f"No stored results for '{ref}' ({path})")
+    with open(path) as f:
+        return json.load(f)
+
+def compare(current, baseline, threshold):
+    print(f"\n{'Benchmark':<40}{'base [ms]':>12}{'now [ms]':>12}{'ratio':>8}")
+    regressions = 0
+    for name, res in current.items():
+        base = baseline["results"].get(name)
+        if not base:
+            print(f"{name:<40}{'-':>12}{res['median'] * 1000:>12.1f}")
+            continue
+        ratio = res["median"] / base["median"] if base["median"] else float("inf")
+        mark = "  REGRESSION" if ratio > threshold else ""
+        regressions += bool(mark)
+        print(f"{name:<40}{base['median'] * 1000:>12.1f}{res['median'] * 1000:>12.1f}{ratio:>8.2f}{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this string")
+    parser.add_argument("--save", action="store_true", help="Store results for the current commit")
+    parser.add_argument("--compare", metavar="REF", help="Git ref or results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio that counts as regression")
+    args = parser.parse_args()
+
+    print(f"{'Benchmark':<40}{'median [ms]':>12}{'min [ms]':>12}")
+    results = run_benchmarks(args.repeat, args.only)
+
+    label = git_label() or "unknown"
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{label}.json")
+        with open(path, "w") as f:
+            json.dump({"commit": label, "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"\nSaved results to {path}")
+
+    if args.compare:
+        if compare(results, load_results(args.compare), args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
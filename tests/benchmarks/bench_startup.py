@@ -0,0 +1,60 @@
+"""
+Import-time benchmark for the backend.
+
+Measures (each in a fresh interpreter) how long `import main` takes and how
+long the first /status request needs, plus the cost of the heavy modules that
+are loaded lazily on first use.
+
+Usage: python tests/benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+
+SNIPPETS = {
+    "import main": "import main",
+    "first /status": (
+        "import main\n"
+        "from fastapi.testclient import TestClient\n"
+        "TestClient(main.app).get('/status')"
+    ),
+    "import transformer": "import transformer",
+    "import visualization": "import visualization",
+    "import pocketing": "import pocketing",
+}
+
+def time_snippet(code):
+    """Runs code in a fresh interpreter and returns the wall time of the snippet in seconds."""
+    wrapper = (
+        "import time, sys\n"
+        "t0 = time.perf_counter()\n"
+        f"exec({code!r})\n"
+        "sys.stdout.write(str(time.perf_counter() - t0))\n"
+    )
+    env = dict(os.environ, PCB_BRIDGE_WARMUP="0")
+    result = subprocess.run([sys.executable, "-c", wrapper], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'Case':<24}{'median [ms]':>14}{'min [ms]':>12}")
+    for name, code in SNIPPETS.items():
+        times = [time_snippet(code) for _ in range(args.runs)]
+        times = [t for t in times if t is not None]
+        if not times:
+            print(f"{name:<24}{'failed':>14}")
+            continue
+        print(f"{name:<24}{statistics.median(times) * 1000:>14.1f}{min(times) * 1000:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the pcb2gcode binary used by the benchmarks.
+
+Called with pcb2gcode's command line (as built by PcbTransformer.run_pcb2gcode),
+it replays stored outputs into the requested --output-dir, so the pipeline can
+run without the external binary.
+
+Real recordings go to tests/benchmarks/recorded/ and are used when present:
+    python tests/benchmarks/fake_pcb2gcode.py record --pcb2gcode /path/to/pcb2gcode
+
+Otherwise the synthetic outputs in tests/benchmarks/synthetic/ are replayed. They
+only approximate pcb2gcode's output format and are built from the sample board
+(needs pcb-tools + Shapely):
+    python tests/benchmarks/fake_pcb2gcode.py synthesize
+Numbers measured against them (e.g. the native isolation deviation) compare with
+this approximation, not with pcb2gcode itself.
+"""
+import gzip
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+SAMPLES_DIR = os.path.join(PROJECT_ROOT, "tests", "samples")
+RECORDED_DIR = os.path.join(BENCH_DIR, "recorded")   # real pcb2gcode outputs (record)
+SYNTHETIC_DIR = os.path.join(BENCH_DIR, "synthetic") # approximations (synthesize)
+CONFIG_FILE = os.path.join(PROJECT_ROOT, "config", "pcb2gcode.conf")
+
+# pcb2gcode input option -> (layer name, output option)
+LAYERS = {
+    "back": ("traces", "back-output"),
+    "front": ("traces", "front-output"),
+    "outline": ("outline", "outline-output"),
+    "drill": ("drill", "drill-output"),
+}
+
+SAMPLE_INPUTS = {
+    "traces": os.path.join(SAMPLES_DIR, "Front.gbr"),
+    "outline": os.path.join(SAMPLES_DIR, "Edge_Cuts.gbr"),
+    "drill": os.path.join(SAMPLES_DIR, "Drill.drl"),
+}
+
+def parse_args(argv):
+    """Parses '--key value' / '--flag' style arguments into a dict."""
+    opts = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg.startswith("--"):
+            key = arg[2:]
+            if i + 1 < len(argv) and not argv[i + 1].startswith("--"):
+                opts[key] = argv[i + 1]
+                i += 2
+                continue
+            opts[key] = "1"
+        i += 1
+    return opts
+
+def replay_dir():
+    """Directory the outputs are replayed from: FAKE_PCB2GCODE_RECORDINGS, real recordings, else synthetic."""
+    if os.environ.get("FAKE_PCB2GCODE_RECORDINGS"):
+        return os.environ["FAKE_PCB2GCODE_RECORDINGS"]
+    if os.path.exists(os.path.join(RECORDED_DIR, "manifest.json")):
+        return RECORDED_DIR
+    return SYNTHETIC_DIR
+
+def reference_info():
+    """Manifest of the replayed outputs ({"source", "synthetic", "inputs"})."""
+    try:
+        with open(os.path.join(replay_dir(), "manifest.json"), "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        info = {"source": "unknown"}
+    info.setdefault("synthetic", True)
+    return info
+
+def recording_path(layer, directory=None):
+    return os.path.join(directory or replay_dir(), f"{layer}.gcode.gz")
+
+def replay(argv):
+    opts = parse_args(argv)
+    output_dir = opts.get("output-dir", ".")
+    os.makedirs(output_dir, exist_ok=True)
+    for in_opt, (layer, out_opt) in LAYERS.items():
+        if in_opt not in opts:
+            continue
+        src = recording_path(layer)
+        if not os.path.exists(src):
+            sys.stderr.write(f"fake pcb2gcode: no recording for layer '{layer}' ({src})\n")
+            return 1
+        dst = os.path.join(output_dir, opts.get(out_opt, f"{in_opt}.ngc"))
+        with gzip.open(src, "rb") as f_in, open(dst, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        sys.stderr.write(f"fake pcb2gcode: replayed {layer} -> {dst}\n")
+    return 0
+
+def store(layer, gcode_path, directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(gcode_path, "rb") as f_in, gzip.GzipFile(recording_path(layer, directory), "wb", mtime=0) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+def write_manifest(source, directory):
+    manifest = {"source": source, "synthetic": directory == SYNTHETIC_DIR,
+                "inputs": {k: os.path.basename(v) for k, v in SAMPLE_INPUTS.items()}}
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def record(argv):
+    """Runs a real pcb2gcode binary over the sample board and stores its outputs."""
+    opts = parse_args(argv)
+    binary = opts.get("pcb2gcode", "pcb2gcode")
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+    from settings import load_config
+    cfg = load_config(CONFIG_FILE)
+    ignore_keys = {"front", "back", "outline", "drill", "front-output", "back-output",
+                   "outline-output", "drill-output", "output-dir"}
+    cmd = [binary]
+    for k, v in cfg.values.items():
+        if k not in ignore_keys:
+            cmd.extend([f"--{k}", v])
+    cmd.extend(f"--{f}" for f in cfg.flags)
+    with tempfile.TemporaryDirectory() as tmp:
+        cmd.extend(["--back", SAMPLE_INPUTS["traces"], "--back-output", "traces.gcode",
+                    "--outline", SAMPLE_INPUTS["outline"], "--outline-output", "outline.gcode",
+                    "--drill", SAMPLE_INPUTS["drill"], "--drill-output", "drill.gcode",
+                    "--output-dir", tmp])
+        subprocess.run(cmd, check=True)
+        for layer in ("traces", "outline", "drill"):
+            store(layer, os.path.join(tmp, f"{layer}.gcode"), RECORDED_DIR)
+    write_manifest(f"recorded with {binary}", RECORDED_DIR)
+    return 0
+
+# --- Synthetic outputs (approximation of pcb2gcode's output format) ---
+
+HEADER = [
+    "( pcb2gcode 2.4.0 )",
+    "( Software-independent Gcode )",
+    "",
+    "G94 ( Millimeters per minute feed rate. )",
+    "G21 ( Units == Millimeters. )",
+    "",
+    "G90 ( Absolute coordinates. )",
+]
+
+FOOTER = [
+    "",
+    "M5 ( Spindle off. )",
+    "G04 P1.000000",
+    "M9 ( Coolant off. )",
+    "M2 ( Program end. )",
+    "",
+]
+
+def _ring_gcode(coords, z_work, f_vert, f_feed, z_safe, mirror):
+    sx = -1.0 if mirror else 1.0
+    lines = []
+    x0, y0 = coords[0]
+    lines.append(f"G00 X{sx * x0:.5f} Y{y0:.5f} ( rapid move to begin. )")
+    lines.append(f"G01 F{f_vert:.5f}")
+    lines.append(f"G01 Z{z_work:.5f}")
+    lines.append("G04 P0 ( dwell for no time -- G64 should not smooth over this point )")
+    lines.append(f"G01 F{f_feed:.5f}")
+    for x, y in coords[1:]:
+        lines.append(f"G01 X{sx * x:.5f} Y{y:.5f}")
+    lines.append("")
+    lines.append(f"G00 Z{z_safe:.5f} ( retract )")
+    lines.append("")
+    return lines
+
+def _rings(geom):
+    geoms = geom.geoms if hasattr(geom, "geoms") else [geom]
+    for g in geoms:
+        yield list(g.exterior.coords)
+        for interior in g.interiors:
+            yield list(interior.coords)
+
+def _copper_geometry(cam):
+    from gerber.primitives import Line, Circle, Rectangle, Obround, Region
+    from shapely.geometry import LineString, Point, Polygon, box
+    from shapely.ops import unary_union
+    shapes = []
+    for prim in cam.primitives:
+        if isinstance(prim, Line):
+            width = getattr(prim.aperture, "diameter", None) or 0.1
+            shapes.append(LineString([prim.start, prim.end]).buffer(width / 2.0, 8))
+        elif isinstance(prim, Circle):
+            shapes.append(Point(prim.position).buffer(prim.diameter / 2.0, 8))
+        elif isinstance(prim, (Rectangle, Obround)):
+            x, y = prim.position
+            shapes.append(box(x - prim.width / 2.0, y - prim.height / 2.0, x + prim.width / 2.0, y + prim.height / 2.0))
+        elif isinstance(prim, Region):
+            pts = []
+            for sub in prim.primitives:
+                if not pts: pts.append(sub.start)
+                pts.append(sub.end)
+            if len(pts) >= 3:
+                shapes.append(Polygon(pts).buffer(0))
+    return unary_union(shapes)
+
+def synthesize_traces(cfg, path):
+    import gerber
+    cam = gerber.read(SAMPLE_INPUTS["traces"])
+    cam.to_metric()
+    tool_r = cfg.get_length("mill-diameters", 0.2) / 2.0
+    iso = _copper_geometry(cam).buffer(tool_r, 4).simplify(0.005)
+    lines = HEADER + [
+        f"G00 S{cfg.get_rpm('mill-speed', 24000)} ( RPM spindle speed. )",
+        f"G01 F{cfg.get_feed('mill-feed', 500):.5f} ( Feedrate. )",
+        "M3 ( Spindle on clockwise. )",
+        "G04 P1.00000 ( Wait for spindle to get up to speed )",
+        f"G00 Z{cfg.get_length('zsafe', 2):.5f} ( retract )",
+        "",
+    ]
+    for coords in _rings(iso):
+        lines += _ring_gcode(coords, cfg.get_length("zwork", -0.1), cfg.get_feed("mill-vertfeed", 200),
+                             cfg.get_feed("mill-feed", 500), cfg.get_length("zsafe", 2), cfg.get_bool("mirror-absolute"))
+    _write(path, lines + FOOTER)
+
+def synthesize_outline(cfg, path):
+    import gerber
+    from gerber.primitives import Arc
+    from shapely.geometry import LineString
+    from shapely.ops import polygonize, unary_union
+    cam = gerber.read(SAMPLE_INPUTS["outline"])
+    cam.to_metric()
+    segments = []
+    for prim in cam.primitives:
+        if isinstance(prim, Arc):
+            a0 = math.atan2(prim.start[1] - prim.center[1], prim.start[0] - prim.center[0])
+            sweep = prim.sweep_angle if prim.direction == "counterclockwise" else -prim.sweep_angle
+            steps = max(4, int(abs(sweep) / (math.pi / 32)))
+            pts = [(prim.center[0] + prim.radius * math.cos(a0 + sweep * i / steps),
+                    prim.center[1] + prim.radius * math.sin(a0 + sweep * i / steps)) for i in range(steps + 1)]
+            pts[0], pts[-1] = prim.start, prim.end
+            segments.append(LineString(pts))
+        else:
+            segments.append(LineString([prim.start, prim.end]))
+    board = unary_union(list(polygonize(unary_union(segments))))
+    cut = board.buffer(cfg.get_length("cutter-diameter", 2) / 2.0, 8)
+    z_cut = cfg.get_length("zcut", -1.7)
+    infeed = cfg.get_length("cut-infeed", z_cut)
+    passes = max(1, int(math.ceil(abs(z_cut) / abs(infeed))))
+    lines = HEADER + [
+        f"G00 S{cfg.get_rpm('cut-speed', 24000)} ( RPM spindle speed. )",
+        f"G01 F{cfg.get_feed('cut-feed', 600):.5f} ( Feedrate. )",
+        "M3 ( Spindle on clockwise. )",
+        "G04 P1.00000 ( Wait for spindle to get up to speed )",
+        f"G00 Z{cfg.get_length('zsafe', 2):.5f} ( retract )",
+        "",
+    ]
+    for coords in _rings(cut):
+        for p in range(1, passes + 1):
+            lines += _ring_gcode(coords, z_cut * p / passes, cfg.get_feed("cut-feed", 600) / 2.0,
+                                 cfg.get_feed("cut-feed", 600), cfg.get_length("zsafe", 2), cfg.get_bool("mirror-absolute"))
+    _write(path, lines + FOOTER)
+
+def synthesize_drill(cfg, path):
+    import gerber
+    drl = gerber.read(SAMPLE_INPUTS["drill"])
+    drl.to_metric()
+    by_tool = {}
+    for hit in drl.hits:
+        by_tool.setdefault(hit.tool.number, (hit.tool.diameter, []))[1].append(hit.position)
+    sx = -1.0 if cfg.get_bool("mirror-absolute") else 1.0
+    z_safe = cfg.get_length("zsafe", 2)
+    lines = HEADER[:3] + [
+        f"( This file uses {len(by_tool)} drill bit sizes. )",
+        "( Bit sizes: " + " ".join(f"[{d:g}mm]" for d, _ in by_tool.values()) + " )",
+        "",
+    ] + HEADER[3:] + [
+        f"G00 S{cfg.get_rpm('drill-speed', 24000)} ( RPM spindle speed. )",
+        "",
+    ]
+    for number, (dia, hits) in sorted(by_tool.items()):
+        lines += [
+            f"G00 Z{cfg.get_length('zchange', 20):.5f} ( Retract )",
+            f"T{number}",
+            "M5 ( Spindle stop. )",
+            "G04 P1.00000",
+            f"(MSG, Change tool bit to drill size {dia:g}mm)",
+            "M6 ( Tool change. )",
+            "M0 ( Temporary machine stop. )",
+            "M3 ( Spindle on clockwise. )",
+            f"G0 Z{z_safe:.5f}",
+            "G04 P1.00000",
+            "",
+            f"G1 F{cfg.get_feed('drill-feed', 300):.5f}",
+        ]
+        for x, y in hits:
+            lines += [f"G0 X{sx * x:.5f} Y{y:.5f}", f"G1 Z{cfg.get_length('zdrill', -1.8):.5f}", f"G1 Z{z_safe:.5f}"]
+        lines.append("")
+    _write(path, lines + FOOTER)
+
+def _write(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+def synthesize(argv):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+    from settings import load_config
+    cfg = load_config(CONFIG_FILE)
+    with tempfile.TemporaryDirectory() as tmp:
+        for layer, func in (("traces", synthesize_traces), ("outline", synthesize_outline), ("drill", synthesize_drill)):
+            out = os.path.join(tmp, f"{layer}.gcode")
+            func(cfg, out)
+            store(layer, out, SYNTHETIC_DIR)
+    write_manifest("synthesized from the sample board (approximation of pcb2gcode 2.4 output, isolation mode)", SYNTHETIC_DIR)
+    return 0
+
+def main(argv):
+    if argv and argv[0] == "record":
+        return record(argv[1:])
+    if argv and argv[0] == "synthesize":
+        return synthesize(argv[1:])
+    return replay(argv)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,109 @@
+import re
+
+import numpy as np
+
+from emitter import MoveBuffer, render
+
+_WORD_RE = re.compile(r"([A-Z])(-?\d+(?:\.\d*)?)")
+
+def _expand(text):
+    """
+    Modal expansion like a controller reads the program: the full state (G mode,
+    X, Y, Z, F) after every line that changes it, axis words added up after G91.
+    Arcs without an axis word fail like GRBL's error 26.
+    """
+    state = {"G": None, "X": None, "Y": None, "Z": None, "F": None}
+    incremental = False
+    expanded = []
+    for line in text.splitlines():
+        words = _WORD_RE.findall(line)
+        if not words or line.startswith("("):
+            continue
+        axes = [w for w, _ in words if w in "XYZ"]
+        arc = False
+        for word, value in words:
+            if word == "G" and float(value) in (0, 1, 2, 3):
+                state["G"] = int(float(value))
+                arc = state["G"] in (2, 3)
+            elif word == "G" and value in ("90", "91"):
+                incremental = value == "91"
+            elif word in "XYZ" and incremental:
+                state[word] = round((state[word] or 0.0) + float(value), 4)
+            elif word in "XYZF":
+                state[word] = round(float(value), 4)
+        assert not (arc and not axes), f"arc without axis words: {line}"
+        current = tuple(state.values())
+        if not expanded or expanded[-1] != current:
+            expanded.append(current)
+    return expanded
+
+def _buffer():
+    buf = MoveBuffer()
+    buf.add_text("(test)")
+    buf.add_move(0, 0.0, 0.0, 2.0)
+    buf.add_move(1, z=-0.1, f=100.0)
+    buf.add_moves(1, [1.0, 1.0, 2.0], [0.0, 1.0, 1.0], -0.1)
+    # Full circle back to the current position and an arc that keeps Z
+    buf.add_move(x=2.0, y=1.0, z=-0.1, extra="G2 I0.5 J0")
+    buf.add_move(x=3.0, y=1.0, z=-0.1, extra="G3 I0.5 J0")
+    buf.add_move(1, 3.0, 2.0, -0.1)
+    buf.add_move(1, 3.0, 2.0, -0.1, f=150.0)
+    buf.add_move(0, z=2.0)
+    return buf
+
+def _full(buf):
+    # Reference: every present word written
+    lines = []
+    for text, mode, x, y, z, f, extra in zip(buf.text, buf.mode, buf.x, buf.y, buf.z, buf.f, buf.extra):
+        if text is not None:
+            lines.append(text)
+            continue
+        words = [] if np.isnan(mode) else ["G%d" % mode]
+        words += [extra] if extra else []
+        words += [f"{w}{v:.4f}" for w, v in zip("XYZ", (x, y, z)) if not np.isnan(v)]
+        words += [] if np.isnan(f) else ["F%g" % f]
+        lines.append(" ".join(words))
+    return "\n".join(lines)
+
+def test_suppressed_output_expands_to_the_same_moves():
+    buf = _buffer()
+    text, stats = render(buf, precision=4)
+    assert _expand(text) == _expand(_full(buf))
+    assert stats["suppressed_words"] > 0
+
+def test_arc_keeps_its_axis_words():
+    text, _ = render(_buffer(), precision=4)
+    arcs = [line for line in text.splitlines() if line.startswith(("G2", "G3"))]
+    assert arcs == ["G2 I0.5 J0 X2.0000 Y1.0000 Z-0.1000", "G3 I0.5 J0 X3.0000 Y1.0000 Z-0.1000"]
+
+def _incremental_buffer():
+    buf = MoveBuffer()
+    buf.add_move(0, 0.0, 0.0, 2.0)
+    buf.add_text("G91")
+    # Two equal steps: both are real moves
+    buf.add_move(1, 1.0, 0.0, f=100.0)
+    buf.add_move(1, 1.0, 0.0)
+    buf.add_move(1, 0.0, 1.0)
+    buf.add_text("G90")
+    # Absolute again: the last written values were deltas, so everything is written
+    buf.add_move(1, 2.0, 1.0, 2.0)
+    buf.add_move(1, 2.0, 1.0, 2.0)
+    buf.add_move(1, 3.0, 1.0, 2.0)
+    return buf
+
+def test_incremental_block_keeps_repeated_axis_words():
+    buf = _incremental_buffer()
+    text, _ = render(buf, precision=4)
+    assert _expand(text) == _expand(_full(buf))
+    lines = text.splitlines()
+    assert lines[1:6] == ["G91", "G1 X1.0000 Y0.0000 F100", "X1.0000 Y0.0000", "X0.0000 Y1.0000", "G90"]
+    # Repeated absolute target is dropped, changed X written alone
+    assert lines[6:] == ["G1 X2.0000 Y1.0000 Z2.0000", "X3.0000"]
+
+def test_unit_change_resets_modal_memory():
+    buf = MoveBuffer()
+    buf.add_move(0, 1.0, 1.0, 2.0)
+    buf.add_move(0, x=1.0, y=1.0, extra="G20")
+    buf.add_move(0, 1.0, 1.0, 2.0)
+    text, _ = render(buf, precision=4)
+    assert text.splitlines() == ["G0 X1.0000 Y1.0000 Z2.0000", "G0 G20 X1.0000 Y1.0000", "G0 X1.0000 Y1.0000 Z2.0000"]
@@ -0,0 +1,53 @@
+import pytest
+
+from estimate import estimate_gcode, format_duration, parse_moves
+
+# Acceleration so high that every move runs at its programmed speed
+INSTANT = {"rapid_xy": 600.0, "rapid_z": 600.0, "acceleration": 1e9, "default_feed": 300.0}
+
+PROGRAM = """(test program)
+G21
+G90
+G0 Z2
+G0 X10 Y0
+G1 Z-0.1 F60
+G1 X20 F600 ; along X
+G1 Y10
+G4 P1.5
+G0 Z2
+M2
+"""
+
+def test_parse_moves_fills_modal_state():
+    moves, dwell = parse_moves(PROGRAM)
+    assert moves["line"].tolist() == [3, 4, 5, 6, 7, 9]
+    assert moves["mode"].tolist() == [0, 0, 1, 1, 1, 0]
+    assert moves["x"].tolist() == [10, 10, 10, 20, 20, 20]
+    assert moves["y"].tolist() == [0, 0, 0, 0, 10, 10]
+    assert moves["z"].tolist() == [2, 2, -0.1, -0.1, -0.1, 2]
+    assert moves["f"].tolist() == [300, 300, 60, 600, 600, 600]
+    assert dwell == 1.5
+
+def test_totals_of_a_known_program():
+    est = estimate_gcode(PROGRAM, INSTANT)
+    assert est["moves"] == 6
+    assert est["plunges"] == 1
+    assert est["cut_length"] == pytest.approx(22.1)
+    assert est["rapid_length"] == pytest.approx(2.1)
+    # Plunge 2.1 mm at 1 mm/s, then 2 x 10 mm at 10 mm/s
+    assert est["cut_seconds"] == pytest.approx(4.1)
+    assert est["rapid_seconds"] == pytest.approx(0.2)
+    assert est["dwell_seconds"] == 1.5
+    assert est["seconds"] == pytest.approx(5.8)
+
+def test_acceleration_adds_time_at_corners():
+    slow = dict(INSTANT, acceleration=50.0)
+    assert estimate_gcode(PROGRAM, slow)["seconds"] > estimate_gcode(PROGRAM, INSTANT)["seconds"]
+
+def test_empty_program():
+    est = estimate_gcode("(nothing)\nM2\n", INSTANT)
+    assert est["moves"] == 0 and est["seconds"] == 0.0
+
+def test_format_duration():
+    assert format_duration(59.6) == "1:00"
+    assert format_duration(3725) == "1:02:05"
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pytest
+from scipy.interpolate import LinearNDInterpolator
+
+from heightmap import GridHeightmap, lattice_spacing, load_heightmap, _heightmap_cache
+
+def _write_probe(tmp_path, points, values):
+    probe_file = tmp_path / "probe_result.json"
+    probe_file.write_text(json.dumps({"points": [{"x": float(x), "y": float(y), "z": float(z)}
+                                                 for (x, y), z in zip(points, values)]}))
+    _heightmap_cache.clear()
+    return str(probe_file)
+
+def _queries(points, n=2000, seed=1):
+    # Query points across the bounding box plus a margin (outside the hull -> 0)
+    rng = np.random.default_rng(seed)
+    lo, hi = points.min(axis=0) - 2.0, points.max(axis=0) + 2.0
+    return rng.uniform(lo, hi, size=(n, 2))
+
+def _surface(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.05 * np.sin(x / 7.0) + 0.03 * np.cos(y / 5.0) + 0.001 * x
+
+def test_scattered_points_match_delaunay(tmp_path):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 60, size=(80, 2))
+    values = _surface(points)
+    probe_file = _write_probe(tmp_path, points, values)
+    expected = LinearNDInterpolator(points, values, fill_value=0.0)
+
+    compiled = load_heightmap(probe_file)
+    _heightmap_cache.clear()
+    reopened = load_heightmap(probe_file)
+    for heightmap in (compiled, reopened):
+        assert not isinstance(heightmap, GridHeightmap)
+        q = _queries(points)
+        np.testing.assert_allclose(heightmap.z_offsets(q[:, 0], q[:, 1]), expected(q[:, 0], q[:, 1]), atol=1e-12)
+        for x, y in q[:50]:
+            assert abs(heightmap.z_offset(x, y) - float(expected(x, y))) < 1e-12
+
+def test_regular_grid_uses_aligned_grid(tmp_path):
+    gx, gy = np.meshgrid(np.arange(0, 50.1, 10.0), np.arange(0, 30.1, 7.5))
+    points = np.column_stack([gx.ravel(), gy.ravel()])
+    # Plane: linear on every triangle, so grid and triangulation agree exactly
+    values = 0.002 * points[:, 0] - 0.001 * points[:, 1] + 0.1
+    probe_file = _write_probe(tmp_path, points, values)
+    heightmap = load_heightmap(probe_file)
+    assert isinstance(heightmap, GridHeightmap)
+
+    expected = LinearNDInterpolator(points, values, fill_value=0.0)
+    q = _queries(points)
+    np.testing.assert_allclose(heightmap.z_offsets(q[:, 0], q[:, 1]), expected(q[:, 0], q[:, 1]), atol=1e-9)
+    for (x, y), z in zip(points, values):
+        assert abs(heightmap.z_offset(x, y) - z) < 1e-9
+
+def test_lattice_detection():
+    gx, gy = np.meshgrid(np.arange(5) * 2.5, np.arange(4) * 3.0)
+    lattice = np.column_stack([gx.ravel(), gy.ravel()])
+    assert lattice_spacing(lattice) == pytest.approx((2.5, 3.0))
+    # Missing corner, uneven column and jittered point are no lattice
+    assert lattice_spacing(lattice[1:]) is None
+    uneven = lattice.copy()
+    uneven[uneven[:, 0] == 10.0, 0] = 11.0
+    assert lattice_spacing(uneven) is None
+    jittered = lattice.copy()
+    jittered[7] += 0.01
+    assert lattice_spacing(jittered) is None
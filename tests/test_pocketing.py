@@ -0,0 +1,39 @@
+from shapely.geometry import LineString, box
+
+from pocketing import merge_regions, zigzag_runs, contour_rings
+
+def _merged(rects):
+    polygons, _ = merge_regions([box(*r) for r in rects])
+    assert len(polygons) == 1
+    return polygons[0]
+
+def _assert_runs_inside(geom, runs):
+    # Every feed move of a run (incl. the links between scan lines) stays in the pocket
+    reach = geom.buffer(1e-5)
+    for run in runs:
+        for a, b in zip(run, run[1:]):
+            assert reach.covers(LineString([a, b])), (a, b)
+
+def test_u_shape_does_not_cut_across_the_notch():
+    # Two legs joined at the bottom: scan lines above the base split in two pieces
+    u = _merged([(0, 0, 10, 2), (0, 0, 2, 10), (8, 0, 10, 10)])
+    geom = u.buffer(-0.5)
+    runs = zigzag_runs(geom, 0.5)
+    _assert_runs_inside(geom, runs)
+    assert len(runs) > 1
+
+def test_ring_clears_around_the_hole_and_finishes_it():
+    ring = _merged([(0, 0, 10, 2), (0, 8, 10, 10), (0, 0, 2, 10), (8, 0, 10, 10)])
+    assert len(ring.interiors) == 1
+    geom = ring.buffer(-0.5)
+    runs = zigzag_runs(geom, 0.5)
+    _assert_runs_inside(geom, runs)
+    hole = geom.interiors[0]
+    assert not any(LineString([a, b]).crosses(hole) for run in runs for a, b in zip(run, run[1:]))
+    rings = contour_rings(geom)
+    assert len(rings) == 2
+    assert LineString(rings[1]).equals(LineString(hole.coords))
+
+def test_convex_pocket_stays_one_run():
+    geom = box(0, 0, 10, 5).buffer(-0.5)
+    assert len(zigzag_runs(geom, 0.5)) == 1
@@ -0,0 +1,53 @@
+from resume import ToolpathIndex
+
+PROGRAM = "\n".join([
+    "(traces)",
+    "G21",
+    "G90",
+    "S10000 M3",
+    "G0 Z2",
+    "G0 X0 Y0",
+    "G1 Z-0.1 F100",
+    "G1 X10 Y0 F400",
+    "G1 X10 Y10",
+    "G1 X0 Y10",
+    "G0 Z2",
+    "G0 X0 Y0",
+    "G1 Z-0.2 F100",
+    "G1 X10 Y0 F400",
+    "G0 Z2",
+    "M5",
+])
+
+def test_nearest_segment():
+    index = ToolpathIndex(PROGRAM)
+    i, dist = index.nearest(10.2, 5.0)
+    assert index.moves["line"][i] == 8 # G1 X10 Y10 (0-based)
+    assert abs(dist - 0.2) < 1e-9
+
+def test_nearest_prefers_the_first_pass_over_the_same_spot():
+    index = ToolpathIndex(PROGRAM)
+    i, dist = index.nearest(5.0, 0.0)
+    assert index.moves["line"][i] == 7 and dist < 1e-9
+
+def test_line_selection():
+    index = ToolpathIndex(PROGRAM)
+    # 1-based line numbers as in the editor; non-cut lines move to the next cut
+    assert index.moves["line"][index.at_line(9)] == 8
+    assert index.moves["line"][index.at_line(11)] == 12
+    assert index.at_line(100) is None
+
+def test_restart_program():
+    index = ToolpathIndex(PROGRAM)
+    gcode, info = index.restart(index.at_line(9))
+    lines = gcode.split("\n")
+    assert lines[1:4] == ["G94", "G21", "G90"]
+    assert lines[4] == "G0 Z2.0000"
+    assert "S10000 M3" in lines
+    # Back to the start of the interrupted segment, plunge with the plunge feed
+    start = lines.index("G0 X10.0000 Y0.0000")
+    assert lines[start + 1:start + 4] == ["G1 Z-0.1000 F100.00000", "F400.00000", "G1 X10 Y10"]
+    assert lines[start + 4:] == PROGRAM.split("\n")[9:]
+    assert info["line"] == 9 and info["skipped_lines"] == 8
+    assert (info["x"], info["y"], info["z"], info["z_safe"]) == (10.0, 0.0, -0.1, 2.0)
+    assert info["remaining_cut_length"] > 0
@@ -0,0 +1,45 @@
+from sequence import merge_program, plan_jobs, tool_diameter
+
+TOOLS = {"traces": "0.2mm", "outline": "2mm", "drill_T1": "1.0mm", "drill_T2": "0.8mm", "drill_T3": "1mm"}
+SECONDS = {"traces": 600.0, "outline": 300.0, "drill_T1": 60.0, "drill_T2": 40.0, "drill_T3": 30.0}
+
+def test_jobs_with_the_same_tool_run_back_to_back():
+    plan = plan_jobs(TOOLS, SECONDS, change_seconds=100.0)
+    assert plan["order"] == ["traces", "drill_T2", "drill_T1", "drill_T3", "outline"]
+    assert plan["tool_changes"] == 3
+    # Macro order: traces, outline, drill_T1, drill_T2, drill_T3
+    assert plan["default_order"] == ["traces", "outline", "drill_T1", "drill_T2", "drill_T3"]
+    assert plan["default_tool_changes"] == 4
+    assert plan["saved_seconds"] == 100.0
+    assert plan["total_seconds"] == sum(SECONDS.values()) + 300.0
+
+def test_outline_runs_last_and_unknown_tools_never_share():
+    # The outline shares the traces tool, but its group still has to wait until the end
+    tools = {"traces": "0.2mm", "outline": "0.2mm", "user_drawings": "?", "drill_T1": "?"}
+    seconds = dict.fromkeys(tools, 1.0)
+    plan = plan_jobs(tools, seconds, change_seconds=0.0)
+    assert plan["order"] == ["user_drawings", "drill_T1", "traces", "outline"]
+    assert plan["tool_changes"] == 2
+    assert [g["jobs"] for g in plan["groups"]] == [["user_drawings"], ["drill_T1"], ["traces", "outline"]]
+
+def test_given_order_is_evaluated():
+    order = ["drill_T1", "drill_T2", "drill_T3", "traces", "outline"]
+    plan = plan_jobs(TOOLS, SECONDS, change_seconds=100.0, order=order)
+    assert plan["order"] == order
+    assert plan["tool_changes"] == 4
+
+def test_tool_diameter():
+    assert tool_diameter("0.8mm") == 0.8
+    assert tool_diameter("0.1mm,0.2mm") == 0.1
+    assert tool_diameter("?") is None
+
+def test_merged_program_pauses_only_at_tool_changes():
+    plan = plan_jobs(TOOLS, SECONDS, change_seconds=100.0)
+    contents = {k: f"(MSG, Insert tool for {k})\nG0 X1 Y1\nM2" for k in TOOLS}
+    lines = merge_program(plan, contents, TOOLS).splitlines()
+    assert sum(line == "M0" for line in lines) == plan["tool_changes"]
+    # Only the last program end is kept
+    assert [line for line in lines if line == "M2"] == ["M2"] and lines[-1] == "M2"
+    # drill_T3 keeps the tool of drill_T1: its prompt becomes a plain comment
+    assert "( Insert tool for drill_T3)" in lines
+    assert "(MSG, Insert tool for drill_T1)" in lines
@@ -0,0 +1,77 @@
+import os
+
+from store import ResultStore, read_json
+
+def test_put_is_readable_before_it_is_written(tmp_path):
+    store = ResultStore(1 << 20)
+    path = str(tmp_path / "state.json")
+    # Hold the writer back: the value has to come from memory
+    with store._io_lock:
+        store.put_json(path, {"status": "running"})
+        assert store.load(path, read_json) == {"status": "running"}
+        assert not os.path.exists(path)
+    assert store.flush()
+    assert read_json(path) == {"status": "running"}
+
+def test_latest_write_wins(tmp_path):
+    store = ResultStore(1 << 20)
+    path = str(tmp_path / "state.json")
+    for step in range(20):
+        store.put_json(path, {"step": step})
+    assert store.flush()
+    assert read_json(path) == {"step": 19}
+    assert store.load(path, read_json) == {"step": 19}
+    assert not os.path.exists(path + ".tmp")
+
+def test_stored_value_is_a_copy(tmp_path):
+    store = ResultStore(1 << 20)
+    path = str(tmp_path / "state.json")
+    value = {"files": ["a"]}
+    store.put_json(path, value)
+    value["files"].append("b")
+    assert store.load(path, read_json) == {"files": ["a"]}
+    assert store.flush()
+
+def test_external_change_is_reloaded(tmp_path):
+    store = ResultStore(1 << 20)
+    path = tmp_path / "traces.gcode"
+    path.write_text("G0 X1\n")
+    assert store.load(str(path)) == "G0 X1\n"
+    assert store.load(str(path)) == "G0 X1\n"
+    assert store.hits == 1
+    path.write_text("G0 X1 Y2\n")
+    assert store.load(str(path)) == "G0 X1 Y2\n"
+    path.unlink()
+    assert store.load(str(path)) is None
+
+def test_eviction_keeps_pending_writes(tmp_path):
+    store = ResultStore(64)
+    pending = str(tmp_path / "pending.json")
+    with store._io_lock:
+        store.put_json(pending, {"data": "x" * 40})
+        for name in ("a", "b", "c"):
+            path = tmp_path / f"{name}.txt"
+            path.write_text("y" * 40)
+            store.load(str(path))
+        assert pending in store._entries
+        assert str(tmp_path / "a.txt") not in store._entries
+        assert store.stats()["pending_writes"] == 1
+    assert store.flush()
+    assert store.stats()["pending_writes"] == 0
+
+def test_discard_drops_a_pending_write_and_delete_removes_the_file(tmp_path):
+    store = ResultStore(1 << 20)
+    dropped = str(tmp_path / "dropped.json")
+    with store._io_lock:
+        store.put_json(dropped, {"v": 1})
+        store.discard(dropped)
+    assert store.flush()
+    assert not os.path.exists(dropped)
+
+    kept = str(tmp_path / "kept.json")
+    store.put_json(kept, {"v": 2})
+    assert store.flush()
+    store.delete(kept)
+    assert not os.path.exists(kept)
+    assert store.load(kept, read_json) is None
+    assert store.stats()["entries"] == 0
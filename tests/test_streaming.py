@@ -0,0 +1,42 @@
+import math
+
+from streaming import line_bytes, simulate_stream
+
+PARAMS = {"baud": 115200.0, "planner_blocks": 15, "junction_deviation": 0.01, "line_seconds": 0.001,
+          "acceleration": 500.0, "rapid_xy": 3000.0, "rapid_z": 600.0, "default_feed": 300.0}
+
+def _arc(segments, radius=5.0):
+    """Circle as many short G1 segments, the typical pocketing/isolation output."""
+    lines = ["G21", "G90", "G0 X0 Y0 Z1", f"G0 X{radius:.4f} Y0", "G1 Z-0.1 F100", "F1000"]
+    for i in range(1, segments + 1):
+        a = 2 * math.pi * i / segments
+        lines.append(f"G1 X{radius * math.cos(a):.4f} Y{radius * math.sin(a):.4f}")
+    lines.append("G0 Z1")
+    return "\n".join(lines)
+
+def test_line_bytes_strip_comments():
+    assert line_bytes("G0 X1 (move)\n\n; note\nM2").tolist() == [6, 0, 0, 3]
+
+def test_long_cut_runs_at_commanded_feed():
+    report = simulate_stream("G21\nG90\nG0 X0 Y0 Z1\nG1 Z-0.1 F100\nG1 X200 F600\n", PARAMS)
+    # The first move only sets the start position
+    assert report["moves"] == 2
+    assert report["commanded_feed"] > 0
+    assert report["feed_ratio"] > 0.95
+    assert report["stalls"] == 0 and report["starvation_seconds"] == 0.0
+
+def test_tiny_segments_starve_on_a_slow_link():
+    program = _arc(2000)
+    fast = simulate_stream(program, PARAMS)
+    slow = simulate_stream(program, dict(PARAMS, baud=9600.0))
+    assert fast["moves"] == slow["moves"] == 2003
+    assert slow["starvation_seconds"] > 0
+    assert slow["stall_seconds"] > 0 and slow["stalls"] > 0
+    assert slow["seconds"] > fast["seconds"]
+    assert slow["achieved_feed"] < fast["achieved_feed"]
+    assert slow["feed_ratio"] < fast["feed_ratio"]
+
+def test_empty_program():
+    report = simulate_stream("(nothing)\nM2\n", PARAMS)
+    assert report["moves"] == 0 and report["lines"] == 1
+    assert report["seconds"] == 0.0 and report["feed_ratio"] == 1.0
@@ -0,0 +1,74 @@
+import time
+
+from watcher import FolderWatcher
+
+class Recorder:
+    """on_change stand-in that keeps the done callbacks instead of running a job."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, paths, hashes, changed, done):
+        self.calls.append((changed, done))
+        return True
+
+def _export(tmp_path, content="G04 traces*"):
+    (tmp_path / "board-B_Cu.gbr").write_text(content)
+
+def _settle(watcher, t0):
+    # First poll sees the files, the next one after the debounce triggers
+    watcher.poll(t0)
+    return watcher.poll(t0 + watcher.debounce)
+
+def test_hashes_are_kept_only_after_success(tmp_path):
+    export = tmp_path / "export"
+    export.mkdir()
+    _export(export)
+    state = tmp_path / "watch_state.json"
+    on_change = Recorder()
+    watcher = FolderWatcher(str(export), on_change, debounce=1.0, state_file=str(state))
+
+    assert _settle(watcher, time.monotonic()) == ["traces"]
+    # Queued but not finished: nothing is recorded yet
+    assert watcher.hashes == {}
+    assert not state.exists()
+
+    on_change.calls[0][1](True)
+    assert set(watcher.hashes) == {"traces"}
+    assert state.exists()
+    # A restarted watcher does not trigger the same export again
+    again = FolderWatcher(str(export), on_change, debounce=1.0, state_file=str(state))
+    assert _settle(again, time.monotonic()) is None
+
+def test_failed_run_is_retried_without_a_change(tmp_path):
+    _export(tmp_path)
+    on_change = Recorder()
+    watcher = FolderWatcher(str(tmp_path), on_change, debounce=1.0, retry_max=4.0)
+
+    t0 = time.monotonic()
+    assert _settle(watcher, t0) == ["traces"]
+    on_change.calls[0][1](False)
+    assert watcher.hashes == {} and watcher.failures == 1
+
+    # Retry after debounce * 2 (first failure), not before
+    now = time.monotonic()
+    assert watcher.poll(now + 1.0) is None
+    assert watcher.poll(now + 2.5) == ["traces"]
+    on_change.calls[1][1](True)
+    assert watcher.failures == 0
+    assert watcher.poll(time.monotonic() + 100.0) is None
+
+def test_exception_in_on_change_schedules_a_retry(tmp_path):
+    _export(tmp_path)
+
+    def broken(paths, hashes, changed, done):
+        raise OSError("disk full")
+
+    watcher = FolderWatcher(str(tmp_path), broken, debounce=1.0)
+    t0 = time.monotonic()
+    watcher.poll(t0)
+    try:
+        watcher.poll(t0 + 1.0)
+    except OSError:
+        pass
+    assert watcher.failures == 1
+    assert watcher.hashes == {}
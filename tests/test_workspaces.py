@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+
+from workspaces import Workspace, UPLOAD_PRUNE_MIN_AGE, file_sha256, store_file, store_upload
+
+class FakeUpload:
+    """Minimal UploadFile: filename and an async chunked read."""
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._data.read(size)
+
+def _store(upload, directory):
+    return asyncio.run(store_upload(upload, directory))
+
+def test_upload_is_stored_under_its_hash(tmp_path):
+    data = b"G04 board*\n" * 1000
+    path, digest = _store(FakeUpload("board-B_Cu.GBR", data), str(tmp_path))
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert os.path.basename(path) == digest + ".gbr"
+    assert open(path, "rb").read() == data
+    # No temporary files left behind
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+def test_same_content_is_stored_once(tmp_path):
+    data = b"X0Y0D02*\n"
+    first, _ = _store(FakeUpload("a.gbr", data), str(tmp_path))
+    second, _ = _store(FakeUpload("renamed.gbr", data), str(tmp_path))
+    other, _ = _store(FakeUpload("a.gbr", data + b"M02*\n"), str(tmp_path))
+    assert first == second
+    assert other != first
+    assert len(os.listdir(tmp_path)) == 2
+
+def test_store_file_matches_store_upload(tmp_path):
+    source = tmp_path / "Drill.drl"
+    source.write_bytes(b"M48\nT1C0.8\n%\nT1\nX1Y1\nM30\n")
+    uploads = tmp_path / "uploads"
+    path, digest = store_file(str(source), str(uploads))
+    assert digest == file_sha256(str(source))
+    assert _store(FakeUpload("other.drl", source.read_bytes()), str(uploads)) == (path, digest)
+
+def test_prune_keeps_referenced_and_recent_uploads(tmp_path):
+    workspace = Workspace(str(tmp_path))
+    workspace.ensure_dirs()
+    keep, _ = store_file(_write(tmp_path / "keep.gbr", b"keep"), workspace.uploads_dir)
+    old, _ = store_file(_write(tmp_path / "old.gbr", b"old"), workspace.uploads_dir)
+    young, _ = store_file(_write(tmp_path / "young.gbr", b"young"), workspace.uploads_dir)
+    past = time.time() - UPLOAD_PRUNE_MIN_AGE - 10
+    for path in (keep, old):
+        os.utime(path, (past, past))
+
+    workspace.prune_uploads([keep])
+    assert os.path.exists(keep)
+    assert not os.path.exists(old)
+    assert os.path.exists(young)
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)